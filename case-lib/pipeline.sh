@@ -19,12 +19,10 @@ func_pipeline_export()
     is_sof_used || {
         filter_str="$2"
         dlogi "No SOF sound card found, exporting pipeline parameters from proc file system"
-        tmp_pipeline_params=$(mktemp /tmp/pipeline-params.XXXXXXXX)
-        sof-dump-status.py -e "$filter_str" > "$tmp_pipeline_params" ||
+        local pipeline_params
+        pipeline_params=$(sof-dump-status.py -e "$filter_str") ||
             die "Failed to export pipeline parameters from proc file system"
-        # shellcheck disable=SC1090
-        source "$tmp_pipeline_params" || return 1
-        rm "$tmp_pipeline_params"
+        eval "$pipeline_params" || return 1
         return 0
     }
 
@@ -50,15 +48,13 @@ func_pipeline_export()
     [[ "$ignore" ]] && opt="$opt -b '$ignore'"
     [[ "$SOFCARD" ]] && opt="$opt -s $SOFCARD"
 
-    local -a pipeline_lst
-    local cmd="sof-tplgreader.py $tplg_path $opt -e" line=""
+    local cmd="sof-tplgreader.py $tplg_path $opt -e" pipeline_params=""
     dlogi "Run command to get pipeline parameters"
     dlogc "$cmd"
-    readarray -t pipeline_lst < <(eval "$cmd")
-    for line in "${pipeline_lst[@]}"
-    do
-        eval "$line"
-    done
+    # the generated code declares all pipelines, evaluate it in one go
+    pipeline_params=$(eval "$cmd") ||
+        die "Failed to parse $tplg_path, please check topology parsing command"
+    eval "$pipeline_params"
     [[ ! "$PIPELINE_COUNT" ]] && die "Failed to parse $tplg_path, please check topology parsing command"
     [[ $PIPELINE_COUNT -eq 0 ]] && dlogw "No pipeline found with option: $opt, unable to run $SCRIPT_NAME" && exit 2
     return 0
@@ -51,7 +51,7 @@ printf "Checking for some OS packages:\t\t"
 func_check_pkg expect
 func_check_pkg aplay
 func_check_pkg python3
-func_check_python_pkg graphviz
+func_check_exec_binary dot
 func_check_python_pkg numpy
 func_check_python_pkg scipy
 func_check_file "$DYNDBG"
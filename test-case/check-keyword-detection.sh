@@ -119,6 +119,8 @@ _update_blob(){
 
 for i in $(seq 1 "$loop_cnt")
 do
+    # recorded waves of all formats, analyzed together at the end of the iteration
+    recorded_files=()
     for fmt in $fmts
     do
         if [ "$fmt" == "S24_LE" ]; then
@@ -141,17 +143,29 @@ do
         # run keyword detection
         dlogc "arecord -D$dev -M -N -r $rate -c $channel -f $fmt --buffer-size=$buffer_size -d $duration $recorded_file"
         arecord -D"$dev" -M -N -r "$rate" -c "$channel" -f "$fmt" --buffer-size="$buffer_size" -d "$duration" "$recorded_file" -vvv
-
-        # analyze the recorded wav file
-        wavetool.py -a "wov" -R "$recorded_file" || {
-            # upload the failed wav file
-            find /tmp -maxdepth 1 -type f -name "wov_*_record.wav" -size +0 -exec cp {} "$LOG_ROOT/" \;
-            exit 1
-        }
+        recorded_files+=("$recorded_file")
 
         timeout 5 tail --pid=$aplayPID -f /dev/null || die "Failed to stop playback"
         _restore_default_wov_config_bolb || die "Failed to restore kwd config blob"
     done
+
+    # analyze the recorded wav files
+    [ ${#recorded_files[@]} -gt 0 ] || continue
+    report="$LOG_ROOT/wov_wave_report.txt"
+    wavetool.py -a "wov" --batch "${recorded_files[@]}" --report "$LOG_ROOT/wov_wave_report.json" > "$report" || {
+        cat "$report"
+        # upload the recorded wav files, wavetool.py may have failed before reporting them
+        for recorded_file in "${recorded_files[@]}"; do
+            if [ -s "$recorded_file" ]; then
+                cp "$recorded_file" "$LOG_ROOT/"
+            fi
+        done
+        rm -f "${recorded_files[@]}"
+        exit 1
+    }
+    cat "$report"
+    # clean up recorded wave files
+    rm -f "${recorded_files[@]}"
 done
 
 sof-kernel-log-check.sh "$KERNEL_CHECKPOINT"
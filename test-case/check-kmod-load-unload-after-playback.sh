@@ -84,19 +84,15 @@ do
     [[ $ret -ne 0 ]] && dloge "kmod reload failed" && exit $ret
 
     dlogi "wait dsp power status to become suspended"
-    for i in $(seq 1 15)
-    do
-        # Here we pass a hardcoded 0 to python script, and need to ensure
-        # DSP is the first audio pci device in 'lspci', this is true unless
-        # we have a third-party pci sound card installed.
-        [[ $(sof-dump-status.py --dsp_status 0) == "unsupported" ]] &&
-            dlogi "platform doesn't support runtime pm, skip waiting" && break
-        [[ $(sof-dump-status.py --dsp_status 0) == "suspended" ]] && break
-        sleep 1
-        if [ $i -eq 15 ]; then
+    # Here we pass a hardcoded 0 to python script, and need to ensure
+    # DSP is the first audio pci device in 'lspci', this is true unless
+    # we have a third-party pci sound card installed.
+    if [[ $(sof-dump-status.py --dsp_status 0) == "unsupported" ]]; then
+        dlogi "platform doesn't support runtime pm, skip waiting"
+    else
+        sof-dump-status.py --dsp_status 0 --wait suspended --timeout 15 ||
             die "dsp is not suspended after 15s, end test"
-        fi
-    done
+    fi
 
     export LOG_ROOT=$log_root/round-$counter
     $(dirname ${BASH_SOURCE[0]})/check-playback.sh -l 1 -t $tplg -d $pb_duration
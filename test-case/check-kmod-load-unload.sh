@@ -54,21 +54,15 @@ do
     # device list, within this 10s, it shows "no soundcard found". Here
     # we wait dsp status to workaround this.
     dlogi "wait dsp power status to become suspended"
-    for i in $(seq 1 15)
-    do
-        # Here we pass a hardcoded 0 to python script, and need to ensure
-        # DSP is the first audio pci device in 'lspci', this is true unless
-        # we have a third-party pci sound card installed.
-        if [[ $(sof-dump-status.py --dsp_status 0) == "unsupported" ]]; then
-            dlogi "platform doesn't support runtime pm, skip waiting"
-            break
-        fi
-        [[ $(sof-dump-status.py --dsp_status 0) == "suspended" ]] && break
-        sleep 1
-        if [ "$i" -eq 15 ]; then
+    # Here we pass a hardcoded 0 to python script, and need to ensure
+    # DSP is the first audio pci device in 'lspci', this is true unless
+    # we have a third-party pci sound card installed.
+    if [[ $(sof-dump-status.py --dsp_status 0) == "unsupported" ]]; then
+        dlogi "platform doesn't support runtime pm, skip waiting"
+    else
+        sof-dump-status.py --dsp_status 0 --wait suspended --timeout 15 ||
             die "dsp is not suspended after 15s, end test"
-        fi
-    done
+    fi
 
     dlogi "run kmod/sof-kmod-remove.sh"
     sudo sof_remove.sh || die "remove modules error"
@@ -109,13 +103,8 @@ do
     # After the last module insertion, it still takes about 10s for 'aplay -l' to show device
     # list. We need to wait before aplay can function. Here, wait dsp status to suspend to
     # avoid influence on next test case.
-    for i in $(seq 1 15)
-    do
-        # ignore platforms not support runtime pm
-        [[ $(sof-dump-status.py --dsp_status 0) == "unsupported" ]] && break
-        [[ $(sof-dump-status.py --dsp_status 0) == "suspended" ]] && break
-        sleep 1
-    done
+    # ignore platforms not support runtime pm
+    sof-dump-status.py --dsp_status 0 --wait suspended,unsupported --timeout 15 || true
 
 done
 
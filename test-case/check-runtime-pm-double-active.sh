@@ -36,23 +36,14 @@ OPT_PARM_lst['s']=0             OPT_VALUE_lst['s']=1
 # param: $1 -> max delay time for dsp pm status switch, unit is second
 func_check_dsp_status()
 {
-    # more frequent checking of the runtime pm status is required. Every loop is 100ms
-    local iloop=$(expr 10 '*' "$1")
-    dlogi "wait dsp power status to become suspended, starting max [100ms x $iloop times] checking"
-    for i in $(seq 1 $iloop)
-    do
-        # Here we pass a hardcoded 0 to python script, and need to ensure
-        # DSP is the first audio pci device in 'lspci', this is true unless
-        # we have a third-party pci sound card installed.
-        [[ $(sof-dump-status.py --dsp_status 0) == "suspended" ]] && break
-        sleep 0.1
-    done
-
-    if [ $i -eq $iloop ]; then
+    dlogi "wait dsp power status to become suspended, max $1s"
+    # Here we pass a hardcoded 0 to python script, and need to ensure
+    # DSP is the first audio pci device in 'lspci', this is true unless
+    # we have a third-party pci sound card installed.
+    # The status changes are logged with the time each one took.
+    sof-dump-status.py --dsp_status 0 --wait suspended --timeout "$1" ||
         die "dsp is not suspended after $1s, end test"
-    else
-        dlogi "dsp suspended in $i try, ${i}00 msec"
-    fi
+    dlogi "dsp suspended"
 }
 
 func_opt_parse_option "$@"
@@ -35,18 +35,13 @@ OPT_PARM_lst['s']=0             OPT_VALUE_lst['s']=1
 func_check_dsp_status()
 {
     dlogi "wait dsp power status to become suspended"
-    for i in $(seq 1 $1)
-    do
-        # Here we pass a hardcoded 0 to python script, and need to ensure
-        # DSP is the first audio pci device in 'lspci', this is true unless
-        # we have a third-party pci sound card installed.
-        [[ $(sof-dump-status.py --dsp_status 0) == "suspended" ]] && break
-        sleep 1
-        if [ $i -eq $1 ]; then
-            die "dsp is not suspended after $1s, end test"
-        fi
-    done
-    dlogi "dsp suspended in ${i}s"
+    # Here we pass a hardcoded 0 to python script, and need to ensure
+    # DSP is the first audio pci device in 'lspci', this is true unless
+    # we have a third-party pci sound card installed.
+    # The status changes are logged with the time each one took.
+    sof-dump-status.py --dsp_status 0 --wait suspended --timeout "$1" ||
+        die "dsp is not suspended after $1s, end test"
+    dlogi "dsp suspended"
 }
 
 func_opt_parse_option "$@"
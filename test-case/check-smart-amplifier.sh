@@ -86,6 +86,8 @@ fi
 
 for i in $(seq 1 $loop_cnt)
 do
+    # recorded waves of all formats, analyzed together at the end of the iteration
+    recorded_files=()
     for fmt in $fmts
     do
         dlogi "Testing: iteration $i of $loop_cnt with $fmt format"
@@ -102,16 +104,29 @@ do
         aplay -D"$pb_dev" -r "$pb_rate" -c "$pb_chan" -f "$fmt" -d "$duration" -v -q "$file" &
         dlogc "arecord -D$cp_dev -r $cp_rate -c $cp_chan -f $fmt -d $duration -v -q $recorded_file"
         arecord -D"$cp_dev" -r "$cp_rate" -c "$cp_chan" -f "$fmt" -d "$duration" -v -q "$recorded_file"
-        dlogi "Comparing recorded wave and reference wave"
-        wavetool.py -a"smart_amp" -R"$recorded_file" || {
-            # upload the failed wav file, and die
-            find /tmp -maxdepth 1 -type f -name "$(basename "$recorded_file")" -size +0 -exec cp {} "$LOG_ROOT/" \;
-            die "wavetool.py exit with failure"
-        }
-        # clean up generated wave files
-        rm -rf "$file" "$recorded_file"
+        recorded_files+=("$recorded_file")
+        # clean up generated wave file
+        rm -rf "$file"
         sleep 2
     done
+
+    [ ${#recorded_files[@]} -gt 0 ] || continue
+    dlogi "Comparing recorded waves and reference waves"
+    report="$LOG_ROOT/smart_amp_wave_report.txt"
+    wavetool.py -a"smart_amp" --batch "${recorded_files[@]}" --report "$LOG_ROOT/smart_amp_wave_report.json" > "$report" || {
+        cat "$report"
+        # upload the recorded wav files, wavetool.py may have failed before reporting them, and die
+        for recorded_file in "${recorded_files[@]}"; do
+            if [ -s "$recorded_file" ]; then
+                cp "$recorded_file" "$LOG_ROOT/"
+            fi
+        done
+        rm -f "${recorded_files[@]}"
+        die "wavetool.py exit with failure"
+    }
+    cat "$report"
+    # clean up recorded wave files
+    rm -f "${recorded_files[@]}"
 done
 
 sof-kernel-log-check.sh "$KERNEL_CHECKPOINT"
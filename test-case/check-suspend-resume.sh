@@ -76,18 +76,29 @@ do
     dlogi "===== Round($i/$loop_count) ====="
     # cleanup dmesg befor run case
     sudo dmesg --clear
-    sleep_count=$(cat /sys/power/wakeup_count)
+    # snapshot cards, PCMs and power status, to compare with them after resume
+    status_file="$LOG_ROOT/status-before-suspend.json"
+    sof-dump-status.py --save "$status_file" || die "Failed to save the system status"
     dlogc "Run the command: rtcwake -m mem -s ${sleep_lst[$i]}"
     sudo rtcwake -m mem -s ${sleep_lst[$i]}
     [[ $? -ne 0 ]] && die "rtcwake return value error"
     dlogc "sleep for ${wait_lst[$i]}"
     sleep ${wait_lst[$i]}
     dlogi "Check for the kernel log status"
-    wake_count=$(cat /sys/power/wakeup_count)
+    status_diff=$(sof-dump-status.py --diff "$status_file") || die "Failed to compare the system status"
     # sof-kernel-log-check script parameter number is 0/Non-Number will force check from dmesg
     sof-kernel-log-check.sh 0 || die "Catch error in dmesg"
-    # check wakeup count correct
-    [[ $wake_count -le $sleep_count ]] && die "suspend/resume didn't happen, because /sys/power/wakeup_count does not increase"
+    dlogi "System status changes after resume:"
+    printf '%s\n' "$status_diff"
+    # check wakeup count correct, the diff line is "power/wakeup_count: old -> new"
+    wakeup_change=$(sed -n 's|^power/wakeup_count: ||p' <<< "$status_diff")
+    sleep_count=${wakeup_change% -> *}
+    wake_count=${wakeup_change#* -> }
+    [[ $sleep_count =~ ^[0-9]+$ && $wake_count =~ ^[0-9]+$ ]] && [[ $wake_count -gt $sleep_count ]] ||
+        die "suspend/resume didn't happen, because /sys/power/wakeup_count does not increase"
+    # sound cards and PCMs must come back as they were
+    ! grep -q -E '^(card|pcm)/' <<< "$status_diff" ||
+        die "sound cards or PCMs changed after suspend/resume"
 done
 
 # check full log
@@ -269,11 +269,16 @@ do_preparations () {
 
     # Get max. channels count to use from capture device
     # remove xargs after the trailing blank from tplgreader is fixed
-    CAP_CHANNELS=$($TPLGREADER "$tplg" -f "id:$PCM_ID & type:capture" -d ch_max -v)
-    CAP_HW=$($TPLGREADER "$tplg" -f "id:$PCM_ID & type:capture" -d dev -v)
-    PLAY_HW=$($TPLGREADER "$tplg" -f "id:$PCM_ID & type:playback" -d dev -v)
-    CAP_PGA=$($TPLGREADER "$tplg" -f "id:$PCM_ID & type:capture" -d pga -v)
-    PLAY_PGA=$($TPLGREADER "$tplg" -f "id:$PCM_ID & type:playback" -d pga -v)
+    # batch mode: parse the topology once and set all variables below
+    local tplg_vars
+    tplg_vars=$($TPLGREADER "$tplg" \
+        -q "CAP_CHANNELS:-f 'id:$PCM_ID & type:capture' -d ch_max -v" \
+        -q "CAP_HW:-f 'id:$PCM_ID & type:capture' -d dev -v" \
+        -q "PLAY_HW:-f 'id:$PCM_ID & type:playback' -d dev -v" \
+        -q "CAP_PGA:-f 'id:$PCM_ID & type:capture' -d pga -v" \
+        -q "PLAY_PGA:-f 'id:$PCM_ID & type:playback' -d pga -v") ||
+        die "Failed to read pipeline parameters from $tplg"
+    eval "$tplg_vars"
     export CAP_CHANNELS
     export CAP_HW
     export PLAY_HW
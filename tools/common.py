@@ -1,3 +1,6 @@
+import json
+import shlex
+
 def format_pipeline(pipeline, noKey=False):
     output = ""
     for key, value in pipeline.items():
@@ -10,21 +13,50 @@ def format_pipeline(pipeline, noKey=False):
 # This function will generate shell code according to pipeline parameters,
 # then pipeline parameters can be accessed from test case by sourcing or
 # executing the generated code.
-def export_pipeline(pipeline_lst):
+# keyword is the prefix of the generated shell variables
+# Each pipeline is one declare statement on a line of its own, so the whole
+# code can be evaluated at once, or line by line. Values are quoted with
+# shell_quote, so quotes, $ and backquotes in them are never expanded.
+def export_pipeline(pipeline_lst, keyword='PIPELINE'):
     length = len(pipeline_lst)
-    keyword = 'PIPELINE'
     # clear up the older define
-    print('unset %s_COUNT' % (keyword))
-    print('unset %s_LST' % (keyword))
-    print('declare -g %s_COUNT' % (keyword))
-    print('declare -ag %s_LST' % (keyword))
-    print('%s_COUNT=%d' % (keyword, length))
+    print('unset %s_COUNT %s_LST' % (keyword, keyword) +
+        ''.join(' %s_%d' % (keyword, idx) for idx in range(0, length)))
+    print('declare -g %s_COUNT=%d; declare -ag %s_LST=(%s)' % (keyword, length, keyword,
+        ' '.join(shell_quote(format_pipeline(pipeline)) for pipeline in pipeline_lst)))
     for idx in range(0, length):
-        # store pipeline
-        print('%s_LST[%d]="%s"' % (keyword, idx, format_pipeline(pipeline_lst[idx])))
         # store pipeline to each list
-        print('unset %s_%d' % (keyword, idx))
-        print('declare -Ag %s_%d' % (keyword, idx))
-        for key, value in pipeline_lst[idx].items():
-            print('%s_%d["%s"]="%s"' % (keyword, idx, key, value))
+        print('declare -Ag %s_%d=(%s)' % (keyword, idx, ' '.join('[%s]=%s' % (shell_quote(key), shell_quote(value))
+            for key, value in pipeline_lst[idx].items())))
     return 0
+
+# print record as one line of JSON, for machine readable NDJSON output. kind is
+# added as "record" to tell the records of a mixed stream apart, fields are added
+# too, eg the query name. Each line is flushed, so the stream can be consumed
+# while it is produced.
+def print_json(kind, record, **fields):
+    obj = {'record': kind}
+    obj.update(fields)
+    obj.update(record)
+    print(json.dumps(obj), flush=True)
+
+# quote value as a single shell word which stays on one line, so that each
+# line of generated shell code can be evaluated on its own
+def shell_quote(value):
+    value = str(value)
+    if value.isprintable():
+        return shlex.quote(value)
+    # bash ANSI-C quoting for newlines and other control characters
+    escaped = []
+    for char in value:
+        if char in '\\\'':
+            escaped.append('\\' + char)
+        elif char == '\n':
+            escaped.append('\\n')
+        elif char == '\t':
+            escaped.append('\\t')
+        elif not char.isprintable():
+            escaped.append('\\x%02x' % ord(char) if ord(char) < 0x100 else char)
+        else:
+            escaped.append(char)
+    return "$'" + ''.join(escaped) + "'"
@@ -1,11 +1,115 @@
 #!/usr/bin/python3
 
-import subprocess
 import os
-from common import format_pipeline, export_pipeline
+import re
+import json
+import fnmatch
+from collections import namedtuple
+from common import format_pipeline, export_pipeline, print_json
+
+# power state of a DAPM widget, eg On, and the numbers of its connected input and
+# output paths, inputs and outputs are None for files with only a state, eg bias_level
+DAPMWidget = namedtuple('DAPMWidget', ['state', 'inputs', 'outputs'])
+
+# DAPM widgets of all sound cards at one time, widgets maps (path, name) to a
+# DAPMWidget, path is the directory of the dapm folder under debugfs asoc, eg
+# 'sof-hda-dsp' for the card, or 'sof-hda-dsp/hdac-codec' for a component of it
+class clsDAPMSnapshot():
+    def __init__(self, widgets=None):
+        self.widgets = widgets if widgets is not None else {}
+
+    # return {(path, name): (old widget, new widget)} of the widgets which changed since
+    # the old snapshot, the old or new widget is None if it is missing from the snapshot
+    def diff(self, old):
+        changes = {}
+        for key, widget in old.widgets.items():
+            if self.widgets.get(key) != widget:
+                changes[key] = (widget, self.widgets.get(key))
+        for key, widget in self.widgets.items():
+            if key not in old.widgets:
+                changes[key] = (None, widget)
+        return changes
+
+    def records(self):
+        return [{'path': path, 'widget': name, 'state': widget.state, 'in': widget.inputs, 'out': widget.outputs}
+            for (path, name), widget in self.widgets.items()]
+
+    @classmethod
+    def fromRecords(cls, records):
+        return cls({(record['path'], record['widget']): DAPMWidget(record['state'], record['in'], record['out'])
+            for record in records})
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as fd:
+            json.dump({'dapm': self.records()}, fd, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, encoding='utf-8') as fd:
+            return cls.fromRecords(json.load(fd)['dapm'])
+
+# the full system report of clsSYSCardInfo at one time: dmi, pci, acpi, cards
+# with their codecs and PCMs, and power, as loaded by the loaders
+class clsSYSSnapshot():
+    def __init__(self, report=None):
+        self.report = report if report is not None else {}
+
+    # flatten the report to {key: value}, a key is a path like 'card/0/short' or
+    # 'power/run_status/0000:00:1f.3', so that snapshots can be compared item by item
+    def items(self):
+        items = {}
+        for key, value in self.report.get('dmi', {}).items():
+            items['dmi/%s' % key] = value
+        for pci_info in self.report.get('pci', []):
+            for key, value in pci_info.items():
+                items['pci/%s/%s' % (pci_info['pci_id'], key)] = value
+        for acpi_info in self.report.get('acpi', []):
+            for key, value in acpi_info.items():
+                items['acpi/%s/%s' % (acpi_info['acpi_id'], key)] = value
+        for card_id, card_info in self.report.get('cards', {}).items():
+            for key in ['type', 'short', 'longname']:
+                items['card/%s/%s' % (card_id, key)] = card_info[key]
+            for codec_info in card_info['codec']:
+                items['card/%s/codec/%s' % (card_id, codec_info['id'])] = codec_info['name']
+            for pcm_info in card_info['pcm']:
+                items['pcm/%s/%s/%s' % (card_id, pcm_info['id'], pcm_info['type'])] = pcm_info['pcm']
+        power = self.report.get('power', {})
+        for key in ['current', 'wakeup_count']:
+            if key in power:
+                items['power/%s' % key] = power[key]
+        if 'option' in power:
+            items['power/option'] = " ".join(power['option'])
+        for run_status in power.get('run_status', []):
+            items['power/run_status/%s' % run_status['map_id']] = run_status['status']
+        return items
+
+    # return {key: (old value, new value)} of the items which changed since the old
+    # snapshot, the old or new value is None if the item is missing from the snapshot
+    def diff(self, old):
+        old_items, new_items = old.items(), self.items()
+        changes = {}
+        for key, value in old_items.items():
+            if new_items.get(key) != value:
+                changes[key] = (value, new_items.get(key))
+        for key, value in new_items.items():
+            if key not in old_items:
+                changes[key] = (None, value)
+        return changes
+
+    def save(self, filename):
+        with open(filename, 'w', encoding='utf-8') as fd:
+            json.dump(self.report, fd, indent=1)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, encoding='utf-8') as fd:
+            return cls(json.load(fd))
 
 class clsSYSCardInfo():
-    def __init__(self):
+    # root is the directory sysfs, procfs and debugfs files are read from, it
+    # can point to a captured snapshot of them instead of the running system
+    def __init__(self, root='/'):
+        self.root=root
         self.dmi={}
         self.pci_lst=[]
         self.acpi_lst=[]
@@ -24,6 +128,71 @@ class clsSYSCardInfo():
         self._acpi_ids={"byt":"80860F28", "cht": "808622A8", "bdw":"INT3438"}
         self.sys_power={}
         self.dapm={'ctrl_lst':[], 'dapm_lst':[], 'name_lst':[]}
+        # [(pattern, module)] of modules.alias, loaded on the first use
+        self._mod_aliases=None
+
+    def _rootPath(self, path):
+        return os.path.join(self.root, path.lstrip('/'))
+
+    # read a sysfs, procfs or debugfs file like `cat` does, return None if it
+    # can't be read: it is missing, the device is gone, or the kernel refuses
+    # the read of the attribute (EACCES, EIO, ENODEV, ...)
+    def _readFile(self, path):
+        try:
+            with open(self._rootPath(path), encoding='utf-8', errors='replace') as fd:
+                output = fd.read()
+        except OSError:
+            return None
+        # strip the trailing newline, like command substitution does
+        return output[:-1] if output.endswith('\n') else output
+
+    # return the kernel modules which can drive a device of modalias, like the
+    # "Kernel modules" of `lspci -k`: the modules with a matching alias in modules.alias
+    def _aliasModules(self, modalias):
+        if self._mod_aliases is None:
+            self._mod_aliases = []
+            release = self._readFile("/proc/sys/kernel/osrelease")
+            aliases = self._readFile("/lib/modules/%s/modules.alias" % release) if release else None
+            for line in (aliases or "").splitlines():
+                fields = line.split()
+                if len(fields) == 3 and fields[0] == 'alias':
+                    self._mod_aliases.append((fields[1], fields[2]))
+        modules = []
+        for pattern, module in self._mod_aliases:
+            if module not in modules and fnmatch.fnmatchcase(modalias, pattern):
+                modules.append(module)
+        return modules
+
+    # return the directories named name under path, in the order `find` would list them
+    def _findDirs(self, path, name):
+        dirs = []
+        try:
+            entries = list(os.scandir(self._rootPath(path)))
+        except OSError:
+            return dirs
+        for entry in entries:
+            if not entry.is_dir(follow_symlinks=False):
+                continue
+            if entry.name == name:
+                dirs.append(os.path.join(path, entry.name))
+            dirs.extend(self._findDirs(os.path.join(path, entry.name), name))
+        return dirs
+
+    # load the full report and return it as a clsSYSSnapshot, the independent
+    # loaders run concurrently, power after PCI and ACPI which it refers to
+    def snapshot(self):
+        import copy
+        import time
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            loads = [executor.submit(load) for load in [self.loadDMI, self.loadPCI, self.loadACPI, self.loadProcSound]]
+            # raise the exception of a failed loader
+            for load in loads:
+                load.result()
+        self.loadPower()
+        return clsSYSSnapshot(copy.deepcopy({'time': time.time(), 'dmi': self.dmi, 'pci': self.pci_lst,
+            'acpi': self.acpi_lst, 'cards': self.proc_card, 'power': self.sys_power}))
 
     def _convert_dmi_type(self, line):
         name=""
@@ -57,9 +226,8 @@ class clsSYSCardInfo():
 
     def loadDMI(self):
         self.dmi.clear()
-        exit_code, output=subprocess.getstatusoutput("cat /sys/class/dmi/id/modalias")
-        # grep exit 1 means nothing matched
-        if exit_code != 0:
+        output = self._readFile("/sys/class/dmi/id/modalias")
+        if output is None:
             return
         output = output.split(':')
         # ouput[0] = dmi; ouput[-1] = '' ignore
@@ -69,25 +237,51 @@ class clsSYSCardInfo():
             self.dmi[name] = line[idx:]
         pass
 
+    # Intel PCI audio devices, enumerated from sysfs in the order lspci lists them
     def loadPCI(self):
         self.pci_lst.clear()
-        exit_code, output=subprocess.getstatusoutput("lspci -D |grep audio -i|grep intel -i")
-        # grep exit 1 means nothing matched
-        if exit_code != 0:
+        pci_path = "/sys/bus/pci/devices"
+        try:
+            # names are domain:bus:device.function with fixed width hex numbers
+            pci_ids = sorted(os.listdir(self._rootPath(pci_path)))
+        except OSError:
             return
-        for line in output.splitlines():
+        for pci_id in pci_ids:
+            dev_path = "%s/%s" % (pci_path, pci_id)
+            vendor = self._readFile(dev_path + "/vendor")
+            device = self._readFile(dev_path + "/device")
+            pci_class = self._readFile(dev_path + "/class")
+            if vendor != "0x8086" or device is None or pci_class is None:
+                continue
+            pci_class = int(pci_class, 16)
+            # multimedia audio controllers and audio devices, and the audio DSPs
+            # of older platforms, which are other multimedia controllers
+            if pci_class >> 16 != 0x04 or \
+                ((pci_class >> 8) & 0xff not in [0x01, 0x03] and device not in self._pci_ids):
+                continue
             pci_info = {}
-            pci_info['pci_id'] = line.split(' ')[0]
-            tmp_output = subprocess.getoutput("lspci -s %s -kx" % (pci_info['pci_id'])).splitlines()
-            pci_info['name'] = tmp_output[1].split(':')[-1].strip()
-            for i in range(2, len(tmp_output)):
-                if tmp_output[i].split()[1].strip() == 'modules:' :
-                    pci_info['module'] = tmp_output[i].split(':')[-1].strip()
-                elif tmp_output[i].split()[0].strip() == '00:':
-                    tmp_line = tmp_output[i].split()
+            pci_info['pci_id'] = pci_id
+            # without the pci.ids database of pciutils, name the subsystem like lspci does
+            # for unknown ones
+            sub_vendor = self._readFile(dev_path + "/subsystem_vendor") or vendor
+            sub_device = self._readFile(dev_path + "/subsystem_device") or device
+            pci_info['name'] = "Device %s:%s" % (sub_vendor[2:], sub_device[2:])
+            # the kernel module of the bound driver, lspci -k shows it as
+            # "Kernel driver in use"
+            for link in ["/driver/module", "/driver"]:
+                try:
+                    pci_info['module'] = os.path.basename(os.readlink(self._rootPath(dev_path + link)))
                     break
-            pci_info['hw_id']="0x" + tmp_line[2] + tmp_line[1] + " 0x" + tmp_line[4] + tmp_line[3]
-            pci_info['hw_name'] = self._pci_ids["0x" + tmp_line[4] + tmp_line[3]]
+                except OSError:
+                    continue
+            # all the kernel modules which can drive the device, lspci -k shows
+            # them as "Kernel modules"
+            modalias = self._readFile(dev_path + "/modalias")
+            modules = self._aliasModules(modalias) if modalias else []
+            if len(modules) != 0:
+                pci_info['modules'] = ", ".join(modules)
+            pci_info['hw_id'] = vendor + " " + device
+            pci_info['hw_name'] = self._pci_ids.get(device, "unknown")
             self.pci_lst.append(pci_info)
 
     def loadACPI(self):
@@ -102,10 +296,9 @@ class clsSYSCardInfo():
             device_index = -1
             for i in range(0, 2):
                 # make sure the ACPI status is 15 (indicates device presence)
-                exit_code, output=subprocess.getstatusoutput(
-                    "cat /sys/bus/acpi/devices/%s:0%d/status" %
+                output = self._readFile("/sys/bus/acpi/devices/%s:0%d/status" %
                     (self._acpi_ids[mach], i))
-                if exit_code == 0 and output == "15":
+                if output == "15":
                     device_index = i
                     break
 
@@ -122,8 +315,8 @@ class clsSYSCardInfo():
             self._loadAPCM()
 
     def _loadACard(self):
-        exit_code, output=subprocess.getstatusoutput("cat /proc/asound/cards")
-        if exit_code != 0:
+        output = self._readFile("/proc/asound/cards")
+        if output is None:
             return False
         output = output.splitlines()
         if len(output) <= 1:
@@ -141,8 +334,8 @@ class clsSYSCardInfo():
         return True
     
     def _loadACodec(self):
-        exit_code, output=subprocess.getstatusoutput("cat /proc/asound/hwdep")
-        if exit_code != 0:
+        output = self._readFile("/proc/asound/hwdep")
+        if output is None:
             return
         for line in output.splitlines():
             id = line.split(':')[0].strip()
@@ -153,8 +346,8 @@ class clsSYSCardInfo():
             card_info['codec'].append(codec_info)
 
     def _loadAPCM(self):
-        exit_code, output=subprocess.getstatusoutput("cat /proc/asound/pcm")
-        if exit_code != 0:
+        output = self._readFile("/proc/asound/pcm")
+        if output is None:
             return
 
         def _sort_pcm(pcm_info):
@@ -183,8 +376,9 @@ class clsSYSCardInfo():
         card_info['pcm'].sort(key=_sort_pcm)
 
     def loadPower(self):
-        exit_code, output=subprocess.getstatusoutput("cat /sys/power/mem_sleep")
-        if exit_code != 0:
+        self.sys_power.clear()
+        output = self._readFile("/sys/power/mem_sleep")
+        if output is None:
             return
         self.sys_power['option']=output.split()
         for opt in self.sys_power['option']:
@@ -193,12 +387,20 @@ class clsSYSCardInfo():
                 opt = self.sys_power['current']
                 break
 
-        exit_code, output=subprocess.getstatusoutput("cat /sys/power/wakeup_count")
-        if exit_code != 0:
+        output = self._readFile("/sys/power/wakeup_count")
+        if output is None:
             return
         self.sys_power['wakeup_count']=output
         self.sys_power['run_status'] = []
+        for map_id, path in self._runtimeStatusPaths():
+            output = self._readFile(path)
+            if output is None:
+                continue
+            self.sys_power['run_status'].append({'map_id': map_id, 'status': output})
 
+    # return (map_id, runtime_status file) of the ACPI and PCI audio devices
+    def _runtimeStatusPaths(self):
+        paths = []
         # ACPI devices need to be added first since the other scripts using the dsp_status
         # assume the device we care about has the index 0 in the sys_power.['run_status']
         # list
@@ -206,25 +408,87 @@ class clsSYSCardInfo():
             self.loadACPI()
 
         for acpi_info in self.acpi_lst:
-            exit_code, output=subprocess.getstatusoutput(
-                "cat /sys/bus/acpi/devices/%s:0%d/power/runtime_status" %
-                (acpi_info['acpi_id'], acpi_info['acpi_id_suffix']))
-            if exit_code != 0:
-                continue
-            self.sys_power['run_status'].append({'map_id': acpi_info['acpi_id'], 'status': output})
+            paths.append((acpi_info['acpi_id'], "/sys/bus/acpi/devices/%s:0%d/power/runtime_status" %
+                (acpi_info['acpi_id'], acpi_info['acpi_id_suffix'])))
 
         if len(self.pci_lst) == 0:
             self.loadPCI()
 
         for pci_info in self.pci_lst:
-            exit_code, output=subprocess.getstatusoutput("cat /sys/bus/pci/devices/%s/power/runtime_status" % (pci_info['pci_id']))
-            if exit_code != 0:
+            paths.append((pci_info['pci_id'], "/sys/bus/pci/devices/%s/power/runtime_status" % (pci_info['pci_id'])))
+        return paths
+
+    # watch the runtime PM status of the index-th device of sys_power['run_status'], and
+    # yield (time, status) for the initial status and every change of it, until the status
+    # is one of states or timeout seconds passed. sysfs doesn't notify runtime PM changes,
+    # so the status file is opened once and read again every interval seconds. status
+    # is None while the file can't be read, eg the device is removed.
+    def watchRuntimeStatus(self, index, states, timeout, interval=0.005):
+        import time
+
+        # same devices as sys_power['run_status']
+        paths = [path for _, path in self._runtimeStatusPaths() if self._readFile(path) is not None]
+        path = self._rootPath(paths[index])
+        deadline = time.monotonic() + timeout
+        fd = None
+        last_status = ''
+        try:
+            while True:
+                try:
+                    if fd is None:
+                        fd = os.open(path, os.O_RDONLY)
+                    # reading sysfs from offset 0 gets the current value
+                    status = os.pread(fd, 64, 0).decode().strip()
+                except OSError:
+                    if fd is not None:
+                        os.close(fd)
+                    fd = None
+                    status = None
+                now = time.monotonic()
+                if status != last_status:
+                    yield now, status
+                    last_status = status
+                if status in states or now >= deadline:
+                    return
+                time.sleep(min(interval, max(deadline - now, 0)))
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    # take a clsDAPMSnapshot of the widgets under debugfs, the widget files are read
+    # with up to jobs threads, as a read of debugfs may wait for the DAPM lock of the card
+    def snapshotDAPM(self, jobs=8):
+        from concurrent.futures import ThreadPoolExecutor
+
+        sound_path = "/sys/kernel/debug/asoc"
+        # (path, widget name, file) of all widgets
+        widget_files = []
+        for dapm_path in self._findDirs(sound_path, 'dapm'):
+            path = os.path.dirname(os.path.relpath(dapm_path, sound_path))
+            try:
+                entries = list(os.scandir(self._rootPath(dapm_path)))
+            except OSError:
                 continue
-            self.sys_power['run_status'].append({'map_id': pci_info['pci_id'], 'status': output})
-
-    def loadDAPM(self, filter = "all"):
-        sound_path="/sys/kernel/debug/asoc"
+            widget_files.extend((path, entry.name, "%s/%s" % (dapm_path, entry.name)) for entry in entries)
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            outputs = list(executor.map(self._readFile, [widget_file for _, _, widget_file in widget_files]))
 
+        snapshot = clsDAPMSnapshot()
+        for (path, name, _), output in zip(widget_files, outputs):
+            if not output:
+                continue
+            # 1st line format:
+            # 'name': content in x out x
+            # OR
+            # content
+            line = output.splitlines()[0].replace("%s:" % (name), '').strip()
+            counts = re.search(r'\bin (\d+) out (\d+)', line)
+            # content value: [ on, off, standby ]
+            snapshot.widgets[(path, name)] = DAPMWidget(line.split(' ')[0],
+                int(counts.group(1)) if counts else None, int(counts.group(2)) if counts else None)
+        return snapshot
+
+    def loadDAPM(self, filter = "all", jobs=8):
         if len(self.pci_lst) == 0:
             self.loadPCI()
 
@@ -236,166 +500,388 @@ class clsSYSCardInfo():
         self.dapm['name_lst'].clear()
 
         for pci_info in self.pci_lst:
-            exit_code, output=subprocess.getstatusoutput("cat /sys/bus/pci/devices/%s/power/control" % (pci_info['pci_id']))
-            if exit_code != 0:
+            output = self._readFile("/sys/bus/pci/devices/%s/power/control" % (pci_info['pci_id']))
+            if output is None:
                 continue
             self.dapm['ctrl_lst'].append({'id': pci_info['pci_id'], 'status':output})
 
         for acpi_info in self.acpi_lst:
-            exit_code, output=subprocess.getstatusoutput("cat /sys/bus/acpi/devices/%s:00/power/control" % (acpi_info['acpi_id']))
-            if exit_code != 0:
+            output = self._readFile("/sys/bus/acpi/devices/%s:00/power/control" % (acpi_info['acpi_id']))
+            if output is None:
                 continue
             self.dapm['ctrl_lst'].append({'id': acpi_info['acpi_id'], 'status':output})
 
-        exit_code, output = subprocess.getstatusoutput("find %s -name dapm" % (sound_path))
-        if exit_code != 0:
-            return
-
-        for line in output.splitlines():
-            dapm_dict = {'path':None, 'status':{}}
-            # line format:
-            # /sys/kernel/debug/asoc/'machine-driver'/'path_name'/dapm
-            # /sys/kernel/debug/asoc/'machine-driver'/dapm
-            path_name = line.replace(sound_path, '')
-            path_name = path_name.split('/')[2]
-            dapm_dict['path'] = path_name
-            self.dapm['dapm_lst'].append(dapm_dict)
-            for fname in os.scandir(line):
-                exit_code, output = subprocess.getstatusoutput('cat "%s/%s"' % (line, fname.name))
-                if exit_code != 0:
-                    continue
-                # 1st line format:
-                # 'fname.name': content in x out x
-                # OR
-                # content
-                content = output.splitlines()[0].replace("%s:" %(fname.name), '').strip().split(' ')[0]
-                # content value: [ on, off, standby ]
-                if filter == 'all':
-                    dapm_dict['status'][fname.name]=content
-                elif content.lower() == filter:
-                    self.dapm['name_lst'].append("'%s/%s'" %(path_name ,fname.name))
-
-if __name__ == "__main__":
-    def dump_dmi(dmi):
-        if len(dmi.keys()) == 0:
-            print("Couldn't detect for DMI information from SYS modalias")
-            return
-        print("DMI Info:")
-        for key, value in dmi.items():
-            if len(key) < 15:
-                flag = '\t'
-            else:
-                flag = ''
-            print("\t%s:\t%s%s" %( key, flag, value ))
-        print("")
-
-    def dump_pci(pci_lst):
-        # dump pci information
-        if len(pci_lst) == 0 :
-            print("Couldn't detect for PCI device for audio\n")
-            return
-        for pci_info in pci_lst:
-            print("PCI ID:\t\t\t" +  pci_info['pci_id'])
-            print("\tName:\t\t" + pci_info['name'])
-            print("\tHex:\t\t" + pci_info['hw_id'])
-            print("\tchipset:\t" + pci_info['hw_name'])
-            if pci_info.get('module') is not None:
-                print("\tmodule:\t\t" + pci_info['module'])
-        print("")
-
-    def dump_acpi(acpi_lst):
-        # dump acpi information
-        if len(acpi_lst) == 0 :
-            print("Couldn't detect for ACPI device for audio\n")
-            return
-        for acpi_info in acpi_lst:
-            print("ACPI ID:\t\t\t" +  acpi_info['acpi_id'])
-            print("\tchipset:\t" + acpi_info['hw_name'])
+        dapm_dicts = {}
+        for (path, name), widget in self.snapshotDAPM(jobs).widgets.items():
+            # path format:
+            # 'machine-driver'/'path_name'
+            # 'machine-driver', shown as dapm
+            path_name = path.split('/')[1] if '/' in path else 'dapm'
+            if filter == 'all':
+                if path not in dapm_dicts:
+                    dapm_dicts[path] = {'path': path_name, 'status': {}}
+                    self.dapm['dapm_lst'].append(dapm_dicts[path])
+                dapm_dicts[path]['status'][name] = widget.state
+            elif widget.state.lower() == filter:
+                self.dapm['name_lst'].append("'%s/%s'" %(path_name, name))
+
+def dump_dmi(dmi):
+    if len(dmi.keys()) == 0:
+        print("Couldn't detect for DMI information from SYS modalias")
+        return
+    print("DMI Info:")
+    for key, value in dmi.items():
+        if len(key) < 15:
+            flag = '\t'
+        else:
+            flag = ''
+        print("\t%s:\t%s%s" %( key, flag, value ))
+    print("")
+
+def dump_pci(pci_lst):
+    # dump pci information
+    if len(pci_lst) == 0 :
+        print("Couldn't detect for PCI device for audio\n")
+        return
+    for pci_info in pci_lst:
+        print("PCI ID:\t\t\t" +  pci_info['pci_id'])
+        print("\tName:\t\t" + pci_info['name'])
+        print("\tHex:\t\t" + pci_info['hw_id'])
+        print("\tchipset:\t" + pci_info['hw_name'])
+        if pci_info.get('module') is not None:
+            print("\tmodule:\t\t" + pci_info['module'])
+        if pci_info.get('modules') is not None:
+            print("\tmodules:\t" + pci_info['modules'])
+    print("")
+
+def dump_acpi(acpi_lst):
+    # dump acpi information
+    if len(acpi_lst) == 0 :
+        print("Couldn't detect for ACPI device for audio\n")
+        return
+    for acpi_info in acpi_lst:
+        print("ACPI ID:\t\t\t" +  acpi_info['acpi_id'])
+        print("\tchipset:\t" + acpi_info['hw_name'])
+    print("")
+
+def dump_proc_sound(proc_card):
+    if len(proc_card.keys()) == 0:
+        print("Couldn't detect for sound card for audio")
+        return
+    for card_info in proc_card.values():
+        print("Card ID:\t\t" + card_info['id'])
+        print("\tType:\t\t" + card_info['type'])
+        print("\tShort name:\t" + card_info['short'])
+        print("\tLong name:\t" + card_info['longname'])
+        if len(card_info['codec']) == 0:
+            print("\tCodec:\t\tNOCODEC")
+        else:
+            print("\tCodec:")
+            for item in card_info['codec']:
+                print("\t\tID:\t" + item['id'])
+                print("\t\tName:\t" + item['name'])
+        if len(card_info['pcm']) == 0:
+            print("\tPCM:\t\tNOPCM")
+        else:
+            print("\tPCM:")
+            for item in card_info['pcm']:
+                print("\t\tID:\t" + item['id'])
+                print("\t\tPCM:\t" + item['pcm'])
+                print("\t\tType:\t" + item['type'].capitalize())
         print("")
 
-    def dump_proc_sound(proc_card):
-        if len(proc_card.keys()) == 0:
-            print("Couldn't detect for sound card for audio")
-            return
-        for card_info in proc_card.values():
-            print("Card ID:\t\t" + card_info['id'])
-            print("\tType:\t\t" + card_info['type'])
-            print("\tShort name:\t" + card_info['short'])
-            print("\tLong name:\t" + card_info['longname'])
-            if len(card_info['codec']) == 0:
-                print("\tCodec:\t\tNOCODEC")
-            else:
-                print("\tCodec:")
-                for item in card_info['codec']:
-                    print("\t\tID:\t" + item['id'])
-                    print("\t\tName:\t" + item['name'])
-            if len(card_info['pcm']) == 0:
-                print("\tPCM:\t\tNOPCM")
-            else:
-                print("\tPCM:")
-                for item in card_info['pcm']:
-                    print("\t\tID:\t" + item['id'])
-                    print("\t\tPCM:\t" + item['pcm'])
-                    print("\t\tType:\t" + item['type'].capitalize())
-            print("")
-
-    def dump_power(sys_power):
-        if len(sys_power.keys()) == 0:
-            print("Couldn't detect for sound card for audio")
-            return
-        print("Power Info:")
-        print("\tCurrent option:\t%s" %(sys_power['current']))
-        print("\t\toption:\t%s" %(",".join(sys_power['option'])))
-        print("\tWakeup Count:\t%s" %(sys_power['wakeup_count']))
-        print("Power Status:")
-        for run_status in sys_power['run_status']:
-            print("\tMap ID:\t%s" %(run_status['map_id']))
-            print("\t\tstatus:\t%s" %(run_status['status']))
-        print("")
+def dump_power(sys_power):
+    if len(sys_power.keys()) == 0:
+        print("Couldn't detect for sound card for audio")
+        return
+    print("Power Info:")
+    print("\tCurrent option:\t%s" %(sys_power['current']))
+    print("\t\toption:\t%s" %(",".join(sys_power['option'])))
+    print("\tWakeup Count:\t%s" %(sys_power['wakeup_count']))
+    print("Power Status:")
+    for run_status in sys_power['run_status']:
+        print("\tMap ID:\t%s" %(run_status['map_id']))
+        print("\t\tstatus:\t%s" %(run_status['status']))
+    print("")
+
+def dump_cardinfo_pcm(card_info):
+    for pipeline in card_info.get('pcm'):
+        print(format_pipeline(pipeline))
+
+def dump_dapm(dapm, filter = "all"):
+    if filter == "all" and len(dapm['dapm_lst']) == 0:
+        return
+    if filter != "all" and len(dapm['name_lst']) == 0:
+        return
+    print("DPAM Info:")
+    print("\tPower control:")
+    for control in dapm['ctrl_lst']:
+        print("\t\tPCI ID: %s" %(control['id']))
+        print("\t\tStatus: %s" %(control['status']))
+    if filter == "all":
+        for em in dapm['dapm_lst']:
+            print("\tPath:\t%s" %(em['path']))
+            print("\tStatus:")
+            for fname in em['status'].keys():
+                strtab = ""
+                if len(fname) < 24:
+                    strtab += "\t"
+                if len(fname) < 16:
+                    strtab += "\t"
+                if len(fname) < 8:
+                    strtab += "\t"
+                print("\t\t%s%s : %s" % (fname, strtab, em['status'][fname]))
+    else:
+        print("\tStatus is '%s' component:" % (filter))
+        for em in dapm['name_lst']:
+            print("\t\t%s;" % em)
+
+# JSON records of the sound cards, the codecs are a list in the card record,
+# every PCM is a record of its own
+def json_proc_sound(proc_card):
+    for card_info in proc_card.values():
+        print_json('card', {key: value for key, value in card_info.items() if key != 'pcm'})
+        for pcm_info in card_info['pcm']:
+            print_json('pcm', pcm_info, card=card_info['id'])
+
+# JSON records of the system power, the runtime PM status of each device is a record of its own
+def json_power(sys_power):
+    if len(sys_power.keys()) == 0:
+        return
+    print_json('power', {key: value for key, value in sys_power.items() if key != 'run_status'})
+    for run_status in sys_power.get('run_status', []):
+        print_json('run_status', run_status)
+
+def json_report(sysinfo):
+    if len(sysinfo.dmi.keys()) != 0:
+        print_json('dmi', sysinfo.dmi)
+    for pci_info in sysinfo.pci_lst:
+        print_json('pci', pci_info)
+    for acpi_info in sysinfo.acpi_lst:
+        print_json('acpi', acpi_info)
+    json_proc_sound(sysinfo.proc_card)
+    json_power(sysinfo.sys_power)
+
+# Every do_* function below runs one mode of the command line, main() picks
+# the mode from the parsed options and exits once it returns
+
+# -p: print the chipset name of the audio PCI device, or of the ACPI device
+# if there is no PCI one
+def do_platform(sysinfo):
+    sysinfo.loadPCI()
+    mach_name = None
+    for pci_info in sysinfo.pci_lst:
+        mach_name = pci_info['hw_name']
+    if (mach_name is None):
+        sysinfo.loadACPI()
+        for acpi_info in sysinfo.acpi_lst:
+            mach_name = acpi_info['hw_name']
+    if (mach_name is not None):
+        print(mach_name)
+
+# -w: print the runtime PM status of every audio device
+def do_power(sysinfo, json_out):
+    sysinfo.loadPower()
+    for run_status in sysinfo.sys_power['run_status']:
+        if json_out:
+            print_json('run_status', run_status)
+        else:
+            print(run_status['status'])
 
-    def export_pci(pci_lst, platform = False):
-        if len(pci_lst) == 0 :
-            return
-        if platform is True:
-            print("PCI_PLATFORM=" + pci_lst['hw_name'])
-            return
+# -e: export the PCMs of all the sound cards as pipelines, filter_str
+# selects them by type
+def do_export(sysinfo, filter_str, json_out):
+    sysinfo.loadProcSound()
+    pipeline_lst = []
+    for (card_id, card_info) in sysinfo.proc_card.items():
+        for pcm in card_info['pcm']:
+            # There are limited pipeline parameters in the proc file system,
+            # add some default parameters to make use of sof-test for legacy HDA test
+            pcm['fmt'] = 'S16_LE'
+            pcm['fmts'] = 'S16_LE S24_LE S32_LE'
+            pcm['rate'] = '48000'
+            pcm['channel'] = '2'
+            pcm['dev'] = 'hw:{},{}'.format(card_id, pcm['id'])
+        pipeline_lst.extend(card_info['pcm'])
+    # The filter string may be very complex due to the compatibility with topology pipeline
+    # filter string, but we only implement a simple type filter here.
+    try:
+        # filter_str may looks like 'type:capture & pga:any | id:3'
+        # extract filter elements, and drop logic operator
+        filter_elements = [elem for elem in filter_str.split(' ') if ':' in elem]
+        # extract requested pipeline type from filter elements, and ignore others.
+        requested_type = [f.split(':')[1] for f in filter_elements if f.strip().startswith('type')][0]
+    except:
+        print('Invalid filter string')
+        exit(1)
+    # requested_type may take one of the values: playback, capture, any
+    if requested_type in ['playback', 'capture']:
+        pipeline_lst = [p for p in pipeline_lst if p['type'] == requested_type]
+    elif requested_type != 'any':
+        print('Unknown requested pipeline type: %s' % requested_type)
+        print('Available requested pipeline types are: playback, capture, any')
+        exit(1)
+    if json_out:
+        for pipeline in pipeline_lst:
+            print_json('pipeline', pipeline)
+    else:
+        export_pipeline(pipeline_lst)
+
+# -i, -s and -l: print the PCMs, the short name or the long name of a sound card
+def do_card(sysinfo, card_id, field, json_out):
+    sysinfo.loadProcSound()
+    card_info = sysinfo.proc_card.get(str(card_id))
+    if card_info is None:
+        return
+    if field != 'pcm':
+        print(card_info[field])
+    elif json_out:
+        for pcm_info in card_info['pcm']:
+            print_json('pcm', pcm_info, card=card_info['id'])
+    else:
+        dump_cardinfo_pcm(card_info)
 
-    def export_proc_sound(proc_card):
-        if len(proc_card.keys()) == 0:
-            return
+# --wait and --watch: log each change of the dsp power status with its time
+# and the time since the previous change, exit 0 once the status is one of states
+def do_wait(sysinfo, index, states, timeout, interval, json_out):
+    import time
+
+    time_offset = time.time() - time.monotonic()
+    status, last_stamp = None, None
+    for stamp, status in sysinfo.watchRuntimeStatus(index, states, timeout, interval / 1000):
+        latency = 0.0 if last_stamp is None else stamp - last_stamp
+        last_stamp = stamp
+        wall_time = stamp + time_offset
+        if json_out:
+            print_json('transition', {'time': wall_time, 'status': status, 'latency': latency})
+        else:
+            print("%s.%06d %s +%.6fs" % (time.strftime("%H:%M:%S", time.localtime(wall_time)),
+                (wall_time % 1) * 1000000, status if status is not None else 'unreadable', latency), flush=True)
+    if states and status not in states:
+        print("timeout: dsp power status is not %s after %gs" % (" or ".join(states), timeout))
+        exit(1)
+
+# -S: print the runtime PM status of a device
+def do_dsp_status(sysinfo, index, json_out):
+    sysinfo.loadPower()
+    run_status = sysinfo.sys_power['run_status'][index]
+    if json_out:
+        print_json('run_status', run_status)
+    else:
+        print(run_status['status'])
+
+# --diff: print the changes of the report snapshot since the one saved in filename
+def do_diff(snapshot, filename, json_out):
+    for key, (old, new) in snapshot.diff(clsSYSSnapshot.load(filename)).items():
+        if json_out:
+            print_json('change', {'key': key, 'old': old, 'new': new})
+        else:
+            print("%s: %s -> %s" % (key, "none" if old is None else old, "none" if new is None else new))
+
+# --save: save the report snapshot to filename, after --diff compared it
+def do_save(snapshot, filename):
+    snapshot.save(filename)
+
+# --dapm-diff: print the dapm widgets which changed since the snapshot saved in filename
+def do_dapm_diff(snapshot, filename, json_out):
+    def widget_str(widget):
+        if widget is None:
+            return "none"
+        if widget.inputs is None:
+            return widget.state
+        return "%s in %d out %d" % widget
+    def widget_record(widget):
+        if widget is None:
+            return None
+        return {'state': widget.state, 'in': widget.inputs, 'out': widget.outputs}
+    for (path, name), (old, new) in snapshot.diff(clsDAPMSnapshot.load(filename)).items():
+        if json_out:
+            print_json('dapm_change', {'path': path, 'widget': name, 'old': widget_record(old), 'new': widget_record(new)})
+        else:
+            print("%s/%s: %s -> %s" % (path, name, widget_str(old), widget_str(new)))
+
+# --dapm-save: save the dapm snapshot to filename, after --dapm-diff compared it
+def do_dapm_save(snapshot, filename):
+    snapshot.save(filename)
+
+# -d: print the dapm widgets, all of them or the ones in the dapm_filter state
+def do_dapm(sysinfo, dapm_filter, jobs, json_out):
+    if json_out:
+        snapshot = sysinfo.snapshotDAPM(jobs)
+        for record in snapshot.records():
+            if dapm_filter == 'all' or record['state'].lower() == dapm_filter:
+                print_json('dapm_widget', record)
+        return
+    sysinfo.loadDAPM(dapm_filter, jobs)
+    dump_dapm(sysinfo.dapm, dapm_filter)
+
+# -P: print the firmware path.
+# The kernel has changed the default firmware path when community
+# key is used. Here we output firmware path according to kernel's
+# match table.
+def do_fwpath(sysinfo):
+    def is_community_board(board, community_boards):
+        for elem in community_boards:
+            if match_board(elem, board):
+                return True
+        return False
+
+    # see if 'board' matches 'match', only match the key defined
+    # in community boards' matches field.
+    def match_board(match, board):
+        for key in match["matches"].keys():
+            if match["matches"][key] != board["matches"][key]:
+                return False
+        return True
 
-    def dump_cardinfo_pcm(card_info):
-        for pipeline in card_info.get('pcm'):
-            print(format_pipeline(pipeline))
+    # The "community_boards" structure here is in accordance
+    # with "struct dmi_system_id community_key_platforms" in
+    # "sound/soc/sof/sof-pci-dev.c".
+    community_boards = [
+        {
+            "ident": "Up Squared",
+            "matches": {
+                "board_name": "UP-APL01",
+                "board_vendor": "AAEON"
+            }
+        },
+        {
+            "ident": "Chromebook",
+            "matches":  {
+                "board_vendor": "Google",
+            }
+        }
+    ]
+    fw_path = "/lib/firmware/intel/sof"
+    sysinfo.loadDMI()
+    board = {
+                "ident": sysinfo.dmi["board_name"],
+                "matches": {
+                    "board_name": sysinfo.dmi["board_name"],
+                    "board_vendor": sysinfo.dmi["board_vendor"]
+                }
+            }
+    if is_community_board(board, community_boards):
+        fw_path += "/community"
+    print(fw_path)
 
-    def dump_dapm(dapm, filter = "all"):
-        if filter == "all" and len(dapm['dapm_lst']) == 0:
-            return
-        if filter != "all" and len(dapm['name_lst']) == 0:
-            return
-        print("DPAM Info:")
-        print("\tPower control:")
-        for control in dapm['ctrl_lst']:
-            print("\t\tPCI ID: %s" %(control['id']))
-            print("\t\tStatus: %s" %(control['status']))
-        if filter == "all":
-            for em in dapm['dapm_lst']:
-                print("\tPath:\t%s" %(em['path']))
-                print("\tStatus:")
-                for fname in em['status'].keys():
-                    strtab = ""
-                    if len(fname) < 24:
-                        strtab += "\t"
-                    if len(fname) < 16:
-                        strtab += "\t"
-                    if len(fname) < 8:
-                        strtab += "\t"
-                    print("\t\t%s%s : %s" % (fname, strtab, em['status'][fname]))
-        else:
-            print("\tStatus is '%s' component:" % (filter))
-            for em in dapm['name_lst']:
-                print("\t\t%s;" % em)
+# no mode option: print the full report
+def do_report(sysinfo, json_out):
+    sysinfo.loadDMI()
+    sysinfo.loadPCI()
+    sysinfo.loadProcSound()
+    sysinfo.loadPower()
+    if json_out:
+        json_report(sysinfo)
+        return
+    dump_dmi(sysinfo.dmi)
+    dump_pci(sysinfo.pci_lst)
+    dump_acpi(sysinfo.acpi_lst)
+    dump_proc_sound(sysinfo.proc_card)
+    dump_power(sysinfo.sys_power)
 
+# command line options of main()
+def build_parser():
     import argparse
 
     parser = argparse.ArgumentParser(description='Detect system status for the Sound Card',
@@ -415,159 +901,86 @@ if __name__ == "__main__":
     parser.add_argument('-e', '--export', type=str, help='export pipeline parameters of specified type from proc file system,\n'
     'to specify pipeline type, use "-e type:playback", complex string like\n'
     '"type:playback & pga:any" can be used, but only "type" is processed')
+    parser.add_argument('--save', type=str, metavar='FILE', help='save a snapshot of the full report to FILE')
+    parser.add_argument('--diff', type=str, metavar='FILE', help='print the changes of the full report since the snapshot in FILE,\n'
+    'eg cards, PCMs, power status and wakeup count after suspend/resume,\n'
+    'before --save saves the current one')
+    parser.add_argument('--dapm-save', type=str, metavar='FILE', help='save a snapshot of the dapm widgets to FILE, like -d\n'
+    'this option need root permission to access debugfs')
+    parser.add_argument('--dapm-diff', type=str, metavar='FILE', help='print the dapm widgets which changed since the snapshot\n'
+    'in FILE, before --dapm-save saves the current one')
+    parser.add_argument('-j', '--jobs', type=int, default=8, help='number of threads reading dapm widgets, default 8')
+    parser.add_argument('--wait', type=str, help='with -S, wait until the dsp power status is one of the comma separated\n'
+    'states, eg "suspended", and log the status changes, exit 1 on timeout')
+    parser.add_argument('--watch', action='store_true', help='with -S, log the dsp power status changes until timeout')
+    parser.add_argument('--timeout', type=float, default=15, help='timeout in seconds of --wait and --watch, default 15')
+    parser.add_argument('--interval', type=float, default=5, help='interval in milliseconds to check the dsp power status\n'
+    'for --wait and --watch, default 5')
+    parser.add_argument('-r', '--root', type=str, default='/', help='read sysfs, procfs and debugfs files under this directory\n'
+    'instead of /, eg from a captured snapshot of them')
+    parser.add_argument('-J', '--json', action='store_true', help='print one JSON object per line, with the record type as "record",\n'
+    'for the full report and -i -e -w -S -d --diff --dapm-diff: dmi, pci, acpi,\n'
+    'card, pcm, power, run_status, pipeline, change, dapm_widget and dapm_change records')
     parser.add_argument('--version', action='version', version='%(prog)s 1.0')
-
-    ret_args = vars(parser.parse_args())
-
-    sysinfo = clsSYSCardInfo()
+    return parser
+
+# command line entry, argv defaults to sys.argv[1:], sysinfo is the clsSYSCardInfo
+# to use, so a long-lived caller can keep the loaded system information
+def main(argv=None, sysinfo=None):
+    parser = build_parser()
+    ret_args = vars(parser.parse_args(argv))
+    if ret_args['json'] is True:
+        for option in ['platform', 'short', 'longname', 'fwpath']:
+            if ret_args[option] not in [None, False]:
+                parser.error('--%s has no JSON output' % option)
+    json_out = ret_args['json']
+    if (ret_args['wait'] is not None or ret_args['watch'] is True) and ret_args['dsp_status'] is None:
+        parser.error('--wait and --watch need -S')
+
+    if sysinfo is None or sysinfo.root != ret_args['root']:
+        sysinfo = clsSYSCardInfo(ret_args['root'])
     if ret_args['platform'] is True:
-        sysinfo.loadPCI()
-        mach_name = None
-        for pci_info in sysinfo.pci_lst:
-            mach_name = pci_info['hw_name']
-        if (mach_name is None):
-            sysinfo.loadACPI()
-            for acpi_info in sysinfo.acpi_lst:
-                mach_name = acpi_info['hw_name']
-        if (mach_name is not None):
-            print(mach_name)
-        exit(0)
-
-    if ret_args['power'] is True:
-        sysinfo.loadPower()
-        for run_status in sysinfo.sys_power['run_status']:
-            print(run_status['status'])
-        exit(0)
-
-    if ret_args['export'] is not None:
-        sysinfo.loadProcSound()
-        pipeline_lst = []
-        for (card_id, card_info) in sysinfo.proc_card.items():
-            for pcm in card_info['pcm']:
-                # There are limited pipeline parameters in the proc file system,
-                # add some default parameters to make use of sof-test for legacy HDA test
-                pcm['fmt'] = 'S16_LE'
-                pcm['fmts'] = 'S16_LE S24_LE S32_LE'
-                pcm['rate'] = '48000'
-                pcm['channel'] = '2'
-                pcm['dev'] = 'hw:{},{}'.format(card_id, pcm['id'])
-            pipeline_lst.extend(card_info['pcm'])
-        # The filter string may be very complex due to the compatibility with topology pipeline
-        # filter string, but we only implement a simple type filter here.
-        try:
-            # ret_args['export'] contains filter string, and it may looks like 'type:capture & pga:any | id:3'
-            # extract filter elements, and drop logic operator
-            filter_elements = [elem for elem in ret_args['export'].split(' ') if ':' in elem]
-            # extract requested pipeline type from filter elements, and ignore others.
-            requested_type = [f.split(':')[1] for f in filter_elements if f.strip().startswith('type')][0]
-        except:
-            print('Invalid filter string')
-            exit(1)
-        # requested_type may take one of the values: playback, capture, any
-        if requested_type in ['playback', 'capture']:
-            export_pipeline([p for p in pipeline_lst if p['type'] == requested_type])
-        elif requested_type == 'any':
-            export_pipeline(pipeline_lst)
-        else:
-            print('Unknown requested pipeline type: %s' % requested_type)
-            print('Available requested pipeline types are: playback, capture, any')
-            exit(1)
-        exit(0)
-
-    if ret_args.get('id') is not None:
-        sysinfo.loadProcSound()
-        card_info = sysinfo.proc_card.get(str(ret_args['id']))
-        if card_info is None:
-            exit(0)
-        dump_cardinfo_pcm(card_info)
-        exit(0)
-
-    if ret_args.get('short') is not None:
-        sysinfo.loadProcSound()
-        card_info = sysinfo.proc_card.get(str(ret_args['short']))
-        if card_info is None:
-            exit(0)
-        print(card_info['short'])
-        exit(0)
-
-    if ret_args.get('longname') is not None:
-        sysinfo.loadProcSound()
-        card_info = sysinfo.proc_card.get(str(ret_args['longname']))
-        if card_info is None:
-            exit(0)
-        print(card_info['longname'])
-        exit(0)
-
-    if ret_args.get('dsp_status') is not None:
-        sysinfo.loadPower()
-        print(sysinfo.sys_power['run_status'][ret_args['dsp_status']]['status'])
-        exit(0)
-
-    if ret_args.get('dapm') is not None:
-        if os.environ['USER'] != 'root': # this operation need root permission
+        do_platform(sysinfo)
+    elif ret_args['power'] is True:
+        do_power(sysinfo, json_out)
+    elif ret_args['export'] is not None:
+        do_export(sysinfo, ret_args['export'], json_out)
+    elif ret_args['id'] is not None:
+        do_card(sysinfo, ret_args['id'], 'pcm', json_out)
+    elif ret_args['short'] is not None:
+        do_card(sysinfo, ret_args['short'], 'short', json_out)
+    elif ret_args['longname'] is not None:
+        do_card(sysinfo, ret_args['longname'], 'longname', json_out)
+    elif ret_args['wait'] is not None or ret_args['watch'] is True:
+        states = [] if ret_args['wait'] is None else [state.strip() for state in ret_args['wait'].split(',')]
+        do_wait(sysinfo, ret_args['dsp_status'], states, ret_args['timeout'], ret_args['interval'], json_out)
+    elif ret_args['dsp_status'] is not None:
+        do_dsp_status(sysinfo, ret_args['dsp_status'], json_out)
+    elif ret_args['save'] is not None or ret_args['diff'] is not None:
+        snapshot = sysinfo.snapshot()
+        if ret_args['diff'] is not None:
+            do_diff(snapshot, ret_args['diff'], json_out)
+        if ret_args['save'] is not None:
+            do_save(snapshot, ret_args['save'])
+    elif ret_args['dapm'] is not None or ret_args['dapm_save'] is not None or ret_args['dapm_diff'] is not None:
+        # this operation need root permission, unless debugfs is a snapshot
+        if ret_args['root'] == '/' and os.environ['USER'] != 'root':
             print("Need root permission to access debugfs")
             exit(1)
-        sysinfo.loadDAPM(ret_args.get('dapm'))
-        dump_dapm(sysinfo.dapm, ret_args.get('dapm'))
-        exit(0)
-
-    # The kernel has changed the default firmware path when community
-    # key is used. Here we output firmware path according to kernel's
-    # match table.
-    if ret_args.get('fwpath') is True:
-        def is_community_board(board, community_boards):
-            for elem in community_boards:
-                if match_board(elem, board):
-                    return True
-            return False
-
-        # see if 'board' matches 'match', only match the key defined
-        # in community boards' matches field.
-        def match_board(match, board):
-            for key in match["matches"].keys():
-                if match["matches"][key] != board["matches"][key]:
-                    return False
-            return True
-
-        # The "community_boards" structure here is in accordance
-        # with "struct dmi_system_id community_key_platforms" in
-        # "sound/soc/sof/sof-pci-dev.c".
-        community_boards = [
-            {
-                "ident": "Up Squared",
-                "matches": {
-                    "board_name": "UP-APL01",
-                    "board_vendor": "AAEON"
-                }
-            },
-            {
-                "ident": "Chromebook",
-                "matches":  {
-                    "board_vendor": "Google",
-                }
-            }
-        ]
-        fw_path = "/lib/firmware/intel/sof"
-        sysinfo.loadDMI()
-        board = {
-                    "ident": sysinfo.dmi["board_name"],
-                    "matches": {
-                        "board_name": sysinfo.dmi["board_name"],
-                        "board_vendor": sysinfo.dmi["board_vendor"]
-                    }
-                }
-        if is_community_board(board, community_boards):
-            fw_path += "/community"
-        print(fw_path)
-        exit(0)
-
-    sysinfo.loadDMI()
-    sysinfo.loadPCI()
-    sysinfo.loadProcSound()
-    sysinfo.loadPower()
-    dump_dmi(sysinfo.dmi)
-    dump_pci(sysinfo.pci_lst)
-    dump_acpi(sysinfo.acpi_lst)
-    dump_proc_sound(sysinfo.proc_card)
-    dump_power(sysinfo.sys_power)
+        if ret_args['dapm_save'] is not None or ret_args['dapm_diff'] is not None:
+            snapshot = sysinfo.snapshotDAPM(ret_args['jobs'])
+            if ret_args['dapm_diff'] is not None:
+                do_dapm_diff(snapshot, ret_args['dapm_diff'], json_out)
+            if ret_args['dapm_save'] is not None:
+                do_dapm_save(snapshot, ret_args['dapm_save'])
+        else:
+            do_dapm(sysinfo, ret_args['dapm'], ret_args['jobs'], json_out)
+    elif ret_args['fwpath'] is True:
+        do_fwpath(sysinfo)
+    else:
+        do_report(sysinfo, json_out)
+        return
+    exit(0)
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Query sof-tplgreader.py and sof-dump-status.py through a long-lived daemon
+
+Every call of these tools from a test case pays interpreter startup, imports
+and a full topology parse. The daemon keeps the tools loaded and parsed topologies
+resident, and answers queries over a Unix domain socket with exactly the output
+and exit status the tool itself would give. Sound card information is not kept,
+it is read again for each query, as devices come and go with kernel modules.
+
+Usage:
+    sof-query.py --daemon                   start the daemon in the foreground
+    sof-query.py --stop                     stop the running daemon
+    sof-query.py sof-tplgreader.py [ARGS]   same as sof-tplgreader.py [ARGS]
+    sof-query.py sof-dump-status.py [ARGS]  same as sof-dump-status.py [ARGS]
+
+When no daemon is running, the client runs the tool directly, as it does for
+queries reading the stdin of the client, sof-tplgreader.py -Q -. Queries run
+with the environment and permissions of the daemon. The socket is
+$SOF_QUERY_SOCKET, or sof-query-$UID.sock under $XDG_RUNTIME_DIR or /tmp.
+"""
+
+# The client is started for every query, keep its imports minimal,
+# everything else is imported by the daemon only.
+import os
+import sys
+import socket
+# requests and replies are plain dicts of str, int and list, marshal is builtin
+# and, unlike json, costs nothing to import
+import marshal
+
+TOOLS = ['sof-tplgreader.py', 'sof-dump-status.py']
+
+def socket_path():
+    path = os.environ.get('SOF_QUERY_SOCKET')
+    if path:
+        return path
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR') or '/tmp'
+    return os.path.join(runtime_dir, 'sof-query-%d.sock' % os.getuid())
+
+def recv_all(conn):
+    chunks = []
+    while True:
+        data = conn.recv(65536)
+        if not data:
+            break
+        chunks.append(data)
+    return b''.join(chunks)
+
+def request(req, path=None):
+    """
+    Send a request to the daemon.
+
+    Returns
+    ----------
+    The reply of the daemon, or None if no daemon is listening on the socket
+    """
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(path or socket_path())
+            conn.sendall(marshal.dumps(req))
+            conn.shutdown(socket.SHUT_WR)
+            return marshal.loads(recv_all(conn))
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+
+class QueryDaemon:
+    """
+    Run the tools in process and keep parsed topology pipelines in a TplgMemoryCache
+    between queries. Sound card information is read again for each query, as
+    devices come and go with kernel modules.
+    Queries are served one at a time, as the tools print to the process stdout.
+    """
+    def __init__(self):
+        # pylint: disable=C0415
+        import importlib.util
+        from tplgtool import TplgMemoryCache
+
+        tools_dir = os.path.dirname(os.path.abspath(__file__))
+        self._modules = {}
+        for tool in TOOLS:
+            module_name = tool[:-len('.py')].replace('-', '_')
+            spec = importlib.util.spec_from_file_location(module_name, os.path.join(tools_dir, tool))
+            self._modules[tool] = importlib.util.module_from_spec(spec)
+            # registered, so functions of the tools can be pickled to -j worker processes
+            sys.modules[module_name] = self._modules[tool]
+            spec.loader.exec_module(self._modules[tool])
+        self._tplg_cache = TplgMemoryCache()
+
+    def _main(self, tool, args):
+        if tool == 'sof-tplgreader.py':
+            self._modules[tool].main(args, cache=self._tplg_cache)
+        else:
+            self._modules[tool].main(args)
+
+    def run(self, tool, args, cwd):
+        """
+        Run tool with args in cwd, and capture what it would print.
+
+        Returns
+        ----------
+        A dict with 'stdout', 'stderr' and 'exit' status of the tool
+        """
+        # pylint: disable=C0415
+        import io
+        import contextlib
+        import traceback
+
+        stdout, stderr = io.StringIO(), io.StringIO()
+        exit_code = 0
+        saved_argv, saved_stdin = sys.argv, sys.stdin
+        # argparse takes the program name of usage and version output from argv[0]
+        sys.argv = [tool] + args
+        # never read the stdin of the daemon, clients run queries reading stdin themselves
+        sys.stdin = io.StringIO()
+        try:
+            os.chdir(cwd)
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    self._main(tool, args)
+                except SystemExit as e:
+                    # same exit status and message as the interpreter would give
+                    if e.code is None:
+                        exit_code = 0
+                    elif isinstance(e.code, int):
+                        exit_code = e.code
+                    else:
+                        print(e.code, file=sys.stderr)
+                        exit_code = 1
+                # a bug of the tool must not stop the daemon, it is reported like the
+                # interpreter would do
+                except Exception:  # pylint: disable=W0718
+                    traceback.print_exc()
+                    exit_code = 1
+        except OSError as e:
+            print('%s: %s' % (tool, e), file=stderr)
+            exit_code = 1
+        finally:
+            sys.argv, sys.stdin = saved_argv, saved_stdin
+        return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'exit': exit_code}
+
+    def serve(self, path):
+        if os.path.exists(path):
+            if request({'ping': True}, path) is not None:
+                print('sof-query daemon is already running on %s' % path)
+                return 1
+            # stale socket left by a killed daemon
+            os.unlink(path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(path)
+            os.chmod(path, 0o600)
+            server.listen()
+            try:
+                while True:
+                    conn, _ = server.accept()
+                    try:
+                        with conn:
+                            try:
+                                req = marshal.loads(recv_all(conn))
+                            except (EOFError, ValueError, TypeError):
+                                continue
+                            error = check_request(req)
+                            if error is not None:
+                                conn.sendall(marshal.dumps({'stdout': '', 'stderr': 'sof-query: %s\n' % error, 'exit': 2}))
+                                continue
+                            if req.get('stop'):
+                                conn.sendall(marshal.dumps({}))
+                                break
+                            if req.get('ping'):
+                                conn.sendall(marshal.dumps({}))
+                                continue
+                            reply = self.run(req['tool'], req['args'], req['cwd'])
+                            conn.sendall(marshal.dumps(reply))
+                    except OSError:
+                        # the client is gone before the reply, eg. killed by timeout or Ctrl-C
+                        continue
+            finally:
+                os.unlink(path)
+        return 0
+
+# return why req is not a valid request, or None if it is
+def check_request(req):
+    if not isinstance(req, dict):
+        return 'invalid request'
+    if req.get('stop') or req.get('ping'):
+        return None
+    if not isinstance(req.get('args'), list) or not all(isinstance(arg, str) for arg in req['args']) \
+            or not isinstance(req.get('cwd'), str):
+        return 'invalid request'
+    if req.get('tool') not in TOOLS:
+        return 'unknown tool %s' % req.get('tool')
+    return None
+
+# whether the query reads the stdin of the client, which the daemon can't read
+def reads_stdin(tool, args):
+    if tool != 'sof-tplgreader.py':
+        return False
+    for idx, arg in enumerate(args):
+        if arg in ['-Q-', '--query-file=-']:
+            return True
+        if arg in ['-Q', '--query-file'] and args[idx + 1:idx + 2] == ['-']:
+            return True
+    return False
+
+def client(tool, args):
+    if tool not in TOOLS:
+        print('Unknown tool %s, supported tools: %s' % (tool, ' '.join(TOOLS)), file=sys.stderr)
+        return 2
+    reply = None
+    if not reads_stdin(tool, args):
+        reply = request({'tool': tool, 'args': args, 'cwd': os.getcwd()})
+    if reply is None:
+        # no daemon, or the query reads stdin, run the tool itself
+        tool_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), tool)
+        os.execv(tool_path, [tool_path] + args)
+    sys.stdout.write(reply['stdout'])
+    sys.stderr.write(reply['stderr'])
+    return reply['exit']
+
+def main():
+    # argparse is not used here, as importing it costs more than the whole client
+    if len(sys.argv) < 2 or sys.argv[1] in ['-h', '--help']:
+        print(__doc__.strip())
+        return 0 if len(sys.argv) > 1 else 2
+    if sys.argv[1] == '--daemon':
+        return QueryDaemon().serve(socket_path())
+    if sys.argv[1] == '--stop':
+        return 0 if request({'stop': True}) is not None else 1
+    return client(sys.argv[1], sys.argv[2:])
+
+if __name__ == '__main__':
+    sys.exit(main())
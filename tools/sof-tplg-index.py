@@ -0,0 +1,244 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Index the PCMs, widgets and DAI links of every topology under a directory,
+and search the index instead of parsing all the topologies again.
+
+The index is updated incrementally before each search: only topologies whose
+size or mtime changed since the last update are parsed again.
+
+Usage:
+    sof-tplg-index.py update -t ROOT
+    sof-tplg-index.py search -t ROOT KIND [[~]KEY:VALUE[,VALUE] ...]
+
+Examples:
+    topologies with a SMART_AMP widget:
+        sof-tplg-index.py search -t ROOT -l widget comp:SMART_AMP
+    PCMs supporting S32_LE at 96 kHz:
+        sof-tplg-index.py search -t ROOT pcm fmt:S32_LE rate:96000
+"""
+
+import os
+import re
+import sys
+import pickle
+import struct
+import hashlib
+import argparse
+import tempfile
+import tplgtool
+from tplgtool import TplgParser, TplgFormatter, TplgError, parallel_map
+from common import format_pipeline
+
+# bump when the index format changes, older indexes are rebuilt
+INDEX_VERSION = 1
+
+# searchable record kinds and their keys, in output order. The index keeps records
+# as tuples of these fields, except tplg which is the topology the record is from.
+KINDS = {
+    'pcm': ['tplg', 'pcm', 'id', 'type', 'fmts', 'rate_min', 'rate_max', 'ch_min', 'ch_max'],
+    'widget': ['tplg', 'name', 'comp', 'sname', 'type'],
+    'link': ['tplg', 'name', 'stream_name', 'id'],
+}
+
+# keys matched against a range of pcm record fields
+RANGE_KEYS = {'rate': ('rate_min', 'rate_max'), 'ch': ('ch_min', 'ch_max')}
+
+# component type of a widget, the name without instance numbers, eg SMART_AMP for SMART_AMP1.0
+COMP_RE = re.compile(r'[A-Za-z_]*[A-Za-z]')
+
+def default_index_path(tplg_root):
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    root_hash = hashlib.sha1(os.path.abspath(tplg_root).encode()).hexdigest()[:16]
+    return os.path.join(cache_home, "sof-test", "tplg-index-%s.pickle" % root_hash)
+
+# the index is stale once the code producing it changes
+def code_version():
+    version = (INDEX_VERSION,)
+    for code_file in [tplgtool.__file__, __file__]:
+        code_stat = os.stat(code_file)
+        version += (code_stat.st_size, code_stat.st_mtime_ns)
+    return version
+
+# return the records of one topology, or the error parsing it, may run in a worker
+# process of parallel_map
+def index_tplg(tplg_path):
+    entry = {kind: [] for kind in KINDS}
+    entry['error'] = None
+    try:
+        with TplgParser().parse_lazy(tplg_path) as tplg:
+            for block in tplg.blocks("pcm"):
+                for pcm in block["pcm"]:
+                    fmts = TplgFormatter.get_pcm_fmt(pcm)
+                    # one record for each direction of the PCM
+                    for direction, stream_type in enumerate(['playback', 'capture']):
+                        if pcm[stream_type] != 1:
+                            continue
+                        cap = pcm["caps"][direction]
+                        entry['pcm'].append((pcm["pcm_name"], pcm["pcm_id"], stream_type, " ".join(fmts[direction]),
+                            cap["rate_min"], cap["rate_max"], cap["channels_min"], cap["channels_max"]))
+            for block in tplg.blocks("widget"):
+                for widget in block["widget"]:
+                    comp = COMP_RE.match(widget["name"])
+                    entry['widget'].append((widget["name"], comp.group() if comp else '', widget["sname"], widget["id"]))
+            for block in tplg.blocks("link"):
+                for link in block["link"]:
+                    entry['link'].append((link["name"], link["stream_name"], link["id"]))
+    except (TplgError, struct.error, OSError) as e:
+        # recorded as a failed entry, the other topologies are still indexed
+        entry = {kind: [] for kind in KINDS}
+        entry['error'] = str(e)
+    return entry
+
+class clsTplgIndex:
+    def __init__(self, tplg_root, index_path=None):
+        self._root = os.path.abspath(tplg_root)
+        self._path = index_path or default_index_path(tplg_root)
+        self._files = {}
+
+    def load(self):
+        try:
+            with open(self._path, "rb") as fd:
+                index = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            # missing, truncated or stale index, it is built again
+            return
+        if not isinstance(index, dict):
+            return
+        if index.get('version') == code_version() and index.get('root') == self._root:
+            self._files = index['files']
+
+    def save(self):
+        index = {'version': code_version(), 'root': self._root, 'files': self._files}
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        # write to a temporary file and rename it, so readers never see a partial index
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self._path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            pickle.dump(index, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path)
+
+    # bring the index up to date with the topologies under the root, parse only the
+    # new and changed ones, in jobs processes. Return the number of parsed topologies.
+    def update(self, jobs=1):
+        stats = {}
+        for dirpath, _, files in os.walk(self._root):
+            for name in files:
+                if name.endswith(".tplg"):
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    stats[os.path.relpath(path, self._root)] = (stat.st_size, stat.st_mtime_ns)
+        changed = sorted(rel for rel, stat in stats.items()
+            if rel not in self._files or self._files[rel]['stat'] != stat)
+        removed = [rel for rel in self._files if rel not in stats]
+        if not changed and not removed:
+            return 0
+        for rel in removed:
+            del self._files[rel]
+        entries = parallel_map(index_tplg, [os.path.join(self._root, rel) for rel in changed], jobs)
+        for rel, entry in zip(changed, entries):
+            entry['stat'] = stats[rel]
+            self._files[rel] = entry
+        self.save()
+        return len(changed)
+
+    # return (path, error) of the topologies which could not be indexed
+    def errors(self):
+        return [(os.path.join(self._root, rel), self._files[rel]['error'])
+            for rel in sorted(self._files) if self._files[rel]['error'] is not None]
+
+    # return records of kind matching all terms, a term is [~]key:value[,value], a value
+    # matches like sof-tplgreader filters, 'keyword' or 'keyword [0-9]', ~ negates the term.
+    # rate:N and ch:N match records whose range contains N.
+    def search(self, kind, terms):
+        matchers = [self._compileTerm(kind, term) for term in terms]
+        records = []
+        for rel in sorted(self._files):
+            for record in self._files[rel][kind]:
+                if all(matcher(record) for matcher in matchers):
+                    records.append(dict(zip(KINDS[kind], (os.path.join(self._root, rel),) + record)))
+        return records
+
+    @staticmethod
+    def _compileTerm(kind, term):
+        key, _, value = term.partition(':')
+        key = key.strip()
+        negated = key.startswith('~')
+        if negated:
+            key = key[1:]
+        values = [em.strip() for em in value.split(',')]
+        # position of a key in the record tuples
+        fields = {field: idx for idx, field in enumerate(KINDS[kind][1:])}
+        if kind == 'pcm' and key in RANGE_KEYS:
+            low, high = [fields[field] for field in RANGE_KEYS[key]]
+            numbers = [int(em) for em in values]
+            match = lambda record: any(record[low] <= number <= record[high] for number in numbers)
+        else:
+            # 'fmt' is short for 'fmts', a value matches any of the formats
+            if key == 'fmt' and kind == 'pcm':
+                key = 'fmts'
+            if key not in fields:
+                valid_keys = list(fields) + (list(RANGE_KEYS) if kind == 'pcm' else [])
+                raise ValueError("unknown %s key '%s', expect one of %s" % (kind, key, ', '.join(valid_keys)))
+            regexes = [re.compile(em + '$|' + em + '[^a-zA-Z]', re.I) for em in values]
+            idx = fields[key]
+            words = key == 'fmts'
+            def match(record):
+                texts = str(record[idx]).split() if words else [str(record[idx])]
+                return any(regex.match(text) for regex in regexes for text in texts)
+        if negated:
+            return lambda record: not match(record)
+        return match
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n\n')[0],
+        formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--version', action='version', version='%(prog)s 1.0')
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-t', '--tplgroot', type=str, required=True, help="topology directory to index")
+    common.add_argument('-i', '--index', type=str, help="index file, default is under $XDG_CACHE_HOME/sof-test")
+    common.add_argument('-j', '--jobs', type=int, default=1,
+        help="number of topologies to parse in parallel, 0 for one per CPU")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('update', parents=[common], help="update the index")
+    search_parser = subparsers.add_parser('search', parents=[common], formatter_class=argparse.RawTextHelpFormatter,
+        help="update the index and print the matching records",
+        description="keys of each kind:\n" + "\n".join("  %s: %s" % (kind, " ".join(keys[1:]))
+            for kind, keys in KINDS.items()) + "\n  pcm: fmt, rate and ch, eg rate:96000 or ch:2")
+    search_parser.add_argument('kind', choices=list(KINDS.keys()))
+    search_parser.add_argument('terms', nargs='*', help="[~]KEY:VALUE[,VALUE], all terms must match")
+    search_parser.add_argument('-l', '--list', action='store_true', help="only list the matching topologies")
+    search_parser.add_argument('-c', '--count', action='store_true', help="only print the number of matches")
+    search_parser.add_argument('-n', '--no-update', action='store_true', help="search the index as it is")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.tplgroot):
+        print("path %s not exist!" % args.tplgroot)
+        sys.exit(1)
+    index = clsTplgIndex(args.tplgroot, args.index)
+    index.load()
+    if args.command == 'update':
+        print("%d topologies parsed" % index.update(args.jobs))
+        for path, error in index.errors():
+            print("%s: %s" % (path, error))
+        return
+    if not args.no_update:
+        index.update(args.jobs)
+    try:
+        records = index.search(args.kind, args.terms)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.list:
+        tplgs = sorted({record['tplg'] for record in records})
+        print(len(tplgs) if args.count else "\n".join(tplgs))
+    elif args.count:
+        print(len(records))
+    else:
+        for record in records:
+            print(format_pipeline(record))
+
+if __name__ == "__main__":
+    main()
@@ -3,16 +3,121 @@
 import subprocess
 import os
 import re
-from tplgtool import TplgParser, TplgFormatter
-from common import format_pipeline, export_pipeline
+import sys
+import struct
+from tplgtool import TplgParser, TplgFormatter, TplgCache, TplgError, parallel_map
+from common import format_pipeline, export_pipeline, shell_quote, print_json
+
+# filter compiled from the dict of parse_filter, items are grouped into '|' separated
+# terms of '&' joined items, so & binds tighter than |. Each item is evaluated once
+# for all pipelines to a bitset of matching pipeline indexes.
+class clsPipelineFilter:
+    # compiled regexes of filter values, shared by all filters
+    _regex_cache = {}
+
+    def __init__(self, filter_dict):
+        # list of terms, each term a list of (key, negated, regexes) items,
+        # regexes is None for 'key:any' items which only check the key is present
+        self._terms = []
+        if not filter_dict:
+            return
+        term = []
+        ops = [None] + filter_dict['op']
+        for op, item in zip(ops, filter_dict['filter']):
+            if op == '|':
+                self._terms.append(term)
+                term = []
+            for key, value in item.items():
+                term.append(self._compileItem(key, value))
+        self._terms.append(term)
+
+    @classmethod
+    def _compileItem(cls, key, value):
+        negated = key.startswith('~')
+        if negated:
+            key = key[1:]
+        if 'any' in value or value == ['']:
+            return key, negated, None
+        regexes = []
+        for em in value:
+            if em not in cls._regex_cache:
+                # match for 'keyword'/'keyword [0-9]' target line
+                cls._regex_cache[em] = re.compile(em + '$|' + em + '[^a-zA-Z]', re.I)
+            regexes.append(cls._regex_cache[em])
+        return key, negated, tuple(regexes)
+
+    # bitset of the pipelines matching item, memo keeps the bitsets
+    # already computed for pipeline_lst
+    @staticmethod
+    def _itemBits(pipeline_lst, item, memo):
+        if item in memo:
+            return memo[item]
+        key, negated, regexes = item
+        if regexes is None:
+            flags = [key in line for line in pipeline_lst]
+        else:
+            # pipelines without the key don't match
+            flags = [key in line and any(regex.match(str(line[key])) for regex in regexes)
+                for line in pipeline_lst]
+        # bit i is pipeline i, lowest bit first
+        bits = int('0' + ''.join('0' if flag is negated else '1' for flag in reversed(flags)), 2)
+        memo[item] = bits
+        return bits
+
+    @staticmethod
+    def indexes(bits):
+        return [idx for idx, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
+
+    def _termBits(self, pipeline_lst, term, memo):
+        bits = (1 << len(pipeline_lst)) - 1
+        for item in term:
+            bits &= self._itemBits(pipeline_lst, item, memo)
+        return bits
+
+    # bitset of all pipelines matching the filter
+    def bits(self, pipeline_lst, memo):
+        bits = 0
+        for term in self._terms or [[]]:
+            bits |= self._termBits(pipeline_lst, term, memo)
+        return bits
+
+    # indexes of the pipelines matching the filter: the ones matching the first
+    # term in pipeline order, followed by the ones only matching later terms.
+    # Like a list union, a later term doesn't add a pipeline equal to one already
+    # in the result, as the same pipeline can come from several topologies.
+    def evaluate(self, pipeline_lst, memo):
+        idx_lst = []
+        bits = 0
+        seen = set()
+        for term_idx, term in enumerate(self._terms or [[]]):
+            term_bits = self._termBits(pipeline_lst, term, memo)
+            if len(self._terms) > 1:
+                for idx in self.indexes(term_bits & ~bits):
+                    line_key = frozenset(pipeline_lst[idx].items())
+                    if term_idx == 0 or line_key not in seen:
+                        idx_lst.append(idx)
+                    seen.add(line_key)
+            else:
+                idx_lst.extend(self.indexes(term_bits))
+            bits |= term_bits
+        return idx_lst
 
 class clsTPLGReader:
-    def __init__(self):
+    # pipeline fields found by searching components in the topology graph
+    comp_fields = ['pga', 'eq', 'kpbm', 'asrc', 'codec_adapter', 'echo', 'smart_amp']
+
+    # pipelines loaded from each topology are cached in cache, a TplgCache, if it is not None
+    def __init__(self, cache=None):
+        self._cache = cache
         self._pipeline_lst = []
         self._output_lst = []
         self._field_lst = []
         self._filter_dict = {}
         self._block_lst = []
+        # compiled filter and block items
+        self._filter = clsPipelineFilter({})
+        self._blocks = []
+        self._output_idx = []
 
     def __comp_pipeline(self, pipeline):
         return int(pipeline['id'])
@@ -27,73 +132,88 @@ class clsTPLGReader:
             comp_names = [i['name'] for i in comp]
             pipeline_dict[comp_name.lower()] = " ".join(comp_names)
 
+    # the topology graph, and so widget blocks, only need decoding when component
+    # fields are dumped or used by a filter or block item
+    def needCompField(self):
+        if len(self._field_lst) == 0:
+            return True
+        keys = [key.lower() for key in self._field_lst]
+        for filter_dict in [self._filter_dict] + self._block_lst:
+            if not filter_dict:
+                continue
+            for item in filter_dict['filter']:
+                keys.extend([key.lstrip('~').lower() for key in item.keys()])
+        return len([key for key in keys if key in self.comp_fields]) > 0
+
     # fork & split from TplgFormatter
-    def loadFile(self, filename, sofcard=0):
+    # return the pipelines of the topology filename
+    def _loadPipeline(self, filename, sofcard, find_comp):
+        pipeline_lst = []
         tplg_parser = TplgParser()
-        parsed_tplg = tplg_parser.parse(filename)
-        formatter = TplgFormatter(parsed_tplg)
-        # ignore the last element, it is tplg name
-        for item in parsed_tplg[:-1]:
-            if "pcm" not in item:
-                continue
-            for pcm in item['pcm']:
-                pcm_type = TplgFormatter.get_pcm_type(pcm)
-                # if we find None type pcm, there must be errors in topology
-                if pcm_type == "None":
-                    print("type of %s is neither playback nor capture, please check your"
-                        "topology source file" % pcm["pcm_name"])
-                    exit(1)
-                pgas = formatter.find_comp_for_pcm(pcm, 'PGA')
-                eqs = formatter.find_comp_for_pcm(pcm, 'EQ')
-                kwds = formatter.find_comp_for_pcm(pcm, 'KPBM')
-                asrcs = formatter.find_comp_for_pcm(pcm, 'ASRC')
-                codec_adapters = formatter.find_comp_for_pcm(pcm, 'CODEC_ADAPTER')
-                pipeline_dict = {}
-                pipeline_dict['pcm'] = pcm["pcm_name"]
-                pipeline_dict['id'] = str(pcm["pcm_id"])
-                pipeline_dict['type'] = TplgFormatter.get_pcm_type(pcm)
-                cap = pcm["caps"][pcm['capture']]
-                pipeline_dict['cap_name'] = cap['name']
-                # acquire component from pipeline graph, and add to pipeline dict
-                clsTPLGReader.attach_comp_to_pipeline(pgas, pcm['capture'], "PGA", pipeline_dict)
-                clsTPLGReader.attach_comp_to_pipeline(eqs, pcm['capture'], "EQ", pipeline_dict)
-                clsTPLGReader.attach_comp_to_pipeline(kwds, pcm['capture'], "KPBM", pipeline_dict)
-                clsTPLGReader.attach_comp_to_pipeline(asrcs, pcm['capture'], "ASRC", pipeline_dict)
-                clsTPLGReader.attach_comp_to_pipeline(codec_adapters, pcm['capture'], "CODEC_ADAPTER", pipeline_dict)
-                # supported formats of playback pipeline in formats[0]
-                # supported formats of capture pipeline in formats[1]
-                formats = TplgFormatter.get_pcm_fmt(pcm)
-                # if capture is present, pcm['capture'] = 1, otherwise, pcm['capture'] = 0,
-                # same thing for pcm['playback']
-                pipeline_dict['fmts'] = " ".join(formats[pcm['capture']])
-                # use the first supported format for test
-                pipeline_dict['fmt'] = pipeline_dict['fmts'].split(' ')[0]
-                pipeline_dict['rate_min'], pipeline_dict['rate_max'] = self._key2str(cap, 'rate')
-                pipeline_dict['ch_min'], pipeline_dict['ch_max'] = self._key2str(cap, 'channels')
-                # for pcm with both playback and capture capabilities, we can extract two pipelines.
-                # the paramters for capture pipeline is filled above, and the parameters for playback
-                # pipeline is filled below.
-                if pcm_type == "both":
-                    pipeline_dict["type"] = "capture"
-                    # copy pipeline and change values
-                    pb_pipeline_dict = pipeline_dict.copy()
-                    pb_pipeline_dict["type"] = "playback"
-                    cap = pcm["caps"][0]
-                    pb_pipeline_dict['cap_name'] = cap['name']
-                    # with index = 0, we get parameters from playback pipeline
-                    clsTPLGReader.attach_comp_to_pipeline(pgas, 0, "PGA", pb_pipeline_dict)
-                    clsTPLGReader.attach_comp_to_pipeline(eqs, 0, "EQ", pb_pipeline_dict)
-                    clsTPLGReader.attach_comp_to_pipeline(asrcs, 0, "ASRC", pb_pipeline_dict)
-                    clsTPLGReader.attach_comp_to_pipeline(codec_adapters, 0, "CODEC_ADAPTER", pb_pipeline_dict)
-                    pb_pipeline_dict["fmts"] = " ".join(formats[0])
-                    pb_pipeline_dict['fmt'] = pb_pipeline_dict['fmts'].split(' ')[0]
-                    pb_pipeline_dict['rate_min'], pb_pipeline_dict['rate_max'] = self._key2str(cap, 'rate')
-                    pb_pipeline_dict['ch_min'], pb_pipeline_dict['ch_max'] = self._key2str(cap, 'channels')
-                    self._pipeline_lst.append(pb_pipeline_dict)
-                self._pipeline_lst.append(pipeline_dict)
+        # the topology file is unmapped once its pipelines are extracted
+        with tplg_parser.parse_lazy(filename) as parsed_tplg:
+            formatter = TplgFormatter(parsed_tplg)
+            for item in parsed_tplg.blocks("pcm"):
+                for pcm in item['pcm']:
+                    pcm_type = TplgFormatter.get_pcm_type(pcm)
+                    # if we find None type pcm, there must be errors in topology
+                    if pcm_type == "None":
+                        raise TplgError("type of %s is neither playback nor capture, please check your"
+                            "topology source file" % pcm["pcm_name"])
+                    if find_comp:
+                        pgas = formatter.find_comp_for_pcm(pcm, 'PGA')
+                        eqs = formatter.find_comp_for_pcm(pcm, 'EQ')
+                        kwds = formatter.find_comp_for_pcm(pcm, 'KPBM')
+                        asrcs = formatter.find_comp_for_pcm(pcm, 'ASRC')
+                        codec_adapters = formatter.find_comp_for_pcm(pcm, 'CODEC_ADAPTER')
+                    else:
+                        pgas = eqs = kwds = asrcs = codec_adapters = [[], []]
+                    pipeline_dict = {}
+                    pipeline_dict['pcm'] = pcm["pcm_name"]
+                    pipeline_dict['id'] = str(pcm["pcm_id"])
+                    pipeline_dict['type'] = TplgFormatter.get_pcm_type(pcm)
+                    cap = pcm["caps"][pcm['capture']]
+                    pipeline_dict['cap_name'] = cap['name']
+                    # acquire component from pipeline graph, and add to pipeline dict
+                    clsTPLGReader.attach_comp_to_pipeline(pgas, pcm['capture'], "PGA", pipeline_dict)
+                    clsTPLGReader.attach_comp_to_pipeline(eqs, pcm['capture'], "EQ", pipeline_dict)
+                    clsTPLGReader.attach_comp_to_pipeline(kwds, pcm['capture'], "KPBM", pipeline_dict)
+                    clsTPLGReader.attach_comp_to_pipeline(asrcs, pcm['capture'], "ASRC", pipeline_dict)
+                    clsTPLGReader.attach_comp_to_pipeline(codec_adapters, pcm['capture'], "CODEC_ADAPTER", pipeline_dict)
+                    # supported formats of playback pipeline in formats[0]
+                    # supported formats of capture pipeline in formats[1]
+                    formats = TplgFormatter.get_pcm_fmt(pcm)
+                    # if capture is present, pcm['capture'] = 1, otherwise, pcm['capture'] = 0,
+                    # same thing for pcm['playback']
+                    pipeline_dict['fmts'] = " ".join(formats[pcm['capture']])
+                    # use the first supported format for test
+                    pipeline_dict['fmt'] = pipeline_dict['fmts'].split(' ')[0]
+                    pipeline_dict['rate_min'], pipeline_dict['rate_max'] = self._key2str(cap, 'rate')
+                    pipeline_dict['ch_min'], pipeline_dict['ch_max'] = self._key2str(cap, 'channels')
+                    # for pcm with both playback and capture capabilities, we can extract two pipelines.
+                    # the paramters for capture pipeline is filled above, and the parameters for playback
+                    # pipeline is filled below.
+                    if pcm_type == "both":
+                        pipeline_dict["type"] = "capture"
+                        # copy pipeline and change values
+                        pb_pipeline_dict = pipeline_dict.copy()
+                        pb_pipeline_dict["type"] = "playback"
+                        cap = pcm["caps"][0]
+                        pb_pipeline_dict['cap_name'] = cap['name']
+                        # with index = 0, we get parameters from playback pipeline
+                        clsTPLGReader.attach_comp_to_pipeline(pgas, 0, "PGA", pb_pipeline_dict)
+                        clsTPLGReader.attach_comp_to_pipeline(eqs, 0, "EQ", pb_pipeline_dict)
+                        clsTPLGReader.attach_comp_to_pipeline(asrcs, 0, "ASRC", pb_pipeline_dict)
+                        clsTPLGReader.attach_comp_to_pipeline(codec_adapters, 0, "CODEC_ADAPTER", pb_pipeline_dict)
+                        pb_pipeline_dict["fmts"] = " ".join(formats[0])
+                        pb_pipeline_dict['fmt'] = pb_pipeline_dict['fmts'].split(' ')[0]
+                        pb_pipeline_dict['rate_min'], pb_pipeline_dict['rate_max'] = self._key2str(cap, 'rate')
+                        pb_pipeline_dict['ch_min'], pb_pipeline_dict['ch_max'] = self._key2str(cap, 'channels')
+                        pipeline_lst.append(pb_pipeline_dict)
+                    pipeline_lst.append(pipeline_dict)
 
         # format pipeline, this change for script direct access 'rate' 'channel' 'dev' 'snd'
-        for pipeline in self._pipeline_lst:
+        for pipeline in pipeline_lst:
             #pipeline['fmt']=pipeline['fmt'].upper().replace('LE', '_LE')
             pipeline['rate'] = pipeline['rate_min'] if int(pipeline['rate_min']) != 0 else pipeline['rate_max']
             pipeline['channel'] = pipeline['ch_min']
@@ -108,41 +228,42 @@ class clsTPLGReader:
         # find interweaved pipelines
         # echo: echo reference pipelines
         # smart_amp: dsm pipelines
-        interweaved_comps = ['echo', 'smart_amp']
+        interweaved_comps = ['echo', 'smart_amp'] if find_comp else []
         for comp in interweaved_comps:
             interweaved_dict = formatter.find_interweaved_pipeline(comp)
             if interweaved_dict:
-                for pipeline in self._pipeline_lst:
+                for pipeline in pipeline_lst:
                     if pipeline['cap_name'] in interweaved_dict['sname']:
                         pipeline[comp] = interweaved_dict[comp]
+        return pipeline_lst
+
+    # return the pipelines of the topology filename, from the cache when possible
+    def readFile(self, filename, sofcard=0, find_comp=True):
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache.key(filename, "pipeline", sofcard, find_comp,
+                os.stat(__file__).st_mtime_ns)
+            pipeline_lst = self._cache.load(cache_key)
+            if pipeline_lst is not None:
+                return pipeline_lst
+        pipeline_lst = self._loadPipeline(filename, sofcard, find_comp)
+        if cache_key is not None:
+            self._cache.store(cache_key, pipeline_lst)
+        return pipeline_lst
+
+    # find_comp defaults to whether the current dump fields, filter and block items
+    # need component fields
+    def loadFile(self, filename, sofcard=0, find_comp=None):
+        if find_comp is None:
+            find_comp = self.needCompField()
+        self.addPipeline(self.readFile(filename, sofcard, find_comp))
         return 0
 
-    @staticmethod
-    def list_and(lst1, lst2):
-        assert(lst1 is not None and lst2 is not None)
-        output_lst = []
-        for elem in lst1:
-            if elem in lst2:
-                output_lst.append(elem)
-        return output_lst
-
-    @staticmethod
-    def list_or(lst1, lst2):
-        assert(lst1 is not None and lst2 is not None)
-        output_lst = lst1.copy()
-        for elem in lst2:
-            if elem not in output_lst:
-                output_lst.append(elem)
-        return output_lst
+    def addPipeline(self, pipeline_lst):
+        self._pipeline_lst.extend(pipeline_lst)
 
-    @staticmethod
-    def list_diff(lst1, lst2):
-        assert(lst1 is not None and lst2 is not None)
-        output_lst = []
-        for elem in lst1:
-            if elem not in lst2:
-                output_lst.append(elem)
-        return output_lst
+    def clearPipeline(self):
+        self._pipeline_lst = []
 
     def _setlist(self, orig_lst):
         tmp_lst = []
@@ -157,56 +278,18 @@ class clsTPLGReader:
 
     def setFilter(self, filter_dict=None):
         self._filter_dict = filter_dict
+        self._filter = clsPipelineFilter(filter_dict)
 
     def setField(self, field_lst):
         self._field_lst = self._setlist(field_lst)[:]
 
     def setBlock(self, block_lst=None):
         self._block_lst = block_lst
+        self._blocks = [clsPipelineFilter(block_dict) for block_dict in block_lst or []]
 
-    def _filterOutput(self, target_lst, filter_dict, bIn):
-        filtered = []
-        for line in target_lst[:]:
-            check = False
-            for key, value in filter_dict.items():
-                if 'any' in value or value == ['']:
-                    check = True if key in line.keys() else False
-                else:
-                    # match for 'keyword'/'keyword [0-9]' target line
-                    check = len ([em for em in value if re.match(em + '$|' + em + '[^a-zA-Z]', str(line[key]), re.I)]) > 0
-                if check is bIn:
-                    break
-            else:
-                filtered.append(line)
-        return filtered
-
-    def _filter_by_dict(self, filter_dict):
-        if filter_dict == {}:
-            return self._pipeline_lst
-        full_list = self._pipeline_lst
-        filtered = None
-        # pipelines filtered by the first filter item
-        for key, value in filter_dict['filter'][0].items():
-            if key.startswith('~'):
-                filtered = self._filterOutput(full_list, {key[1:]:value}, True)
-            else:
-                filtered = self._filterOutput(full_list, {key:value}, False)
-        # do filtering by the rest filter items and logic operations
-        for idx in range(1, len(filter_dict['filter'])):
-            new_filtered = None
-            for key, value in filter_dict['filter'][idx].items():
-                if key.startswith("~"):
-                    new_filtered = self._filterOutput(full_list, {key[1:]:value} , True)
-                else:
-                    new_filtered = self._filterOutput(full_list, {key:value}, False)
-            if filter_dict['op'][idx-1] == '&':
-                filtered = self.list_and(filtered, new_filtered)
-            if filter_dict['op'][idx-1] == '|':
-                filtered = self.list_or(filtered, new_filtered)
-        return filtered
-
-    def _filterKeyword(self):
-        self._output_lst = self._filter_by_dict(self._filter_dict)
+    # memo keeps the bitsets of filter items shared by the filter and block items
+    def _filterKeyword(self, memo):
+        self._output_idx = self._filter.evaluate(self._pipeline_lst, memo)
 
     def _filterField(self):
         if len(self._field_lst) == 0:
@@ -220,13 +303,14 @@ class clsTPLGReader:
                     tmp_dict[field]=pipeline[field]
             self._output_lst.append(tmp_dict)
 
-    def _blockKeyword(self):
-        if len(self._block_lst) == 0:
+    def _blockKeyword(self, memo):
+        if len(self._blocks) == 0:
             return
-        filtered = []
-        for block_dict in self._block_lst:
-            filtered.extend(self._filter_by_dict(block_dict))
-        self._output_lst = clsTPLGReader.list_diff(self._output_lst, filtered)
+        blocked = 0
+        for block in self._blocks:
+            blocked |= block.bits(self._pipeline_lst, memo)
+        blocked_idx = set(clsPipelineFilter.indexes(blocked))
+        self._output_idx = [idx for idx in self._output_idx if idx not in blocked_idx]
 
     def sortPipeline(self):
         if len(self._pipeline_lst) != 0:
@@ -235,55 +319,115 @@ class clsTPLGReader:
             self._output_lst.sort(key=self.__comp_pipeline)
 
     def getPipeline(self, sort=False):
-        self._output_lst = self._pipeline_lst[:]
-        self._filterKeyword()
-        self._blockKeyword()
+        memo = {}
+        self._filterKeyword(memo)
+        self._blockKeyword(memo)
+        self._output_lst = [self._pipeline_lst[idx] for idx in self._output_idx]
         self._filterField()
         if sort:
             self.sortPipeline()
         return self._output_lst
 
-if __name__ == "__main__":
-
-    def func_getPipeline(tplgObj, tplgName, sdcard_id, sort):
-        if tplgObj.loadFile(tplgName, sdcard_id) != 0:
-            print("tplgreader load file %s failed" %(tplgName))
-            exit(1)
-        return tplgObj.getPipeline(sort)
-
-    # parse filter string into two structures, one is dict list for each filter item,
-    # and another is logic operation list.
-    def parse_filter(filter_str):
-        filter_lst = []
-        op_lst = []
-        for filter_elem in filter_str.split('|'):
-            for item in filter_elem.split('&'):
-                key, _, value = item.partition(':')
-                filter_lst.append({key.strip():value.strip().split(',')})
-        for char in filter_str:
-            if char == '|' or char == "&":
-                op_lst.append(char)
-        return dict(zip(['filter', 'op'], [filter_lst, op_lst]))
-
-    def parse_and_set_block_keyword(block_str, tplgreader):
+# read the pipelines of a topology in a worker process of parallel_map, return
+# the pipelines and None, or None and the error message if the topology is malformed
+# or can't be read, so one bad topology doesn't abort the others
+def read_tplg(job):
+    cache, filename, sofcard, find_comp = job
+    try:
+        return clsTPLGReader(cache).readFile(filename, sofcard, find_comp), None
+    except (TplgError, struct.error, OSError) as e:
+        return None, str(e)
+
+# parse filter string into two structures, one is dict list for each filter item,
+# and another is logic operation list.
+def parse_filter(filter_str):
+    filter_lst = []
+    op_lst = []
+    for filter_elem in filter_str.split('|'):
+        for item in filter_elem.split('&'):
+            key, _, value = item.partition(':')
+            filter_lst.append({key.strip():value.strip().split(',')})
+    for char in filter_str:
+        if char == '|' or char == "&":
+            op_lst.append(char)
+    return dict(zip(['filter', 'op'], [filter_lst, op_lst]))
+
+# command line entry, argv defaults to sys.argv[1:], cache is the TplgCache
+# to use instead of the default one
+def main(argv=None, cache=None):
+    def parse_block_keyword(block_str):
         block_list = []
         block_strs = block_str.split(';')
         block_items = [item.strip() for item in block_strs if item != ""]
         for item in block_items:
             block_list.append(parse_filter(item))
-        tplgreader.setBlock(block_list)
+        return block_list
 
-    import argparse
-
-    parser = argparse.ArgumentParser(description='Warp Tools to mapping tplgreader convert TPLG file.',
-        add_help=True, formatter_class=argparse.RawTextHelpFormatter)
+    # set filter, block items and dump fields of a query to tplgreader
+    def set_query(tplgreader, query_args):
+        # parse and set filter keyword
+        if query_args['filter'] is not None and len(query_args['filter']) > 0:
+            tplgreader.setFilter(parse_filter(query_args['filter']))
+        else:
+            tplgreader.setFilter({})
+
+        # If run general test case on WOV pipeline or ECHO REFERENCE capture pipeline, there will be error
+        # due to no feed data, and they should be blocked in general test case.
+        default_block_keyword = 'kpbm:any;type:capture & echo;'
+        # if no filter or block item is specified, the "block_none" here will help to
+        # block nothing
+        block_str = "block_none"
+        # user specified block items from command line
+        cmd_block_str = query_args['block'].strip() if query_args['block'] is not None else ''
+
+        filter_str = query_args['filter']
+        if filter_str is not None and 'kpbm' not in filter_str and 'echo' not in filter_str:
+            block_str = default_block_keyword + cmd_block_str
+        else:
+            block_str = cmd_block_str if cmd_block_str != '' else block_str
+
+        tplgreader.setBlock(parse_block_keyword(block_str))
+        tplgreader.setField(query_args['dump'])
+
+    # pipelines of a query, file_pipelines holds the pipelines of each topology file
+    def run_query(tplgreader, query_args, file_pipelines):
+        set_query(tplgreader, query_args)
+        tplgreader.clearPipeline()
+        pipeline_lst = []
+        for pipelines in file_pipelines:
+            tplgreader.addPipeline(pipelines)
+            pipeline_lst += tplgreader.getPipeline(query_args['sort'])[:]
+        return pipeline_lst
+
+    # output lines of a query for -c, -i and -v
+    def format_query(pipeline_lst, query_args):
+        if query_args['count'] is True:
+            if query_args['value'] is True:
+                return [str(len(pipeline_lst))]
+            return ["Pipeline Count: %d" % (len(pipeline_lst))]
+        return [format_pipeline(pipeline, query_args['value']) for pipeline in index_query(pipeline_lst, query_args)]
+
+    # -i selects one pipeline of a query for -e, -J and the batch mode
+    def index_query(pipeline_lst, query_args):
+        if query_args['index'] is not None and query_args['index'] < len(pipeline_lst):
+            return [pipeline_lst[query_args['index']]]
+        return pipeline_lst
+
+    # print the result of a query as JSON records, fields are added to each record
+    def json_query(pipeline_lst, query_args, **fields):
+        if query_args['count'] is True:
+            print_json('count', {'count': len(pipeline_lst)}, **fields)
+            return
+        for pipeline in index_query(pipeline_lst, query_args):
+            print_json('pipeline', pipeline, **fields)
 
-    parser.add_argument('filename', type=str, help='tplg file name, multi-tplg file name use "," to split it')
-    parser.add_argument('-s', '--sofcard', type=int, help='sofcard id', default=0)
-    parser.add_argument('-f', '--filter', type=str,
-        help='''setup filter, command line parameter
+    # options which can be given to each query of the batch mode
+    def add_query_arguments(parser):
+        parser.add_argument('-f', '--filter', type=str,
+            help='''setup filter, command line parameter
 string format is 'key':'value','value', the filter
-string support & | and ~ logic operation.
+string support & | and ~ logic operation,
+& binds tighter than |.
 if only care about key, you can use 'key':'any'.
 Example Usage:
 `-f "type:any` -> all pipelines
@@ -292,73 +436,137 @@ Example Usage:
 `-f "pga & eq"` -> pipelines with both EQ and PGA
 `-f "id:3"` -> pipeline whose id is 3
 ''')
-    parser.add_argument('-b', '--block', type=str,
-        help='setup block filter, command line parameter format is the same as -f argument')
-    parser.add_argument('-d', '--dump', type=str, nargs='+', help='Dump target field')
+        parser.add_argument('-b', '--block', type=str,
+            help='setup block filter, command line parameter format is the same as -f argument')
+        parser.add_argument('-d', '--dump', type=str, nargs='+', help='Dump target field')
+        parser.add_argument('-c', '--count', action='store_true', help='Get pipeline count')
+        parser.add_argument('-i', '--index', type=int, help='Get index of pipeline, start with 0')
+        parser.add_argument('-v', '--value', action='store_true', help="Just display the value")
+        parser.add_argument('-o', '--sort', action='store_true', help="sort pipeline by id for the same tplg")
+
+    # parse the batch queries, each one is 'NAME:OPTIONS'
+    def parse_queries(parser, query_strs):
+        query_parser = argparse.ArgumentParser(add_help=False)
+        add_query_arguments(query_parser)
+        queries = []
+        for query_str in query_strs:
+            name, sep, options = query_str.partition(':')
+            name = name.strip()
+            # the name is used as shell variable name
+            if sep == '' or not re.match(r'[A-Za-z_][A-Za-z0-9_]*$', name):
+                parser.error("invalid query '%s', expect NAME:OPTIONS" % query_str)
+            query_parser.prog = name
+            queries.append((name, vars(query_parser.parse_args(shlex.split(options)))))
+        return queries
+
+    import argparse
+    import shlex
+
+    parser = argparse.ArgumentParser(description='Warp Tools to mapping tplgreader convert TPLG file.',
+        add_help=True, formatter_class=argparse.RawTextHelpFormatter)
+
+    parser.add_argument('filename', type=str, help='tplg file name, multi-tplg file name use "," to split it')
+    parser.add_argument('-s', '--sofcard', type=int, help='sofcard id', default=0)
+    add_query_arguments(parser)
     parser.add_argument('-e', '--export', action='store_true',
         help='''export the pipeline to Bash declare -Ax Array
 this option conflicts with other output format option: -c -i -v
-export format:
-PIPELINE_$ID['key']='value' ''')
-    parser.add_argument('-c', '--count', action='store_true', help='Get pipeline count')
-    parser.add_argument('-i', '--index', type=int, help='Get index of pipeline, start with 0')
-    parser.add_argument('-v', '--value', action='store_true', help="Just display the value")
+export format, one line for each pipeline:
+declare -Ag PIPELINE_$ID=([key]='value' ...)''')
+    parser.add_argument('-J', '--json', action='store_true',
+        help='''print one JSON object per line, with all pipeline fields,
+{"record": "pipeline", "pcm": ..., "id": ...}, or with -c
+{"record": "count", "count": N}. In batch mode, each
+object has the name of its query as "query". -v is ignored''')
+    parser.add_argument('-q', '--query', type=str, action='append', default=[],
+        help='''batch mode, run the named query NAME:OPTIONS, can be
+given multiple times, the topology is parsed only once.
+OPTIONS are -f -b -d -c -i -v -o as above. The result
+is printed as Bash code setting shell variables:
+with -c or -v: NAME='output of the query'
+otherwise: NAME_COUNT, NAME_LST and NAME_$ID like -e
+Example Usage:
+-q "CAP_HW:-f 'id:0 & type:capture' -d dev -v"''')
+    parser.add_argument('-Q', '--query-file', type=str,
+        help='batch mode, read NAME:OPTIONS queries line by line from file, "-" for stdin')
     parser.add_argument('-t', '--tplgroot', type=str, help="load file from tplg-root folder")
-    parser.add_argument('-o', '--sort', action='store_true', help="sort pipeline by id for the same tplg")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+        help="number of topologies to parse in parallel, 0 for one per CPU")
     parser.add_argument('--version', action='version', version='%(prog)s 1.0')
 
-    ret_args = vars(parser.parse_args())
+    ret_args = vars(parser.parse_args(argv))
 
-    tplgreader = clsTPLGReader()
-    dump_lst = []
-    pipeline_lst = []
+    tplg_cache = cache if cache is not None else TplgCache.default()
+    tplgreader = clsTPLGReader(tplg_cache)
     tplg_root = ""
 
-    # parse and set filter keyword
-    if ret_args['filter'] is not None and len(ret_args['filter']) > 0:
-        filter_dict = parse_filter(ret_args['filter'])
-        tplgreader.setFilter(filter_dict)
-
-    # If run general test case on WOV pipeline or ECHO REFERENCE capture pipeline, there will be error
-    # due to no feed data, and they should be blocked in general test case.
-    default_block_keyword = 'kpbm:any;type:capture & echo;'
-    # if no filter or block item is specified, the "block_none" here will help to
-    # block nothing
-    block_str = "block_none"
-    # user specified block items from command line
-    cmd_block_str = ret_args['block'].strip() if ret_args['block'] is not None else ''
-
-    if ret_args['filter'] is not None and 'kpbm' not in ret_args['filter'] and 'echo' not in ret_args['filter']:
-        block_str = default_block_keyword + cmd_block_str
+    query_strs = ret_args['query'][:]
+    if ret_args['query_file'] is not None:
+        query_file = sys.stdin if ret_args['query_file'] == '-' else open(ret_args['query_file'], encoding='utf-8')
+        with query_file:
+            query_strs += [line.strip() for line in query_file
+                if line.strip() != '' and not line.strip().startswith('#')]
+    if ret_args['json'] is True and ret_args['export'] is True:
+        parser.error('--json conflicts with --export')
+    batch = ret_args['query'] != [] or ret_args['query_file'] is not None
+    if batch:
+        for option in ['filter', 'block', 'dump', 'export', 'count', 'index', 'value']:
+            if ret_args[option] not in [None, False]:
+                parser.error('--%s conflicts with batch mode -q/-Q' % option)
+        queries = parse_queries(parser, query_strs)
+        for _, query_args in queries:
+            query_args['sort'] = query_args['sort'] or ret_args['sort']
     else:
-        block_str = cmd_block_str if cmd_block_str != '' else block_str
+        queries = [(None, ret_args)]
 
-    parse_and_set_block_keyword(block_str, tplgreader)
-
-    if ret_args['dump'] is not None and len(ret_args['dump']) > 0:
-        dump_lst = ret_args['dump']
-
-    if len(dump_lst) > 0:
-        tplgreader.setField(dump_lst)
+    # parse the topology once for all queries, with the topology graph if any query needs it
+    find_comp = False
+    for _, query_args in queries:
+        set_query(tplgreader, query_args)
+        find_comp = find_comp or tplgreader.needCompField()
 
     if ret_args['tplgroot'] is not None and len(ret_args['tplgroot']) >0:
         tplg_root = ret_args['tplgroot']
 
+    jobs = []
     for f in ret_args['filename'].split(','):
         if len(tplg_root) > 0:
             f = tplg_root + "/" + f
-        pipeline_lst += func_getPipeline(tplgreader, f, ret_args['sofcard'], ret_args['sort'])[:]
-
-    if ret_args['export'] is True:
-        exit(export_pipeline(pipeline_lst))
-
-    if ret_args['count'] is True:
-        if ret_args['value'] is True:
-            print(len(pipeline_lst))
+        jobs.append((tplg_cache, f, ret_args['sofcard'], find_comp))
+    file_pipelines = []
+    errors = []
+    for job, (pipelines, error) in zip(jobs, parallel_map(read_tplg, jobs, ret_args['jobs'])):
+        if error is not None:
+            errors.append("%s: %s" % (job[1], error) if len(jobs) > 1 else error)
+        file_pipelines.append(pipelines)
+    # report every malformed topology, but never print the pipelines of only
+    # part of the topologies, scripts would silently test fewer pipelines
+    if errors:
+        for error in errors:
+            print(error)
+        exit(1)
+
+    if not batch:
+        pipeline_lst = run_query(tplgreader, ret_args, file_pipelines)
+        if ret_args['export'] is True:
+            exit(export_pipeline(pipeline_lst))
+        if ret_args['json'] is True:
+            json_query(pipeline_lst, ret_args)
+            return
+        for line in format_query(pipeline_lst, ret_args):
+            print(line)
+        return
+
+    for name, query_args in queries:
+        pipeline_lst = run_query(tplgreader, query_args, file_pipelines)
+        if ret_args['json'] is True:
+            json_query(pipeline_lst, query_args, query=name)
+        elif query_args['count'] is True or query_args['value'] is True:
+            # same value as NAME=$(sof-tplgreader.py ... OPTIONS) would give
+            value = "\n".join(format_query(pipeline_lst, query_args)).rstrip("\n")
+            print('%s=%s' % (name, shell_quote(value)))
         else:
-            print("Pipeline Count: %d" % (len(pipeline_lst)))
-    elif ret_args['index'] is not None and ret_args['index'] < len(pipeline_lst):
-        print(format_pipeline(pipeline_lst[ret_args['index']], ret_args['value']))
-    else:
-        for pipeline in pipeline_lst:
-            print(format_pipeline(pipeline, ret_args['value']))
+            export_pipeline(index_query(pipeline_lst, query_args), name)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Check the pipeline filter of sof-tplgreader.py against the list based one it replaced
+
+Run with: python3 -m unittest discover -s tools
+"""
+
+import importlib
+import random
+import re
+import unittest
+
+tplgreader = importlib.import_module("sof-tplgreader")
+clsPipelineFilter = tplgreader.clsPipelineFilter
+parse_filter = tplgreader.parse_filter
+
+# the list based filter of clsTPLGReader before clsPipelineFilter, it applies the
+# operators from left to right, '|' appends the pipelines not already in the result
+def old_filter_output(target_lst, filter_dict, bIn):
+    filtered = []
+    for line in target_lst[:]:
+        check = False
+        for key, value in filter_dict.items():
+            if 'any' in value or value == ['']:
+                check = key in line.keys()
+            else:
+                check = len([em for em in value if re.match(em + '$|' + em + '[^a-zA-Z]', str(line[key]), re.I)]) > 0
+            if check is bIn:
+                break
+        else:
+            filtered.append(line)
+    return filtered
+
+def old_filter(pipeline_lst, filter_dict):
+    filtered = []
+    for idx, item in enumerate(filter_dict['filter']):
+        for key, value in item.items():
+            if key.startswith('~'):
+                new_filtered = old_filter_output(pipeline_lst, {key[1:]:value}, True)
+            else:
+                new_filtered = old_filter_output(pipeline_lst, {key:value}, False)
+        if idx == 0:
+            filtered = new_filtered
+        elif filter_dict['op'][idx-1] == '&':
+            filtered = [elem for elem in filtered if elem in new_filtered]
+        else:
+            filtered = filtered.copy()
+            for elem in new_filtered:
+                if elem not in filtered:
+                    filtered.append(elem)
+    return filtered
+
+def new_filter(pipeline_lst, filter_str):
+    pipeline_filter = clsPipelineFilter(parse_filter(filter_str))
+    return [pipeline_lst[idx] for idx in pipeline_filter.evaluate(pipeline_lst, {})]
+
+def pipeline(pipeline_id, pipeline_type, **comps):
+    return {'id': str(pipeline_id), 'type': pipeline_type, 'pcm': 'Port%d' % pipeline_id, **comps}
+
+# the same pipeline appears twice when it comes from two topologies
+PIPELINES = [
+    pipeline(0, 'playback', pga='PGA1.0'),
+    pipeline(1, 'capture', pga='PGA2.0', eq='EQIIR2.0'),
+    pipeline(2, 'playback', eq='EQFIR3.0'),
+    pipeline(3, 'capture', kpbm='KPBM4.0'),
+    pipeline(1, 'capture', pga='PGA2.0', eq='EQIIR2.0'),
+    pipeline(2, 'playback', pga='PGA5.0'),
+    pipeline(0, 'playback', pga='PGA1.0'),
+]
+
+class TestPipelineFilter(unittest.TestCase):
+    def assertSameAsOld(self, filter_str, pipeline_lst=None):
+        if pipeline_lst is None:
+            pipeline_lst = PIPELINES
+        self.assertEqual(new_filter(pipeline_lst, filter_str), old_filter(pipeline_lst, parse_filter(filter_str)),
+            filter_str)
+
+    def test_and_binds_tighter_than_or(self):
+        # type:capture | (pga:any & id:2)
+        self.assertEqual(new_filter(PIPELINES, 'type:capture | pga:any & id:2'),
+            [PIPELINES[1], PIPELINES[3], PIPELINES[4], PIPELINES[5]])
+        # the old filter read it as (type:capture | pga:any) & id:2
+        self.assertEqual(old_filter(PIPELINES, parse_filter('type:capture | pga:any & id:2')), [PIPELINES[5]])
+        # both agree when the '&' items come first
+        self.assertSameAsOld('pga:any & id:2 | type:capture')
+
+    def test_negation(self):
+        self.assertSameAsOld('~pga:any')
+        self.assertSameAsOld('type:playback & ~pga:any')
+        self.assertSameAsOld('~type:capture & ~eq:any | kpbm:any')
+        self.assertEqual(new_filter(PIPELINES, '~type:playback & ~kpbm:any'), [PIPELINES[1], PIPELINES[4]])
+
+    def test_or_dedup(self):
+        # the duplicates matching the first term are kept, a later term doesn't add
+        # a pipeline equal to one already in the result
+        self.assertEqual(new_filter(PIPELINES, 'type:capture | eq:any | pga:any'),
+            [PIPELINES[1], PIPELINES[3], PIPELINES[4], PIPELINES[2], PIPELINES[0], PIPELINES[5]])
+        self.assertSameAsOld('type:capture | eq:any | pga:any')
+        self.assertSameAsOld('id:2 | id:0 | id:0,2')
+
+    def test_missing_key(self):
+        # pipelines without the key don't match a value of it
+        self.assertEqual(new_filter(PIPELINES, 'eq:EQIIR'), [PIPELINES[1], PIPELINES[4]])
+        self.assertEqual(new_filter(PIPELINES, '~pga:PGA1'), [PIPELINES[1], PIPELINES[2], PIPELINES[3],
+            PIPELINES[4], PIPELINES[5]])
+
+    def test_random_filters(self):
+        rng = random.Random(0)
+        # the old filter raised KeyError on the values of a key missing from a pipeline
+        items = ['type:playback', 'type:capture', 'pga:any', 'eq:any', 'kpbm:any', 'id:0', 'id:1,3',
+            'pcm:Port2']
+        for _ in range(500):
+            pipeline_lst = [rng.choice(PIPELINES) for _ in range(rng.randint(0, 12))]
+            # '&' items only in the first term, where the two filters agree
+            terms = [' & '.join(rng.choice(['', '~']) + rng.choice(items) for _ in range(rng.randint(1, 3)))]
+            terms += [rng.choice(['', '~']) + rng.choice(items) for _ in range(rng.randint(0, 3))]
+            self.assertSameAsOld(' | '.join(terms), pipeline_lst)
+
+if __name__ == '__main__':
+    unittest.main()
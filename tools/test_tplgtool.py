@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Regression tests of tplgtool.py on malformed topology files
+
+Run with: python3 -m unittest discover -s tools
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+from tplgtool import TplgParser, TplgError
+
+MAGIC = b"CoSA"
+HEADER_SIZE = 36
+
+# a block header of type manifest, or hdr_type, followed by payload_size bytes of payload
+def block(payload_size, payload=None, hdr_type=8):
+    header = MAGIC + struct.pack("<8I", 5, 0, hdr_type, HEADER_SIZE, 0, payload_size, 0, 1)
+    return header + (b"\0" * payload_size if payload is None else payload)
+
+class TestMalformedTopology(unittest.TestCase):
+    def write(self, data):
+        fd, path = tempfile.mkstemp(suffix=".tplg")
+        self.addCleanup(os.unlink, path)
+        with os.fdopen(fd, "wb") as tplg_file:
+            tplg_file.write(data)
+        return path
+
+    def parse(self, data):
+        lazy_tplg = TplgParser().parse_lazy(self.write(data))
+        self.addCleanup(lazy_tplg.close)
+        return lazy_tplg
+
+    def test_valid_block(self):
+        self.parse(block(4))
+
+    def test_truncated_header(self):
+        for data in [b"CoSAxx", block(4)[:20], block(4) + block(4)[:HEADER_SIZE - 1]]:
+            with self.assertRaisesRegex(TplgError, "Invalid block header"):
+                self.parse(data)
+
+    def test_truncated_payload(self):
+        with self.assertRaisesRegex(TplgError, "Invalid block header"):
+            self.parse(block(8, b"\0" * 4))
+
+    # block data is not left as memoryviews into the mapped file, which is closed
+    def test_parse_returns_bytes(self):
+        # private data blocks, whose content is not decoded
+        pdata = 11
+        parsed_tplg = TplgParser().parse(self.write(block(4, b"abcd", pdata) + block(0, hdr_type=pdata)))
+        self.assertEqual(len(parsed_tplg), 3)
+        for parsed_block in parsed_tplg[:-1]:
+            self.assertIsInstance(parsed_block["data"], bytes)
+            self.assertIsInstance(parsed_block["raw_hdr"], bytes)
+        self.assertEqual(parsed_tplg[0]["data"], b"abcd")
+        self.assertEqual(parsed_tplg[0]["raw_hdr"], block(4, hdr_type=pdata)[:HEADER_SIZE])
+
+    def test_bad_magic(self):
+        with self.assertRaisesRegex(TplgError, "Invalid block magic"):
+            self.parse(b"CoSB" + block(4)[4:])
+
+if __name__ == "__main__":
+    unittest.main()
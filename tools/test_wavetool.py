@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+# SPDX-License-Identifier: BSD-3-Clause
+
+"""
+Check the block by block analysis of wavetool.py against the whole wave one
+
+Run with: python3 -m unittest discover -s tools
+"""
+
+import argparse
+import unittest
+import numpy as np
+import wavetool
+from wavetool import ZeroScanner, WaveError, trim_wave, find_zero_marker
+
+BLOCK_SIZES = (7, 100, 333, 100000)
+
+# trim points and zero marker of the whole wave, or the error finding them
+def whole_wave_result(wave):
+    try:
+        trimmed, left_idx = trim_wave(np.stack([wave, wave], axis=1))
+        marker_start, marker_end = find_zero_marker(trimmed[:,0], 0)
+    except WaveError as e:
+        return str(e)
+    return left_idx, left_idx + trimmed.shape[0], marker_start, marker_end
+
+def scanner_result(wave, block_size):
+    scanner = ZeroScanner(wave.dtype)
+    for start in range(0, len(wave), block_size):
+        scanner.feed(wave[start:start + block_size])
+    try:
+        return scanner.result()
+    except WaveError as e:
+        return str(e)
+
+class TestZeroScanner(unittest.TestCase):
+    def setUp(self):
+        wavetool.cmd = argparse.Namespace(zero_threshold=-50.3)
+        self.rng = np.random.default_rng(0)
+
+    def check(self, wave, block_sizes=BLOCK_SIZES):
+        expected = whole_wave_result(wave)
+        for block_size in block_sizes:
+            self.assertEqual(scanner_result(wave, block_size), expected,
+                             "block size %d, wave %s" % (block_size, wave.tolist()))
+        return expected
+
+    # random waves with silence at both sides and quiet spans, which can be zero markers
+    def test_random_waves(self):
+        results = {'found': 0}
+        for iteration in range(300):
+            length = int(self.rng.integers(400, 3000))
+            wave = (self.rng.integers(-200, 200, length) * self.rng.choice([1, 50, 200])).astype(np.int16)
+            wave[:self.rng.integers(0, 300)] = 0
+            wave[length - self.rng.integers(1, 300):] = self.rng.integers(-50, 50)
+            for _ in range(int(self.rng.integers(0, 5))):
+                start = int(self.rng.integers(0, length))
+                span = wave[start:start + int(self.rng.integers(1, 700))]
+                span[:] = self.rng.integers(-90, 90, len(span))
+            # one sample blocks are slow, only check a few waves with them
+            result = self.check(wave, BLOCK_SIZES + (1,) if iteration < 20 else BLOCK_SIZES)
+            key = result if isinstance(result, str) else 'found'
+            results[key] = results.get(key, 0) + 1
+        # the waves cover markers found and both errors
+        self.assertEqual(len(results), 3, results)
+
+    # samples exactly at the threshold are neither above it nor below it
+    def test_threshold_samples(self):
+        wavetool.cmd.zero_threshold = 20 * np.log10(100 / np.iinfo(np.int16).max)
+        values = np.array([0, 50, 100, 101, -100, 300], np.int16)
+        for _ in range(200):
+            length = int(self.rng.integers(400, 2000))
+            wave = self.rng.choice(values, length, p=[.3, .3, .15, .1, .1, .05])
+            for _ in range(3):
+                start = int(self.rng.integers(0, length))
+                wave[start:start + int(self.rng.integers(50, 500))] = 0
+            self.check(wave)
+
+    def test_silence(self):
+        self.assertEqual(self.check(np.zeros(1000, np.int16), BLOCK_SIZES + (1,)),
+                         "Recorded wave: volume too low or only contains zero")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,19 @@
 #!/usr/bin/python3
 
+import io
 import os
+import re
 import sys
+import shutil
 import argparse
 import struct
+import operator
+import mmap
+import hashlib
+import pickle
+import tempfile
+import subprocess
+from contextlib import redirect_stdout
 from enum import IntEnum
 
 # Constants used from ASoC
@@ -40,302 +50,393 @@ class AsocConsts(IntEnum):
 
     TPLG_DAPM_CTL_PIN     = 68
 
+# Precompiled layout of a packed little-endian ASoC topology struct.
+# fields are (name, spec) pairs, where spec is one of:
+#   - a struct format character, eg "I" for __le32, "H" for __le16
+#   - NAME, a fixed size char array decoded to str
+#   - a raw bytes format, eg "80s", kept as bytes
+#   - another AsocStruct, for embedded structs
+#   - a (spec, count) tuple, for arrays
+# the whole struct is decoded with one unpack_from() call, then the flat value tuple is
+# turned into a dict keyed by field name by a decoder built once per layout.
+class AsocStruct:
+    # SNDRV_CTL_ELEM_ID_NAME_MAXLEN sized char array
+    NAME = "44s"
+
+    def __init__(self, *fields):
+        self.fields = fields
+        self.format = "".join(AsocStruct._format(spec) for _, spec in fields)
+        self.struct = struct.Struct("<" + self.format)
+        self.size = self.struct.size
+        self._build, _ = AsocStruct._decoder(self, 0)
+
+    @staticmethod
+    def _format(spec):
+        if isinstance(spec, AsocStruct):
+            return spec.format
+        if isinstance(spec, tuple):
+            return AsocStruct._format(spec[0]) * spec[1]
+        return spec
+
+    # return a function decoding spec from the value tuple starting at index,
+    # and the index following spec
+    @staticmethod
+    def _decoder(spec, index):
+        if isinstance(spec, AsocStruct):
+            # plain fields are picked with one itemgetter, the other fields start with
+            # a placeholder value then are replaced in place, which keeps the field order
+            names = []
+            indexes = []
+            decoders = []
+            for name, field_spec in spec.fields:
+                names.append(name)
+                indexes.append(index)
+                decoder, next_index = AsocStruct._decoder(field_spec, index)
+                if not isinstance(decoder, operator.itemgetter):
+                    decoders.append((name, decoder))
+                index = next_index
+            if len(indexes) == 1:
+                # itemgetter of a single index returns the value, a one item slice is a tuple
+                getter = operator.itemgetter(slice(indexes[0], indexes[0] + 1))
+            else:
+                getter = operator.itemgetter(*indexes)
+            def decode_struct(v):
+                fields = dict(zip(names, getter(v)))
+                for name, decode in decoders:
+                    fields[name] = decode(v)
+                return fields
+            return decode_struct, index
+        if isinstance(spec, tuple):
+            elem_spec, count = spec
+            # arrays of plain values are a slice of the value tuple
+            if not isinstance(elem_spec, AsocStruct) and elem_spec != AsocStruct.NAME:
+                start, end = index, index + count
+                return lambda v: list(v[start:end]), end
+            decoders = []
+            for _ in range(count):
+                decoder, index = AsocStruct._decoder(elem_spec, index)
+                decoders.append(decoder)
+            return lambda v: [decode(v) for decode in decoders], index
+        if spec == AsocStruct.NAME:
+            decode_name = AsocStruct._decode_name
+            return lambda v: decode_name(v[index]), index + 1
+        return operator.itemgetter(index), index + 1
+
+    @staticmethod
+    def _decode_name(raw):
+        return raw.split(b'\0', 1)[0].decode(errors="replace")
+
+    # decode the struct at offset of buffer, buffer can be bytes or memoryview
+    def unpack_from(self, buffer, offset=0):
+        return self._build(self.struct.unpack_from(buffer, offset))
+
+# Layouts of the ASoC topology structs, in accordance with include/uapi/sound/asoc.h.
+# Structs with private data end with the size field of snd_soc_tplg_private named "priv",
+# the private data follows the struct in the binary.
+class AsocStructs:
+    NAME = AsocStruct.NAME
+
+    # magic field of snd_soc_tplg_hdr, every block starts with it
+    MAGIC = b'CoSA'
+
+    # snd_soc_tplg_hdr following the magic field
+    HEADER = AsocStruct(("abi", "I"), ("version", "I"), ("type", "I"), ("size", "I"),
+        ("vender_type", "I"), ("payload_size", "I"), ("index", "I"), ("count", "I"))
+
+    IO_OPS = AsocStruct(("get", "I"), ("put", "I"), ("info", "I"))
+
+    CTL_TLV = AsocStruct(("size", "I"), ("type", "I"), ("data_or_scale", ("I", 32)))
+
+    CHANNEL = AsocStruct(("size", "I"), ("reg", "I"), ("shift", "I"), ("id", "I"))
+
+    CTL_HDR = AsocStruct(("size", "I"), ("type", "I"), ("name", NAME), ("access", "I"),
+        ("ops", IO_OPS), ("tlv", CTL_TLV))
+
+    # snd_soc_tplg_mixer_control, enum_control and bytes_control without the leading hdr
+    MIXER_CONTROL = AsocStruct(("size", "I"), ("min", "I"), ("max", "I"), ("platform_max", "I"),
+        ("invert", "I"), ("num_channels", "I"), ("channel", (CHANNEL, 8)), ("priv", "I"))
+
+    ENUM_CONTROL = AsocStruct(("size", "I"), ("items", "I"), ("mask", "I"), ("count", "I"),
+        ("channel", (CHANNEL, 8)), ("texts", (NAME, 16)), ("values", ("I", 16 * 44 // 4)),
+        ("priv", "I"))
+
+    BYTES_CONTROL = AsocStruct(("size", "I"), ("max", "I"), ("mask", "I"), ("base", "I"),
+        ("num_regs", "I"), ("ext_ops", IO_OPS), ("priv", "I"))
+
+    DAPM_GRAPH_ELEM = AsocStruct(("sink", NAME), ("control", NAME), ("source", NAME))
+
+    DAPM_WIDGET = AsocStruct(("size", "I"), ("id", "I"), ("name", NAME), ("sname", NAME),
+        ("reg", "I"), ("shift", "I"), ("mask", "I"), ("subseq", "I"), ("invert", "I"),
+        ("ignore_suspend", "I"), ("event_flags", "H"), ("event_type", "H"),
+        ("num_kcontrols", "I"), ("priv", "I"))
+
+    STREAM = AsocStruct(("size", "I"), ("name", NAME), ("format", "Q"), ("rate", "I"),
+        ("period_bytes", "I"), ("buffer_bytes", "I"), ("channels", "I"))
+
+    STREAM_CAPS = AsocStruct(("size", "I"), ("name", NAME), ("formats", "Q"), ("rates", "I"),
+        ("rate_min", "I"), ("rate_max", "I"), ("channels_min", "I"), ("channels_max", "I"),
+        ("periods_min", "I"), ("periods_max", "I"), ("period_size_min", "I"),
+        ("period_size_max", "I"), ("buffer_size_min", "I"), ("buffer_size_max", "I"),
+        ("sig_bits", "I"))
+
+    PCM = AsocStruct(("size", "I"), ("pcm_name", NAME), ("dai_name", NAME), ("pcm_id", "I"),
+        ("dai_id", "I"), ("playback", "I"), ("capture", "I"), ("compress", "I"),
+        ("stream", (STREAM, 8)), ("num_streams", "I"), ("caps", (STREAM_CAPS, 2)),
+        ("flag_mask", "I"), ("flags", "I"), ("priv", "I"))
+
+    HW_CONFIG = AsocStruct(("size", "I"), ("id", "I"), ("fmt", "I"), ("clock_gated", "B"),
+        ("invert_bclk", "B"), ("invert_fsync", "B"), ("bclk_master", "B"),
+        ("fsync_master", "B"), ("mclk_direction", "B"), ("reserved", "H"),
+        ("mclk_rate", "I"), ("bclk_rate", "I"), ("fsync_rate", "I"), ("tdm_slots", "I"),
+        ("tdm_slot_width", "I"), ("tx_slots", "I"), ("rx_slots", "I"), ("tx_channels", "I"),
+        ("tx_chanmap", ("I", 8)), ("rx_channels", "I"), ("rx_chanmap", ("I", 8)))
+
+    LINK_CONFIG = AsocStruct(("size", "I"), ("id", "I"), ("name", NAME), ("stream_name", NAME),
+        ("stream", (STREAM, 8)), ("num_streams", "I"), ("hw_config", (HW_CONFIG, 8)),
+        ("num_hw_configs", "I"), ("default_hw_config_id", "I"), ("flag_mask", "I"),
+        ("flags", "I"), ("priv", "I"))
+
+    MANIFEST = AsocStruct(("size", "I"), ("ctrl_elems", "I"), ("widget_elems", "I"),
+        ("graph_elems", "I"), ("pcm_elems", "I"), ("dai_link_elems", "I"), ("dai_elems", "I"),
+        ("reserved", "80s"), ("priv", "I"))
+
+# raised for malformed topologies, the message tells what is wrong
+class TplgError(Exception):
+    pass
+
+# map func over items in up to jobs worker processes, jobs 0 means one per CPU.
+# Results are returned in the order of items whatever order they finish in.
+# func and items are pickled to the workers, func has to be a module level function.
+def parallel_map(func, items, jobs=1):
+    items = list(items)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if jobs <= 1 or len(items) <= 1:
+        return list(map(func, items))
+    # pylint: disable=C0415
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # fork, so workers find func even in modules loaded from a file path
+    with ProcessPoolExecutor(max_workers=min(jobs, len(items)),
+            mp_context=multiprocessing.get_context("fork")) as executor:
+        return list(executor.map(func, items))
+
+# Persistent cache of parsed topologies, used to skip parsing the same topology again
+# and again during a test run. Entries are pickled python objects stored under
+# $XDG_CACHE_HOME/sof-test/tplg, keyed by topology path, size, mtime and content hash,
+# so a changed topology never hits a stale entry. When the cache grows over max_size
+# bytes, the least recently used entries are evicted.
+# Set SOF_TPLG_CACHE=0 in the environment to disable the cache.
+class TplgCache:
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        if cache_dir is None:
+            cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+            cache_dir = os.path.join(cache_home, "sof-test", "tplg")
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    # return the default cache, or None if it is disabled
+    @staticmethod
+    def default():
+        if os.environ.get("SOF_TPLG_CACHE", "1") == "0":
+            return None
+        return TplgCache()
+
+    # return cache key of tplg_file, extra items are added to the key to tell
+    # different kinds of cached data apart. Return None if the file can't be read.
+    def key(self, tplg_file, *extra):
+        try:
+            stat = os.stat(tplg_file)
+            with open(tplg_file, "rb") as fd:
+                digest = hashlib.sha1(fd.read()).hexdigest()
+            # cached data is invalid once the code decoding it changes
+            code_stat = os.stat(__file__)
+        except OSError:
+            return None
+        ident = (os.path.abspath(tplg_file), stat.st_size, stat.st_mtime_ns, digest,
+            code_stat.st_size, code_stat.st_mtime_ns) + extra
+        return hashlib.sha1(repr(ident).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".pickle")
+
+    # return the cached object of key, or None if there is no such entry
+    def load(self, key):
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fd:
+                obj = pickle.load(fd)
+            # mark the entry as recently used
+            os.utime(path)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            # missing, truncated or stale entry
+            return None
+        return obj
+
+    # store obj as the entry of key, failures are ignored as the cache is only an optimization
+    def store(self, key, obj):
+        if key is None:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file and rename it, so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as tmp_file:
+                pickle.dump(obj, tmp_file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except OSError:
+            pass
+
+    # remove least recently used entries until the cache fits in max_size
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # already evicted by another process sharing the cache
+                pass
+            total_size -= size
+
+# TplgCache kept in memory, for long-lived processes parsing the same topologies again
+# and again. Entries are kept pickled, so every load returns a private copy.
+class TplgMemoryCache(TplgCache):
+    def __init__(self, max_size=TplgCache.DEFAULT_MAX_SIZE):
+        super().__init__(cache_dir="", max_size=max_size)
+        self._entries = {}
+
+    # the entries are private to the process, copies sent to worker processes start empty
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_entries"] = {}
+        return state
+
+    def load(self, key):
+        if key not in self._entries:
+            return None
+        # dicts keep insertion order, move the entry to the end as most recently used
+        data = self._entries.pop(key)
+        self._entries[key] = data
+        return pickle.loads(data)
+
+    def store(self, key, obj):
+        if key is None:
+            return
+        self._entries.pop(key, None)
+        self._entries[key] = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        total_size = sum(len(data) for data in self._entries.values())
+        for old_key in list(self._entries.keys()):
+            if total_size <= self.max_size:
+                break
+            total_size -= len(self._entries.pop(old_key))
+
 # the TplgParser class will transform binary tplg into python lists and dicts
+# every record is decoded from the block data at an offset with the layouts in AsocStructs,
+# record parsers return the decoded record and the offset of the next record
 class TplgParser():
+    # parse() caches decoded topologies in cache, a TplgCache, if it is not None
+    def __init__(self, cache=None):
+        self._cache = cache
+
     # no such header type in the binary tplg, leave this unimplemented
     def _tplg_kcontrol_parse(self, block):
         return None
 
+    # decode a struct ending with snd_soc_tplg_private, and the private data following it
+    @staticmethod
+    def _parse_priv_struct(layout, bytes_data, offset):
+        record = layout.unpack_from(bytes_data, offset)
+        offset += layout.size
+        priv_size = record["priv"]
+        priv = {"size": priv_size, "data": None}
+        if priv_size != 0:
+            priv["data"] = bytes(bytes_data[offset:offset + priv_size])
+        record["priv"] = priv
+        return record, offset + priv_size
+
     # parse snd_soc_tplg_dapm_graph_elem struct
     # the order is rearranged, [sink, ctrl, source] -> [source, ctrl, sink]
     def _tplg_dapm_graph_parse(self, block):
-        graph_list = []
+        layout = AsocStructs.DAPM_GRAPH_ELEM
         bytes_data = block["data"]
-        # we have 3 string to parse for each graph
+        graph_list = []
         for cnt in range(block["header"]["count"]):
-            # 44 here is the max string length in C
-            idx_start = cnt * 44 * 3
-            sink = self._parse_char_array(bytes_data[idx_start: idx_start+44])
-            ctrl = self._parse_char_array(bytes_data[idx_start+44:idx_start+88])
-            source = self._parse_char_array(bytes_data[idx_start+88:idx_start+132])
-            graph = [source, ctrl, sink]
-            graph_list.append(graph)
+            elem = layout.unpack_from(bytes_data, cnt * layout.size)
+            graph_list.append([elem["source"], elem["control"], elem["sink"]])
         return graph_list
 
-    # parse snd_soc_tplg_ctl_hdr struct
-    def _kcontrol_header_parse(self, bytes_data):
-        tplg_kctrl_fields = ["size", "type", "name", "access", "ops", "tlv"]
-        values = []
-        values.append(struct.unpack("I", bytes_data[:4])[0])
-        values.append(struct.unpack("I", bytes_data[4:8])[0])
-        values.append(self._parse_char_array(bytes_data[8:52]))
-        values.append(struct.unpack("I", bytes_data[52:56])[0])
-        # three u32 type to parse for struct snd_soc_tplg_io_ops
-        io_ops_val = []
-        io_ops_val.append(struct.unpack("I", bytes_data[56:60])[0])
-        io_ops_val.append(struct.unpack("I", bytes_data[60:64])[0])
-        io_ops_val.append(struct.unpack("I", bytes_data[64:68])[0])
-        values.append(dict(zip(["get", "put", "info"], io_ops_val)))
-        # parse snd_soc_tplg_ctl_tlv struct
-        ctrl_tlv_val = []
-        ctrl_tlv_val.append(struct.unpack("I", bytes_data[68:72])[0])
-        ctrl_tlv_val.append(struct.unpack("I", bytes_data[72:76])[0])
-        tlv_union = []
-        for i in range(32):
-            idx_start = 76 + 4*i
-            idx_end = 76 + 4*i + 4
-            tlv_union.append(struct.unpack("I", bytes_data[idx_start: idx_end])[0])
-        ctrl_tlv_val.append(tlv_union)
-        values.append(dict(zip(["size", "type", "data_or_scale"], ctrl_tlv_val)))
-
-        ctrl_hdr = dict(zip(tplg_kctrl_fields, values))
-
-        return ctrl_hdr, bytes_data[204:]
-
-    # parse snd_soc_tplg_mixer_control struct
-    def _mixer_ctrl_parse(self, bytes_data):
-        mixer_ctrl_fields = ["size", "min", "max", "platform_max", "invert", "num_channels", \
-            "channel", "priv"]
-        values = []
-        # 6 u32 to parse (size ... num_channels)
-        for i in range(6):
-            idx_start = 4 * i
-            idx_end = 4*i + 4
-            values.append(struct.unpack("I",bytes_data[idx_start:idx_end])[0])
-        # parse channel_list, up to 8 elems in the list, each with 4 u32
-        channel_list = []
-        for i in range(8):
-            tplg_channel_val = []
-            idx_start = 24 + i*16
-            tplg_channel_val.append(struct.unpack("I",bytes_data[idx_start:idx_start+4])[0])
-            tplg_channel_val.append(struct.unpack("I",bytes_data[idx_start+4:idx_start+8])[0])
-            tplg_channel_val.append(struct.unpack("I",bytes_data[idx_start+8:idx_start+12])[0])
-            tplg_channel_val.append(struct.unpack("I",bytes_data[idx_start+12:idx_start+16])[0])
-            channel_list.append(dict(zip(["size","reg","shift","id"], tplg_channel_val)))
-        values.append(channel_list)
-
-        priv_size = struct.unpack("I", bytes_data[152:156])[0]
-        priv = {"size":priv_size}
-        if priv_size == 0:
-            priv["data"] = None
-        else :
-            priv["data"] = bytes_data[156:156+priv_size]
-        values.append(priv)
-
-        mixer = dict(zip(mixer_ctrl_fields, values))
-        # test if we are at the end of the byte data
-        if len(bytes_data[156 + priv_size - 1:]) < 4:
-            return mixer, None
-
-        bytes_data = bytes_data[156 + priv_size:]
-        return mixer, bytes_data
-
-    # no such kcontrol in the binary tplg till now, leave this unimplemented
-    def _enum_ctrl_parse(self, bytes_data):
-        pass
-
-    def _bytes_ctrl_parse(self, bytes_data):
-        bytes_ctrl_fields = ["size", "max", "mask", "base", "num_regs", "ext_ops", "priv"]
-        values = []
-        # parse 5 u32 (size ... num_regs)
-        for i in range(5):
-            idx_start = 4 * i
-            idx_end = 4*i + 4
-            values.append(struct.unpack("I",bytes_data[idx_start:idx_end])[0])
-        # parse snd_soc_tplg_io_ops struct
-        io_ops_val = []
-        io_ops_val.append(struct.unpack("I", bytes_data[20:24])[0])
-        io_ops_val.append(struct.unpack("I", bytes_data[24:28])[0])
-        io_ops_val.append(struct.unpack("I", bytes_data[28:32])[0])
-        values.append(dict(zip(["get", "put", "info"], io_ops_val)))
-
-        priv_size = struct.unpack("I", bytes_data[32:36])[0]
-        priv = {"size": priv_size}
-        if priv_size == 0:
-            priv["data"] = None
-        else :
-            priv["data"] = bytes_data[36:36+priv_size]
-        values.append(priv)
-
-        bytes_ctrl = dict(zip(bytes_ctrl_fields, values))
-
-        if len(bytes_data[36 + priv_size - 1:]) < 4:
-            return bytes_ctrl, None
-
-        rest_data = bytes_data[36 + priv_size:]
-        return bytes_ctrl, rest_data
-
-    # find the corresponding function to call for each kcontrol type
-    def _find_kctrl_parse_func(self, ctrl_hdr):
+    # find the corresponding layout to use for each kcontrol type
+    def _find_kctrl_layout(self, ctrl_hdr):
         kctrl_type = ctrl_hdr["ops"]["info"]
         if kctrl_type in [AsocConsts.TPLG_CTL_VOLSW, AsocConsts.TPLG_CTL_STROBE, \
                 AsocConsts.TPLG_CTL_VOLSW_SX, AsocConsts.TPLG_CTL_VOLSW_XR_SX, \
                 AsocConsts.TPLG_CTL_RANGE, AsocConsts.TPLG_DAPM_CTL_VOLSW]:
-            return self._mixer_ctrl_parse
+            return AsocStructs.MIXER_CONTROL
 
         if kctrl_type in [AsocConsts.TPLG_CTL_ENUM, AsocConsts.TPLG_CTL_ENUM_VALUE, \
                 AsocConsts.TPLG_DAPM_CTL_ENUM_DOUBLE, AsocConsts.TPLG_DAPM_CTL_ENUM_VIRT, \
                 AsocConsts.TPLG_DAPM_CTL_ENUM_VALUE]:
-            return self._enum_ctrl_parse
+            return AsocStructs.ENUM_CONTROL
 
         if kctrl_type in [AsocConsts.TPLG_CTL_BYTES]:
-            return self._bytes_ctrl_parse
+            return AsocStructs.BYTES_CONTROL
         return None
 
-    def _dapm_kcontrol_parse(self, bytes_data, kctrl_count):
-        bytes_array = bytes_data
+    # parse kcontrols following a widget, each is a snd_soc_tplg_ctl_hdr followed
+    # by the control struct of its type
+    def _dapm_kcontrol_parse(self, bytes_data, offset, kctrl_count):
         kctrl_list = []
-        parse_func = None
 
         for _ in range(kctrl_count):
-            ctrl_hdr, bytes_array = self._kcontrol_header_parse(bytes_array)
-            parse_func = self._find_kctrl_parse_func(ctrl_hdr)
-            if parse_func is not None:
-                ctrl, bytes_array = parse_func(bytes_array)
+            ctrl_hdr = AsocStructs.CTL_HDR.unpack_from(bytes_data, offset)
+            offset += AsocStructs.CTL_HDR.size
+            layout = self._find_kctrl_layout(ctrl_hdr)
+            if layout is not None:
+                ctrl, offset = self._parse_priv_struct(layout, bytes_data, offset)
                 ctrl["hdr"] = ctrl_hdr
                 kctrl_list.append(ctrl)
 
-        return kctrl_list, bytes_array
+        return kctrl_list, offset
 
     # parse snd_soc_tplg_dapm_widget struct
-    def _parse_dapm_widget_struct(self, bytes_data):
-        widget_fields = ["size", "id", "name", "sname", "reg", "shift", "mask", "subseq", "invert", \
-            "ignore_suspend", "event_flags", "event_type", "num_kcontrols", "priv"]
-
-        values = []
-
-        values.append(struct.unpack("I",bytes_data[:4])[0])
-        values.append(struct.unpack("I",bytes_data[4:8])[0])
-        values.append(self._parse_char_array(bytes_data[8:52]))
-        values.append(self._parse_char_array(bytes_data[52:96]))
-        #the next six fields(reg ... ignore_suspend) have the same u32 type
-        six_le32 = [i[0] for i in struct.iter_unpack("I", bytes_data[96:120])]
-        for i in six_le32: values.append(i)
-
-        values.append(struct.unpack("H", bytes_data[120:122])[0])
-        values.append(struct.unpack("H", bytes_data[122:124])[0])
-        values.append(struct.unpack("I",bytes_data[124:128])[0])
-
-        priv_size = struct.unpack("I", bytes_data[128:132])[0]
-        priv = {"size":priv_size}
-        if priv_size == 0:
-            priv_data = None
-        else :
-            priv_data = bytes_data[132:132+priv_size]
-        priv["data"] = priv_data
-        values.append(priv)
-
-        bytes_data_idx = 132 + priv_size
-
-        dapm_widget = dict(zip(widget_fields, values))
+    def _parse_dapm_widget_struct(self, bytes_data, offset):
+        dapm_widget, offset = self._parse_priv_struct(AsocStructs.DAPM_WIDGET, bytes_data, offset)
 
         kctrl_count = dapm_widget["num_kcontrols"]
         if kctrl_count == 0:
             dapm_widget["kcontrol"] = None
-            if len(bytes_data[bytes_data_idx-1:]) < 4:
-                return dapm_widget, None
-
-            return dapm_widget, bytes_data[bytes_data_idx:]
-
-        kctrl_list, bytes_data = self._dapm_kcontrol_parse(bytes_data[bytes_data_idx:], kctrl_count)
-
-        dapm_widget["kcontrol"] = kctrl_list
+            return dapm_widget, offset
 
-        if bytes_data == None:
-            return dapm_widget, None
-
-        return dapm_widget, bytes_data
+        dapm_widget["kcontrol"], offset = self._dapm_kcontrol_parse(bytes_data, offset, kctrl_count)
+        return dapm_widget, offset
 
     def _tplg_dapm_widget_parse(self, block):
         bytes_data = block["data"]
+        offset = 0
         dapm_widget_list = []
-        while bytes_data != None:
-            widget, bytes_data = self._parse_dapm_widget_struct(bytes_data)
+        for _ in range(block["header"]["count"]):
+            widget, offset = self._parse_dapm_widget_struct(bytes_data, offset)
             dapm_widget_list.append(widget)
         return dapm_widget_list
 
-    def _parse_char_array(self, bytes_data):
-        string = str(bytes_data).split('\'')[1]
-        idx = string.find('\\')
-        return string[0:idx]
-
-    def _parse_stream_struct(self, bytes_data):
-        tplg_stream_fields = ["size", "name", "format", "rate", "period_bytes", "buffer_bytes", "channels"]
-        stream_value = []
-        stream_value.append(struct.unpack("I", bytes_data[0:4])[0])
-        stream_value.append(self._parse_char_array(bytes_data[4:48]))
-        stream_value.append(struct.unpack("Q", bytes_data[48: 56])[0])
-        for i in list(struct.iter_unpack("I", bytes_data[56:])):
-            stream_value.append(i[0])
-        stream_struct = dict(zip(tplg_stream_fields, stream_value))
-        return stream_struct
-
-    def _parse_stream_cap_struct(self, bytes_data):
-        tplg_stream_caps_fields = ["size", "name", "formats", "rates", "rate_min", "rate_max", "channels_min",
-            "channels_max", "periods_min", "periods_max", "period_size_min", "period_size_max",
-            "buffer_size_min", "buffer_size_max", "sig_bits"]
-        stream_cap_value = []
-        stream_cap_value.append(struct.unpack("I", bytes_data[:4])[0])
-        stream_cap_value.append(self._parse_char_array(bytes_data[4:48]))
-        stream_cap_value.append(struct.unpack("Q", bytes_data[48:56])[0])
-        # rates ... sig_bits are all u32 type
-        for i in list(struct.iter_unpack("I", bytes_data[56:])):
-            stream_cap_value.append(i[0])
-        stream_cap_struct = dict(zip(tplg_stream_caps_fields, stream_cap_value))
-        return stream_cap_struct
-
-
-    def _parse_pcm_struct(self, bytes_data):
-        pcm_fields = ["size", "pcm_name", "dai_name", "pcm_id", "dai_id", "playback", "capture",
-            "compress", "stream", "num_streams", "caps", "flag_mask", "flags", "priv"]
-        values = []
-        values.append(struct.unpack("I",bytes_data[:4])[0])
-        values.append(self._parse_char_array(bytes_data[4:48]))
-        values.append(self._parse_char_array(bytes_data[48:92]))
-        for i in list(struct.iter_unpack("I", bytes_data[92:112])):
-            values.append(i[0])
-
-        # parse snd_soc_tplg_stream array
-        stream_list = []
-        tplg_stream_size = 72 # tplg_stream size is 72
-        stream_data = bytes_data[112:688]
-        for idx in range(8):
-            stream_start = tplg_stream_size * idx
-            stream_list.append(self._parse_stream_struct(stream_data[stream_start: stream_start + 72]))
-        values.append(stream_list)
-
-        values.append(struct.unpack("I", bytes_data[688:692])[0])
-
-        # parse snc_soc_tplg_stream_caps
-        stream_cap_list = []
-        tplg_stream_caps_size = 104
-        stream_cap_data = bytes_data[692:900]
-        for idx in range(2):
-            start = tplg_stream_caps_size * idx
-            stream_cap_list.append(self._parse_stream_cap_struct(stream_cap_data[start:start+tplg_stream_caps_size]))
-
-        values.append(stream_cap_list)
-        values.append(struct.unpack("I", bytes_data[900:904])[0])
-        values.append(struct.unpack("I", bytes_data[904:908])[0])
-
-        priv_size = struct.unpack("I", bytes_data[908:912])[0]
-        priv = {"size":priv_size}
-        if priv_size == 0:
-            priv["data"] = None
-        else :
-            priv["data"] = bytes_data[908:908+priv_size]
-        values.append(priv)
-
-        pcm = dict(zip(pcm_fields, values))
-        if len(bytes_data[912 + priv_size -1:]) < 4:
-            return pcm, None
-        return pcm, bytes_data[912+priv_size:]
-
     def _tplg_pcm_parse(self, block):
         bytes_data = block["data"]
+        offset = 0
         pcm_list = []
         for _ in range(block["header"]["count"]):
-            parsed_pcm, bytes_data = self._parse_pcm_struct(bytes_data)
+            parsed_pcm, offset = self._parse_priv_struct(AsocStructs.PCM, bytes_data, offset)
             pcm_list.append(parsed_pcm)
 
         return pcm_list
@@ -344,200 +445,222 @@ class TplgParser():
     def _tplg_dai_parse(self, bytes_data):
         return None
 
+    # parse snd_soc_tplg_link_config structs
     def _tplg_link_parse(self, block):
-        link_config_fields = ["size", "id", "name", "stream_name", "stream", "num_streams", "hw_config", \
-            "num_hw_configs", "default_hw_config_id", "flag_mask", "flags", "priv"]
         bytes_data = block["data"]
+        offset = 0
         link_list = []
 
         for _ in range(block["header"]["count"]):
-            values = []
-            values.append(struct.unpack("I", bytes_data[:4])[0])
-            values.append(struct.unpack("I", bytes_data[4:8])[0])
-            values.append(self._parse_char_array(bytes_data[8:52]))
-            values.append(self._parse_char_array(bytes_data[52:96]))
-
-            # parse snd_soc_tplg_stream
-            stream_list = []
-            tplg_stream_size = 72 # tplg_stream size is 72
-            stream_data = bytes_data[96:672]
-            for idx in range(8):
-                stream_start = tplg_stream_size * idx
-                stream_val = self._parse_stream_struct(stream_data[stream_start: stream_start+tplg_stream_size])
-                stream_list.append(stream_val)
-            values.append(stream_list)
-
-            values.append(struct.unpack("I", bytes_data[672:676])[0])
-
-            # parse snd_soc_tplg_hw_config
-            hw_config_list = []
-            hw_config_size = 120 # sizeof snd_soc_tplg_hw_config is 120
-            hw_config_data = bytes_data[676:1636]
-            for idx in range(8):
-                idx_start = hw_config_size * idx
-                hw_config_list.append(self._parse_hw_config(hw_config_data[idx_start:idx_start+hw_config_size]))
-            values.append(hw_config_list)
-
-            for i in range(4):
-                values.append(struct.unpack("I", bytes_data[1636+4*i: 1640+4*i])[0])
-
-            priv_size = struct.unpack("I", bytes_data[1652:1656])[0]
-            priv = {"size": priv_size}
-            if priv_size == 0:
-                priv["data"] = None
-                bytes_data = bytes_data[1656:]
-            else :
-                priv["data"] = bytes_data[1656:1656+priv_size]
-                bytes_data = bytes_data[1656+priv_size:]
-
-            values.append(priv)
-            link_config = dict(zip(link_config_fields, values))
+            link_config, offset = self._parse_priv_struct(AsocStructs.LINK_CONFIG, bytes_data, offset)
             link_list.append(link_config)
 
         return link_list
 
-    # parse snd_soc_tplg_hw_config struct
-    def _parse_hw_config(self, bytes_data):
-        hw_config_fields = ["size", "id", "fmt", "clock_gated", "invert_bclk", "invert_fsync", "bclk_master", \
-             "fsync_master", "mclk_direction", "reserved", "mclk_rate", "bclk_rate", "fsync_rate", "tdm_slots", \
-             "tdm_slot_width", "tx_slots", "rx_slots", "tx_channels", "tx_chanmap", "rx_channels", "rx_chanmap"]
-
-        values = []
-        # size ... fmt
-        values.append(struct.unpack("I", bytes_data[:4])[0])
-        values.append(struct.unpack("I", bytes_data[4:8])[0])
-        values.append(struct.unpack("I", bytes_data[8:12])[0])
-        # clock_gated ... mclk_direction
-        for i in range(6):
-            values.append(bytes_data[12+i])
-        # reserved
-        values.append(struct.unpack("H", bytes_data[18:20])[0])
-        # mclk_rate ... tx_channels
-        for i in range(8):
-            values.append(struct.unpack("I", bytes_data[20+4*i: 24+4*i])[0])
-        # tx_chanmap
-        tx_chanmap_val = []
-        for i in range(8):
-            tx_chanmap_val.append(struct.unpack("I", bytes_data[52+4*i: 56+4*i])[0])
-        values.append(tx_chanmap_val)
-        # rx_channels
-        values.append(struct.unpack("I", bytes_data[84:88]))
-        # rx_chanmap
-        rx_chanmap_val = []
-        for i in range(8):
-            rx_chanmap_val.append(struct.unpack("I", bytes_data[88+4*i: 92+4*i])[0])
-        values.append(rx_chanmap_val)
-
-        hw_config = dict(zip(hw_config_fields, values))
-        return hw_config
-
     def _tplg_manifest_parse(self, block):
-        bytes_data = block["data"]
-        manifest_fields = ["size", "ctrl_elems", "widget_elems", "graph_elems", "pcm_elems", \
-            "dai_link_elems", "dai_elems","reserved", "priv"]
-        values = [i[0] for i in list(struct.iter_unpack("I", bytes_data[:28]))]
-        # reserved
-        values.append(bytes_data[28:108])
-
-        priv_size = struct.unpack("I", bytes_data[28:32])[0]
-        priv = {"size": priv_size}
-        if priv_size == 0:
-            priv["data"] = None
-        else :
-            priv["data"] = bytes_data[32:32+priv_size]
-        values.append(priv)
-        return dict(zip(manifest_fields, values))
-
-
-    def _parse_block_header(self, block):
-        header_fields = ["abi","version", "type", "size", \
-            "vender_type","payload_size", "index", "count"]
-        header_values = [i[0] for i in list(struct.iter_unpack("I",block[:32]))]
-        # we lost magic info when we use it to split tplg binary, add it back here
-        header_values.append({"magic":"CoSA"})
-        parse_header = dict(zip(header_fields, header_values))
+        manifest, _ = self._parse_priv_struct(AsocStructs.MANIFEST, block["data"], 0)
+        return manifest
+
+    # parse the header of the block at offset, return the block and the offset of the
+    # next block. Block data is a memoryview into the topology binary, which is only
+    # decoded by parse_block_content() or parse_block_data().
+    def _parse_block_header(self, tplg_binary, offset):
+        if tplg_binary[offset:offset + len(AsocStructs.MAGIC)] != AsocStructs.MAGIC:
+            raise TplgError("Invalid block magic at offset %d, error in topology" %offset)
+        # a file cut off inside the header
+        if offset + len(AsocStructs.MAGIC) + AsocStructs.HEADER.size > len(tplg_binary):
+            raise TplgError("Invalid block header at offset %d, error in topology" %offset)
+        parse_header = AsocStructs.HEADER.unpack_from(tplg_binary, offset + len(AsocStructs.MAGIC))
+        data_start = offset + parse_header["size"]
+        data_end = data_start + parse_header["payload_size"]
+        if parse_header["size"] < len(AsocStructs.MAGIC) + AsocStructs.HEADER.size \
+                or data_end > len(tplg_binary):
+            raise TplgError("Invalid block header at offset %d, error in topology" %offset)
         # retain raw data in the dict
-        block = {"header": parse_header, "data": block[32:], "raw_hdr":b'CoSA' + block[:32]}
+        block = {"header": parse_header, "data": tplg_binary[data_start:data_end],
+            "raw_hdr": tplg_binary[offset:data_start]}
+        return block, data_end
+
+    # block content key, header types of the blocks holding it and the method decoding it
+    _BLOCK_CONTENTS = [
+        ("manifest", [AsocConsts.TPLG_TYPE_MANIFEST], "_tplg_manifest_parse"),
+        ("pcm", [AsocConsts.TPLG_TYPE_PCM], "_tplg_pcm_parse"),
+        ("kcontrol", [AsocConsts.TPLG_TYPE_MIXER, AsocConsts.TPLG_TYPE_ENUM, \
+            AsocConsts.TPLG_TYPE_BYTES], "_tplg_kcontrol_parse"),
+        ("dai", [AsocConsts.TPLG_TYPE_DAI], "_tplg_dai_parse"),
+        ("graph", [AsocConsts.TPLG_TYPE_DAPM_GRAPH], "_tplg_dapm_graph_parse"),
+        ("widget", [AsocConsts.TPLG_TYPE_DAPM_WIDGET], "_tplg_dapm_widget_parse"),
+        ("link", [AsocConsts.TPLG_TYPE_DAI_LINK, AsocConsts.TPLG_TYPE_BACKEND_LINK], "_tplg_link_parse"),
+    ]
+
+    # decode the content of key, eg "pcm", into block if the block holds such content,
+    # return whether the block holds it. Content already decoded is not decoded again.
+    def parse_block_content(self, block, key):
+        if key in block:
+            return True
+        for content_key, hdr_types, parse_func in self._BLOCK_CONTENTS:
+            if content_key == key and block["header"]["type"] in hdr_types:
+                try:
+                    block[key] = getattr(self, parse_func)(block)
+                except struct.error as e:
+                    # records run past the end of the block payload
+                    raise TplgError("Invalid %s block data, error in topology: %s" % (key, e)) from e
+                return True
+        return False
+
+    # decode every content the block holds
+    def parse_block_data(self, block):
+        for key, _, _ in self._BLOCK_CONTENTS:
+            self.parse_block_content(block, key)
         return block
 
-    def _parse_block_data(self, block):
-        hdr_type = block["header"]["type"]
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_MANIFEST]:
-            block["manifest"] = self._tplg_manifest_parse(block)
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_PCM]:
-            block["pcm"] = self._tplg_pcm_parse(block)
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_MIXER, AsocConsts.TPLG_TYPE_ENUM, \
-                AsocConsts.TPLG_TYPE_BYTES]:
-            block["kcontrol"] = self._tplg_kcontrol_parse(block)
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_DAI]:
-            block["dai"] = self._tplg_dai_parse(block)
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_DAPM_GRAPH]:
-            block["graph"] = self._tplg_dapm_graph_parse(block)
-
-        if hdr_type in [AsocConsts.TPLG_TYPE_DAPM_WIDGET]:
-            block["widget"] = self._tplg_dapm_widget_parse(block)
+    # map the topology file into memory, so pages are only read when a field is decoded
+    # and blocks can be sliced without copying
+    @staticmethod
+    def _map_file(fd):
+        try:
+            return memoryview(mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ))
+        except (ValueError, OSError):
+            # empty or non-regular files can not be mapped, read them instead
+            return memoryview(fd.read())
+
+    # index the blocks of tplg_file without decoding their payload, the content of
+    # the blocks is decoded by the returned LazyTplg when it is first accessed.
+    # The LazyTplg keeps the topology file mapped until it is closed.
+    def parse_lazy(self, tplg_file):
+        try:
+            with open(tplg_file,"rb") as fd:
+                tplg_binary = self._map_file(fd)
+        except OSError as e:
+            raise TplgError("File %s open error" %tplg_file) from e
+
+        # here we call a header with its data a block, blocks are walked by the
+        # size and payload_size fields of their headers
+        blocks = []
+        offset = 0
+        try:
+            while offset < len(tplg_binary):
+                block, offset = self._parse_block_header(tplg_binary, offset)
+                blocks.append(block)
+        except TplgError:
+            LazyTplg(self, blocks, tplg_file, tplg_binary).close()
+            raise
+        return LazyTplg(self, blocks, tplg_file, tplg_binary)
+
+    # return every block of tplg_file fully decoded, the last element in the
+    # list is the tplg file name. Block data and raw_hdr are bytes.
+    def parse(self,tplg_file):
+        cache_key = None
+        if self._cache is not None:
+            cache_key = self._cache.key(tplg_file, "parse")
+            parsed_tplg = self._cache.load(cache_key)
+            if parsed_tplg is not None:
+                return parsed_tplg
+        with self.parse_lazy(tplg_file) as lazy_tplg:
+            parsed_tplg = lazy_tplg.to_list()
+            # copy the memoryviews into the mapped file before it is closed
+            for block in parsed_tplg[:-1]:
+                block["data"] = bytes(block["data"])
+                block["raw_hdr"] = bytes(block["raw_hdr"])
+        if cache_key is not None:
+            self._cache.store(cache_key, parsed_tplg)
+        return parsed_tplg
 
-        if hdr_type in [AsocConsts.TPLG_TYPE_DAI_LINK, AsocConsts.TPLG_TYPE_BACKEND_LINK]:
-            block["link"] = self._tplg_link_parse(block)
-        return block
+# the LazyTplg class holds the indexed blocks of a topology, the payload of each kind of
+# block content ("pcm", "widget", "graph", "link", ...) is only decoded the first time
+# that content is asked for, so eg. a PCM only query never decodes widgets or links.
+# close() it, or use it in a with statement, to unmap the topology file; content not
+# decoded yet can't be decoded after that.
+class LazyTplg:
+    def __init__(self, parser, blocks, name, tplg_binary=None):
+        self._parser = parser
+        self._blocks = blocks
+        self.name = name
+        self._tplg_binary = tplg_binary
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # release the memoryviews into the topology binary, the file is unmapped once
+    # no memoryview refers to it anymore
+    def close(self):
+        if self._tplg_binary is None:
+            return
+        for block in self._blocks:
+            for key in ["data", "raw_hdr"]:
+                if isinstance(block[key], memoryview):
+                    block[key].release()
+        self._tplg_binary.release()
+        self._tplg_binary = None
+
+    # wrap the list returned by TplgParser.parse()
+    @staticmethod
+    def from_list(parsed_tplg):
+        return LazyTplg(TplgParser(), parsed_tplg[:-1], parsed_tplg[-1])
 
-    def _parse_block(self, block):
-        block = self._parse_block_header(block)
-        block = self._parse_block_data(block)
-        return block
+    # return the blocks holding the content of key, in file order
+    def blocks(self, key):
+        return [block for block in self._blocks if self._parser.parse_block_content(block, key)]
 
-    def parse(self,tplg_file):
-        try:
-            with open(tplg_file,"rb") as fd:
-                self._tplg_binary = fd.read()
-        except:
-            print("File %s open error" %tplg_file)
-            sys.exit(1)
+    # decode everything, return blocks in the form of TplgParser.parse()
+    def to_list(self):
+        for block in self._blocks:
+            self._parser.parse_block_data(block)
+        return self._blocks + [self.name]
 
-        # here we call a header with its data a block
-        parsed_tplg = []
-        # split binary with header's "magic" field
-        splited_blocks = self._tplg_binary.split(b'CoSA')
+# DOT language identifiers, quoted like the graphviz python package quotes them
+_DOT_ID = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*|-?(\.[0-9]+|[0-9]+(\.[0-9]*)?))$')
+_DOT_KEYWORDS = ['node', 'edge', 'graph', 'digraph', 'subgraph', 'strict']
 
-        # skip the first element for it is introduced by the 'split' and is actually nothing
-        for block in splited_blocks[1:]:
-            parsed_tplg.append(self._parse_block(block))
-        # the last element in the parsed tplg is the tplg file name
-        parsed_tplg.append(tplg_file)
-        return parsed_tplg
+def _dot_id(name):
+    if _DOT_ID.match(name) and name.lower() not in _DOT_KEYWORDS:
+        return name
+    return '"%s"' % name.replace('"', '\\"')
 
 # the TplgFormater class will format the output
 class TplgFormatter:
+    # parsed_tplg is either a LazyTplg or a list returned by TplgParser.parse()
     def __init__(self, parsed_tplg):
-        self._tplg = self._group_block(parsed_tplg)
-
-    def _group_block(self, parsed_tplg):
-        tplg = dict()
-        widget_list = []
-        graph_list = []
-        pcm_list = []
-        # the last item is tplg name, ignore it
-        for item in parsed_tplg[:-1]:
-            if "pcm" in item.keys():
-                pcm_list.append(sorted(item["pcm"],key=self._sort_by_id))
-            if "widget" in item.keys():
-                widget_list.append(item["widget"])
-            if "graph" in item.keys():
-                graph_list.append(item["graph"])
-            if "link" in item.keys():
-                tplg["link"] = sorted(item["link"],key=self._sort_by_id)
-            if "manifest" in item.keys():
-                tplg["manifest"] = item["manifest"]
-        tplg["pcm_list"] = pcm_list
-        tplg["graph_list"] = graph_list
-        tplg["widget_list"] = widget_list
-        tplg["name"] = parsed_tplg[-1]
-        return tplg
+        if not isinstance(parsed_tplg, LazyTplg):
+            parsed_tplg = LazyTplg.from_list(parsed_tplg)
+        self._parsed_tplg = parsed_tplg
+        # blocks are grouped on first access, see _get()
+        self._tplg = {}
+        # the graph is built on first use and shared by all query methods,
+        # call invalidate_graph() to force a rebuild
+        self._graph = None
+        # widget name/sname -> node index of the cached graph, see _index_nodes()
+        self._node_index = {}
+        self._name_collisions = {}
+        # (id(node), direction) -> nodes reachable from node, see _reachable_nodes()
+        self._closures = {}
+
+    # return grouped topology content of key, blocks of other content are left undecoded
+    def _get(self, key):
+        if key not in self._tplg:
+            self._tplg[key] = self._group_block(key)
+        return self._tplg[key]
+
+    def _group_block(self, key):
+        if key == "name":
+            return self._parsed_tplg.name
+        if key == "pcm_list":
+            return [sorted(item["pcm"],key=self._sort_by_id) for item in self._parsed_tplg.blocks("pcm")]
+        if key == "widget_list":
+            return [item["widget"] for item in self._parsed_tplg.blocks("widget")]
+        if key == "graph_list":
+            return [item["graph"] for item in self._parsed_tplg.blocks("graph")]
+        # only the last link and manifest block is kept
+        if key == "link":
+            links = [sorted(item["link"],key=self._sort_by_id) for item in self._parsed_tplg.blocks("link")]
+            return links[-1] if links else None
+        if key == "manifest":
+            manifests = [item["manifest"] for item in self._parsed_tplg.blocks("manifest")]
+            return manifests[-1] if manifests else None
+        raise KeyError(key)
 
     @staticmethod
     def _sort_by_id(item):
@@ -609,22 +732,37 @@ class TplgFormatter:
 
     # return the graph denoted by widget-control-widget array
     def get_tplg_raw_graph_list(self):
-        return self._tplg["graph_list"]
+        return self._get("graph_list")
 
     # graph node form: {"name":name, "widget":widget, "ctrl":ctrl, "source":source, "sink":sink}
     # return values:
     #   link_head_list: head node list of every graph
     #   node_list: list of all nodes
+    # the graph is built only once and cached, the same node objects are returned
+    # on every call until invalidate_graph() is called
     def link_graph(self):
+        if self._graph is None:
+            self._graph = self._build_graph()
+        return self._graph
+
+    # drop the cached graph, the next link_graph() call will rebuild it
+    def invalidate_graph(self):
+        self._graph = None
+        self._node_index = {}
+        self._name_collisions = {}
+        self._closures = {}
+
+    def _build_graph(self):
         node_list = self._init_node_list()
+        self._node_index, self._name_collisions = self._index_nodes(node_list)
         # const variables for graph
         SOURCE = 0
         CONTROL = 1
         SINK = 2
-        for graphs in self._tplg["graph_list"]:
+        for graphs in self._get("graph_list"):
             for graph in graphs:
-                source_node = self.find_node_by_name(graph[SOURCE], node_list)
-                sink_node = self.find_node_by_name(graph[SINK], node_list)
+                source_node = self.find_node_by_name(graph[SOURCE])
+                sink_node = self.find_node_by_name(graph[SINK])
 
                 # some of the names in graph are from widget["name"] (eg: PCM0P), and others are
                 # from widget["sname"] (eg: SSP1.OUT), use the name in graph as standard name of a node
@@ -666,64 +804,92 @@ class TplgFormatter:
     def _init_node_list(self):
         node_list = []
 
-        for widgets in self._tplg["widget_list"]:
+        for widgets in self._get("widget_list"):
             for widget in widgets:
                 node = {"name":widget["name"], "widget":widget, "ctrl":None, "source":None, "sink":None}
                 node_list.append(node)
         if node_list == []: # should never goes here
-            print("No widget in topology!")
-            sys.exit(1)
+            raise TplgError("No widget in topology!")
         return node_list
 
-    # find node by its name from node_list, as the name of a node is not unified to
-    # widget["name"] or widget["sname"], we should check both
+    # index nodes by both widget["name"] and widget["sname"], as the name of a node is
+    # not unified to either of them. When several widgets share a name, the first one
+    # in node_list owns it, the others are recorded in the returned collision dict.
     @staticmethod
-    def find_node_by_name(name, node_list):
-        if name == '': return None
+    def _index_nodes(node_list):
+        node_index = {}
+        collisions = {}
         for node in node_list:
-                if name == node["widget"]["name"] or name == node["widget"]["sname"]:
-                    return node
-        # if excution goes here, it means we didn't find the widget in the list,
-        # obviously, there is error in topology
-        print("Widget %s not exist, error in topology" %name)
-        sys.exit(1)
-        return None
-
-    @staticmethod
-    def recursive_search_comp(node, comp_type, comp_list, direction):
-        def comp_in_list(comp, comp_list):
-            for elem in comp_list:
-                if elem == comp["widget"]:
-                    return True
-            return False
-
+            for name in {node["widget"]["name"], node["widget"]["sname"]}:
+                if name == '':
+                    continue
+                if name not in node_index:
+                    node_index[name] = node
+                elif node_index[name] is not node:
+                    collisions.setdefault(name, [node_index[name]]).append(node)
+        return node_index, collisions
+
+    # find node by its widget name or sname from the cached graph
+    def find_node_by_name(self, name):
+        if name == '': return None
+        node = self._node_index.get(name)
         if node is None:
-            return
-
-        if type(node) == list:
-            for elem in node:
-                TplgFormatter.recursive_search_comp(elem, comp_type, comp_list, direction)
-
-        if type(node) != list and direction == "forward":
-            if node["widget"]["name"].startswith(comp_type):
-                if not comp_in_list(node, comp_list): comp_list.append(node["widget"])
-            TplgFormatter.recursive_search_comp(node["sink"], comp_type, comp_list, direction)
-
-        if type(node) != list and direction == "backward":
-            if node["widget"]["name"].startswith(comp_type):
-                if not comp_in_list(node, comp_list): comp_list.append(node["widget"])
-            TplgFormatter.recursive_search_comp(node["source"], comp_type, comp_list, direction)
-
-    # find specified type of components connected to ref_node
+            # if excution goes here, it means we didn't find the widget in the list,
+            # obviously, there is error in topology
+            raise TplgError("Widget %s not exist, error in topology" %name)
+        if name in self._name_collisions:
+            widgets = [elem["widget"]["name"] for elem in self._name_collisions.pop(name)]
+            print("Widget name %s is ambiguous, shared by %s, use %s" %(name, widgets, widgets[0]),
+                file=sys.stderr)
+        return node
+
+    # the "source" or "sink" field of a node may be None, a node or a node list
     @staticmethod
-    def find_connected_comp(ref_node, comp_type):
+    def _adjacent_nodes(node, direction):
+        adjacent = node["sink"] if direction == "forward" else node["source"]
+        if adjacent is None:
+            return []
+        if type(adjacent) != list:
+            return [adjacent]
+        return adjacent
+
+    # return all nodes reachable from node in the given direction ("forward" follows
+    # sinks, "backward" follows sources), node itself included, in depth-first
+    # pre-order. The search is iterative with a visited set, so shared subgraphs are
+    # walked only once and cycles or deep chains are safe. Results are memoized
+    # per node until invalidate_graph() is called.
+    def _reachable_nodes(self, node, direction):
+        key = (id(node), direction)
+        if key in self._closures:
+            return self._closures[key]
+        closure = []
+        visited = set()
+        stack = [node]
+        while stack:
+            elem = stack.pop()
+            if id(elem) in visited:
+                continue
+            visited.add(id(elem))
+            closure.append(elem)
+            # push in reverse order so the first adjacent node is visited first
+            stack.extend(reversed(self._adjacent_nodes(elem, direction)))
+        self._closures[key] = closure
+        return closure
+
+    # find specified type of components connected to ref_node, components found
+    # downstream come first, then the upstream ones
+    def find_connected_comp(self, ref_node, comp_type):
         if ref_node is None:
             return None
         comp_type = comp_type.upper() # to upper case
         comp_list = []
-        node = ref_node
-        TplgFormatter.recursive_search_comp(node, comp_type, comp_list, "forward")
-        TplgFormatter.recursive_search_comp(node, comp_type, comp_list, "backward")
+        found = set()
+        for direction in ["forward", "backward"]:
+            for node in self._reachable_nodes(ref_node, direction):
+                widget = node["widget"]
+                if widget["name"].startswith(comp_type) and id(widget) not in found:
+                    found.add(id(widget))
+                    comp_list.append(widget)
         return comp_list
 
     # find specified components for PCM
@@ -731,16 +897,45 @@ class TplgFormatter:
     #   [0]: specified components connected to playback
     #   [1]: specified components connected to capture
     def find_comp_for_pcm(self, pcm, comp_type):
-        _, node_list = self.link_graph()
+        self.link_graph()
         pcm_name = [pcm["caps"][0]["name"], pcm["caps"][1]["name"]]
-        playback_node = self.find_node_by_name(pcm_name[0], node_list) # playback node
-        capture_node = self.find_node_by_name(pcm_name[1], node_list) # capture node
+        playback_node = self.find_node_by_name(pcm_name[0]) # playback node
+        capture_node = self.find_node_by_name(pcm_name[1]) # capture node
         playback_comp = self.find_connected_comp(playback_node, comp_type)
         capture_comp = self.find_connected_comp(capture_node, comp_type)
         return [playback_comp, capture_comp]
 
+    # return the topology graph in DOT language. Every pipeline, a graph head with
+    # the widgets reachable from it, is a subgraph, and an edge of the topology graph
+    # is drawn in the first subgraph holding both of its widgets.
+    def to_dot(self):
+        head_list, _ = self.link_graph()
+        # edges in topology order, and the sinks of each source widget
+        edge_order = {}
+        sinks = {}
+        for raw_graph in self.get_tplg_raw_graph_list():
+            for source, _, sink in raw_graph:
+                if (source, sink) not in edge_order:
+                    edge_order[(source, sink)] = len(edge_order)
+                    sinks.setdefault(source, []).append(sink)
+        lines = ['digraph %s {' % _dot_id("Topology Graph")]
+        drawn = set()
+        for head in head_list:
+            names = list(dict.fromkeys(node["name"] for node in self._reachable_nodes(head, "forward")))
+            name_set = set(names)
+            edges = [(source, sink) for source in names for sink in sinks.get(source, [])
+                if sink in name_set and (source, sink) not in drawn]
+            edges.sort(key=edge_order.get)
+            drawn.update(edges)
+            lines.append('\tsubgraph %s {' % _dot_id('Pipeline' + head["name"]))
+            lines.extend('\t\t%s' % _dot_id(name) for name in names)
+            lines.extend('\t\t%s -> %s' % (_dot_id(source), _dot_id(sink)) for source, sink in edges)
+            lines.append('\t}')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
     def format_pcm(self):
-        pcms = self._merge_pcm_list(self._tplg["pcm_list"])
+        pcms = self._merge_pcm_list(self._get("pcm_list"))
         for pcm in pcms:
             fmt_list = TplgFormatter.get_pcm_fmt(pcm)
             pcm_type = TplgFormatter.get_pcm_type(pcm)
@@ -759,8 +954,7 @@ class TplgFormatter:
                 %(pcm["pcm_name"], pcm["pcm_id"], pcm_type, fmt[0], rates[0], rates[1], \
                 channel[0], channel[1]))
 
-    @staticmethod
-    def find_second_end_point(first_end_point, node_list):
+    def find_second_end_point(self, first_end_point, node_list):
         second_end_point = []
         for node in node_list:
             if node["source"] is not None and node["sink"] is not None:
@@ -769,7 +963,7 @@ class TplgFormatter:
                 continue
             if node["name"].startswith(first_end_point["name"][0:3]):
                 continue
-            end_node = TplgFormatter.find_connected_comp(first_end_point, node["name"])
+            end_node = self.find_connected_comp(first_end_point, node["name"])
             [second_end_point.append(node) for node in end_node]
         assert(len(second_end_point) == 1)
         return second_end_point[0]
@@ -790,21 +984,21 @@ class TplgFormatter:
             # or find a ALH* from a ALH*, (check sof-tgl-sdw-max98373-rt5682-2ch.png)
             # then these two pipeline are interweaved.
             # should only use the first three char to match.
-            endpoints = TplgFormatter.find_connected_comp(head, head["name"][0:3])
+            endpoints = self.find_connected_comp(head, head["name"][0:3])
             # if we find the second PCM*, SSP* or ALH*, end_points should contain 2 elements,
             # one is the referenc widget, the other is the found widget.
             if len(endpoints) < 2: continue
-            endpoints_nodes = [self.find_node_by_name(widget["name"], node_list) for widget in endpoints]
+            endpoints_nodes = [self.find_node_by_name(widget["name"]) for widget in endpoints]
             interweaved_endpoints = []
             # find the other two endpoints
             for ed in endpoints_nodes:
-                second_endpoint = TplgFormatter.find_second_end_point(ed, node_list)
-                interweaved_endpoints.append(self.find_node_by_name(second_endpoint["name"], node_list))
+                second_endpoint = self.find_second_end_point(ed, node_list)
+                interweaved_endpoints.append(self.find_node_by_name(second_endpoint["name"]))
             interweaved_endpoints.extend(endpoints_nodes)
             interweaved_list.append(interweaved_endpoints)
         interweaved_dict = {}
         for interweaved_endpoints in interweaved_list:
-            comp_found = [TplgFormatter.find_connected_comp(node, comp) for node in interweaved_endpoints]
+            comp_found = [self.find_connected_comp(node, comp) for node in interweaved_endpoints]
             if any(comp_found):
                 interweaved_dict["name"] = [node["name"] for node in interweaved_endpoints if node["name"].startswith("PCM")]
                 interweaved_dict["sname"] = [node["widget"]["sname"] for node in interweaved_endpoints if node["name"].startswith("PCM")]
@@ -829,6 +1023,10 @@ if __name__ == "__main__":
         parser.add_argument('-F', '--format', type=str, default="png", help="output format for generated graph, check "
             "https://graphviz.gitlab.io/_pages/doc/info/output.html for all supported formats")
         parser.add_argument('-V', '--live_view', action="store_true", help="generate and view topology graph")
+        parser.add_argument('-S', '--source', action="store_true", help="only write the DOT source <name>.gv "
+            "of the graph, graphviz is not needed")
+        parser.add_argument('-j', '--jobs', type=int, default=1, help="number of topologies to parse and dump "
+            "in parallel, 0 for one per CPU")
 
 
         return vars(parser.parse_args())
@@ -842,11 +1040,11 @@ if __name__ == "__main__":
             print("path %s not exist!" %tplg_root)
             sys.exit(1)
         if cmd_args["filename"] == "all":
-            files = os.walk(tplg_root)
-            for _, _, files in os.walk(tplg_root, topdown=False):
+            for dirpath, _, files in os.walk(tplg_root, topdown=False):
                 for name in files:
-                    if name.endswith(".tplg"): tplg_paths.append(tplg_root + '/' + name)
-            return tplg_paths
+                    if name.endswith(".tplg"): tplg_paths.append(os.path.join(dirpath, name))
+            # walk order depends on the file system, sort for a stable output order
+            return sorted(tplg_paths)
 
         for f in cmd_args["filename"].split(','):
             if len(tplg_root) > 0:
@@ -854,103 +1052,102 @@ if __name__ == "__main__":
             tplg_paths.append(f)
         return tplg_paths
 
-    def connect(graph, raw_graph_list, nodes_added, edges):
-        for raw_graph in raw_graph_list:
-            for link in raw_graph:
-                if link[0] in nodes_added and link[2] in nodes_added:
-                    new_edge = (link[0], link[2])
-                    if new_edge not in edges:
-                        graph.edge(*new_edge)
-                        edges.append(new_edge)
-
-
-    # traverse all nodes, and add them to graph
-    def init_node(graph, head, nodes_added):
-        # this function is used to deal with multiple connections.
-        def inner_init(graph, head, nodes_added):
-            if head["sink"] != None and type(head) != list:
-                if head["name"] in nodes_added:
-                    return
-                graph.node(name=head["name"])
-                nodes_added.append(head["name"])
-                init_node(graph, head["sink"], nodes_added)
-            elif head["sink"] != None:
-                for node in head["sink"]:
-                    init_node(graph, node, nodes_added)
-            else :
-                if head["name"] in nodes_added:
-                    return
-                graph.node(name=head["name"])
-                nodes_added.append(head["name"])
-
-        assert(head is not None) # make sure head is not None
-        if type(head) != list:
-            inner_init(graph, head, nodes_added)
-        else :
-            for subhead in head:
-                inner_init(graph, subhead, nodes_added)
-
-    def dump_pcm_info(parsed_tplgs):
-        for tplg in parsed_tplgs:
-            formatter = TplgFormatter(tplg)
-            formatter.format_pcm()
-            print()
-
-    def dump_graph(parsed_tplgs, cmd_args):
+    def dump_pcm_info(tplg):
+        formatter = TplgFormatter(tplg)
+        formatter.format_pcm()
+        print()
+
+    # parse and dump one topology, may run in a worker process of parallel_map.
+    # Return the pcm output and the DOT source of the graph, the pcm output is the
+    # error message instead if the topology is malformed.
+    def dump_tplg(job):
+        tplg_path, dumps = job
+        pcm_out, dot_source = io.StringIO(), None
         try:
-            from graphviz import Digraph
-        except:
-            print("graphviz package not installed, please install with `sudo apt install python3-graphviz`")
-            sys.exit(1)
-
+            tplg = TplgParser(TplgCache.default()).parse(tplg_path)
+            if 'pcm' in dumps:
+                with redirect_stdout(pcm_out):
+                    dump_pcm_info(tplg)
+            if 'graph' in dumps:
+                dot_source = TplgFormatter(tplg).to_dot()
+        except (TplgError, struct.error, OSError) as e:
+            # reported per topology, the other topologies are still dumped
+            return False, "%s\n" % e, None
+        return True, pcm_out.getvalue(), dot_source
+
+    # write the DOT sources, and render them with up to jobs dot processes at a time.
+    # graphs is a list of (topology path, DOT source). Return False if any rendering failed.
+    def dump_graphs(graphs, cmd_args, jobs):
+        # pylint: disable=C0415
+        from concurrent.futures import ThreadPoolExecutor
+
+        # if run the tool over ssh, live view feature will be disabled
+        if cmd_args['live_view'] and not cmd_args['source'] and 'DISPLAY' not in os.environ.keys():
+            print("No available GUI over ssh, unable to view the graph")
+            return True
         format = cmd_args['format'].strip()
-        dir = cmd_args['directory'].strip()
-
-        for tplg in parsed_tplgs:
-            # the last element in tplg is topology path
-            outfile = tplg[-1].split(sep='/')[-1].split('.')[0]
-            formatter = TplgFormatter(tplg)
-            head_list, _ = formatter.link_graph()
-            # graph denoted by list of widget-control-widget list
-            raw_graph_list = formatter.get_tplg_raw_graph_list()
-
-            graph = Digraph("Topology Graph", format=format)
-            # There is no method in python-graphviz to detect if there is already an edge
-            # between two nodes, we need to record it manually
-            edges = []
-            # Here we make every pipeline as a subgraph, this gives us more precise control
-            for head in head_list:
-                subgraph = Digraph('Pipeline' + head['name'])
-                nodes_added = []
-                init_node(subgraph, head, nodes_added)
-                connect(subgraph, raw_graph_list, nodes_added, edges)
-                # add subgraph to the graph
-                graph.subgraph(graph=subgraph)
-            # Developers may want to view graph without saving it.
-            if cmd_args['live_view']:
-                # if run the tool over ssh, live view feature will be disabled
-                if 'DISPLAY' not in os.environ.keys():
-                    print("No available GUI over ssh, unable to view the graph")
-                else:
-                    graph.view(filename=outfile, directory='/tmp', cleanup=True)
-            else:
-                graph.render(filename=outfile, directory=dir, cleanup=True)
+        # Developers may want to view graph without saving it.
+        dir = '/tmp' if cmd_args['live_view'] else cmd_args['directory'].strip()
+
+        def render(graph):
+            tplg_path, dot_source = graph
+            outfile = os.path.join(dir, tplg_path.split(sep='/')[-1].split('.')[0])
+            # a graph which can't be written or rendered only fails its own topology
+            try:
+                with open(outfile + '.gv', 'w', encoding='utf-8') as fd:
+                    fd.write(dot_source)
+                if cmd_args['source']:
+                    return True
+                try:
+                    proc = subprocess.run(['dot', '-T' + format, '-o', outfile + '.' + format, outfile + '.gv'],
+                        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, check=False)
+                finally:
+                    os.remove(outfile + '.gv')
+                if proc.returncode != 0:
+                    print("%s: failed to render graph: %s" % (tplg_path, proc.stderr.strip()))
+                    return False
+                if cmd_args['live_view']:
+                    with subprocess.Popen(['xdg-open', outfile + '.' + format]):
+                        pass
+            except OSError as e:
+                print("%s: failed to render graph: %s" % (tplg_path, e))
+                return False
+            return True
 
-    parsed_tplg_list = []
+        try:
+            os.makedirs(dir, exist_ok=True)
+        except OSError as e:
+            print("failed to create graph directory: %s" % e)
+            return False
+        # the work is done by the dot processes, threads are enough to keep them running
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+            return all(list(executor.map(render, graphs)))
 
     cmd_args = parse_cmdline()
 
     tplg_paths = get_tplg_paths(cmd_args)
 
-    tplg_parser = TplgParser()
-
-    for tplg in tplg_paths:
-        parsed_tplg_list.append(tplg_parser.parse(tplg))
-
     supported_dump = ['pcm', 'graph']
     dump_types = supported_dump if cmd_args['dump'] is None else cmd_args['dump'].split(',')
     dump_types = list(map(lambda elem: elem.strip(), dump_types))
-    if 'pcm' in dump_types:
-        dump_pcm_info(parsed_tplg_list)
-    if 'graph' in dump_types:
-        dump_graph(parsed_tplg_list, cmd_args)
+    no_graphviz = False
+    if 'graph' in dump_types and not cmd_args['source'] and shutil.which('dot') is None:
+        no_graphviz = True
+        dump_types.remove('graph')
+
+    # a malformed topology only fails itself, the others are still dumped
+    results = parallel_map(dump_tplg, [(tplg, dump_types) for tplg in tplg_paths], cmd_args['jobs'])
+    for tplg_name, (ok, output, _) in zip(tplg_paths, results):
+        if not ok and len(tplg_paths) > 1:
+            output = "%s: %s" % (tplg_name, output)
+        sys.stdout.write(output)
+    if no_graphviz and any(ok for ok, _, _ in results):
+        print("graphviz not installed, please install with `sudo apt install graphviz`, "
+            "or use -S to write the graph source only")
+        sys.exit(1)
+    dot_sources = [(tplg_name, dot_source) for tplg_name, (_, _, dot_source) in zip(tplg_paths, results)
+        if dot_source is not None]
+    if not dump_graphs(dot_sources, cmd_args, cmd_args['jobs']):
+        sys.exit(1)
+    if not all(ok for ok, _, _ in results):
+        sys.exit(1)
@@ -8,10 +8,22 @@ A Tool to Generate and Manipulate Wave Files
 Supported features:
 - generate sinusoids
 - give verdict in check-smart-amplifier test case by binary wave comparison
+- give verdict in check-keyword-detection test case by THD+N
+- measure delay between channels by cross-correlation, for smart amplifier
+  feedback, echo reference and loopback paths
+- analyze a batch of recorded waves in parallel, with one report of all of them
+
+Recorded waves are memory-mapped and analyzed block by block, so memory use
+does not grow with their length.
 """
 
+import os
 import sys
+import glob
+import json
+import struct
 import argparse
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 import scipy.signal as signal
 import scipy.io.wavfile as wavefile
@@ -21,9 +33,25 @@ import scipy.io.wavfile as wavefile
 # is wrong with firmware scheduler.
 SMART_AMP_DELAY_THRESHOLD = 8
 
+# Exit status of failed verdicts
+SMART_AMP_FAILED = 1001
+WOV_FAILED = 1002
+
+# Frames of each block read by streaming analysis.
+BLOCK_FRAMES = 65536
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
 # Module level global variable which will store command line parameters later
 cmd = None
 
+class WaveError(ValueError):
+    """
+    A wave can't be generated or analyzed, eg. a malformed or silent recorded wave
+    """
+
 def generate_sine_mono(amp, freq, phase, fs, duration):
     """
     Generate mono sine wave.
@@ -92,7 +120,7 @@ def generate_wav():
     elif cmd.generate == 'wov':
         wave_data = generate_wov()
     else:
-        raise Exception('invalid generate function, will generate nothing')
+        raise WaveError('invalid generate function, will generate nothing')
     return wave_data
 
 def save_wave(wave_data):
@@ -106,125 +134,532 @@ def save_wave(wave_data):
         wave_data = (np.iinfo(np_types[sample_bits]).max * wave_data).astype(np_types[sample_bits])
     wavefile.write(wave_path, cmd.sample_rate, wave_data)
 
-def do_wave_analysis():
-    fs_wav, wave = wavefile.read(cmd.recorded_wave)
+class WaveReader:
+    """
+    Read samples of a WAV file block by block from a memory map of the file.
+
+    Samples have the same type as ``scipy.io.wavfile.read`` gives: unsigned 8-bit,
+    signed 16, 32 and 64-bit integer, 32 and 64-bit float, and 24-bit packed samples
+    in the upper bytes of 32-bit integers. WAVE_FORMAT_EXTENSIBLE files are read as
+    their sub format.
+
+    ``raw`` is a zero-copy ``np.memmap`` view of the samples in the file, of shape
+    (frames, channels), or (frames, channels, 3) bytes for 24-bit packed samples.
+    """
+    def __init__(self, path):
+        self.path = path
+        fmt = None
+        with open(path, 'rb') as fd:
+            riff_header = fd.read(12)
+            if len(riff_header) < 12 or riff_header[:4] != b'RIFF' or riff_header[8:] != b'WAVE':
+                raise WaveError('%s: not a RIFF WAVE file' % path)
+            while True:
+                chunk_header = fd.read(8)
+                if len(chunk_header) < 8:
+                    raise WaveError('%s: no data chunk found' % path)
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+                if chunk_id == b'data':
+                    break
+                if chunk_id == b'fmt ':
+                    fmt = fd.read(chunk_size)
+                    fd.seek(chunk_size % 2, os.SEEK_CUR)
+                else:
+                    # chunks are word aligned
+                    fd.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+            self.offset = fd.tell()
+            # the size in the header is wrong if recording was interrupted
+            data_size = min(chunk_size, os.fstat(fd.fileno()).st_size - self.offset)
+        if fmt is None or len(fmt) < 16:
+            raise WaveError('%s: no fmt chunk found' % path)
+        format_tag, self.channels, self.fs, _, self.block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # the sub format GUID starts with the format tag
+            format_tag = struct.unpack('<H', fmt[24:26])[0]
+        if self.channels == 0 or self.block_align == 0:
+            raise WaveError('%s: invalid block align %d of %d channels' % (path, self.block_align, self.channels))
+        sample_bytes = self.block_align // self.channels
+        self.packed = False
+        if format_tag == WAVE_FORMAT_PCM and bits <= 8:
+            self.file_dtype = np.dtype(np.uint8)
+        elif format_tag == WAVE_FORMAT_PCM and sample_bytes == 3:
+            self.file_dtype = np.dtype(np.uint8)
+            self.packed = True
+        elif format_tag == WAVE_FORMAT_PCM and sample_bytes in [2, 4, 8]:
+            self.file_dtype = np.dtype('<i%d' % sample_bytes)
+        elif format_tag == WAVE_FORMAT_IEEE_FLOAT and sample_bytes in [4, 8]:
+            self.file_dtype = np.dtype('<f%d' % sample_bytes)
+        else:
+            raise WaveError('%s: unsupported format %#x with %d-bit samples' % (path, format_tag, bits))
+        if self.block_align != sample_bytes * self.channels:
+            raise WaveError('%s: unsupported block align %d of %d channels' % (path, self.block_align, self.channels))
+        self.dtype = np.dtype('<i4') if self.packed else self.file_dtype
+        self.frames = data_size // self.block_align
+        shape = (self.frames, self.channels, 3) if self.packed else (self.frames, self.channels)
+        if self.frames > 0:
+            self.raw = np.memmap(path, dtype=self.file_dtype, mode='r', offset=self.offset, shape=shape)
+        else:
+            # an empty file can not be mapped
+            self.raw = np.zeros(shape, dtype=self.file_dtype)
+
+    def _decode(self, raw):
+        if not self.packed:
+            return np.asarray(raw)
+        # put the 3 bytes of each sample in the upper bytes of a 32-bit integer
+        samples = np.zeros(raw.shape[:2] + (4,), dtype=np.uint8)
+        samples[:,:,1:] = raw
+        return samples.view(self.dtype)[:,:,0]
+
+    def blocks(self, start=0, stop=None, block_frames=BLOCK_FRAMES):
+        """
+        Read samples block by block, blocks are views of the memory map
+        except for 24-bit packed samples.
+
+        Parameters
+        ----------
+        start: The first frame to read
+        stop: The frame to stop reading at, the end of the wave if None
+        block_frames: Frames of each block
+
+        Returns
+        ----------
+        A generator of 2-D arrays of samples, of shape (frames, channels)
+        """
+        stop = self.frames if stop is None else min(stop, self.frames)
+        for block_start in range(start, stop, block_frames):
+            yield self._decode(self.raw[block_start:min(block_start + block_frames, stop)])
+
+    def channel(self, index, start, stop):
+        """
+        Read samples of one channel, samples out of the wave are zeros.
+
+        Returns
+        ----------
+        Real 1-D Array of samples from frame start to frame stop
+        """
+        samples = np.zeros(stop - start, dtype=self.dtype)
+        begin, end = max(start, 0), min(stop, self.frames)
+        if begin < end:
+            samples[begin - start:end - start] = self._decode(self.raw[begin:end, index:index + 1])[:,0]
+        return samples
+
+class ZeroScanner:
+    """
+    Find the trim points and the zero marker of a wave fed block by block, with the
+    same results as ``find_zero_marker(trim_wave(wave)[0][:,0], 0)``, which test_wavetool.py
+    checks. With marker False, only the trim points are searched.
+    """
+    def __init__(self, dtype, marker=True):
+        self.zero_threshold_level = np.power(10, cmd.zero_threshold / 20.) * np.iinfo(dtype).max
+        self.frames = 0
+        # first and last samples above the threshold
+        self.left_idx = None
+        self.right_idx = None
+        # the last sample not below the threshold, since the left index
+        self.last_loud_idx = None
+        # span of samples below the threshold with the zero marker, and its first window
+        self.marker = None
+        self.find_marker = marker
+
+    def feed(self, mono):
+        level = np.abs(mono)
+        above_threshold = np.flatnonzero(level > self.zero_threshold_level) + self.frames
+        if len(above_threshold) > 0:
+            if self.left_idx is None:
+                self.left_idx = above_threshold[0]
+            self.right_idx = above_threshold[-1]
+        if self.find_marker and self.left_idx is not None and self.marker is None:
+            loud = np.flatnonzero(level >= self.zero_threshold_level) + self.frames
+            loud = loud[loud >= self.left_idx]
+            if self.last_loud_idx is not None:
+                loud = np.concatenate(([self.last_loud_idx], loud))
+            if len(loud) > 0:
+                self.last_loud_idx = loud[-1]
+            # spans between two samples not below the threshold, and the first window
+            # from the left index of each span, windows are checked every 200 samples
+            span_start, span_end = loud[:-1] + 1, loud[1:]
+            window = self.left_idx + (span_start - self.left_idx + 199) // 200 * 200
+            found = np.flatnonzero(window + 100 <= span_end)
+            if len(found) > 0:
+                self.marker = span_start[found[0]], span_end[found[0]], window[found[0]]
+        self.frames += len(mono)
+
+    def trim_points(self):
+        """
+        Returns
+        ----------
+        The trim points, the index of the first sample and the index after the last
+        sample of the trimmed wave
+        """
+        if self.left_idx is None or self.left_idx >= self.frames - 1:
+            raise WaveError("Recorded wave: volume too low or only contains zero")
+        return int(self.left_idx), int(self.right_idx)
+
+    def result(self):
+        """
+        Returns
+        ----------
+        The trim points, and the zero marker, indexes in the trimmed wave as
+        ``find_zero_marker`` returns
+        """
+        left_idx, right_idx = self.trim_points()
+        length = right_idx - left_idx
+        if self.marker is None or self.marker[2] - self.left_idx > length - 200:
+            raise WaveError('Zero marker not found')
+        marker_start = int(self.marker[0]) - left_idx - 1
+        marker_end = int(self.marker[1]) - left_idx
+        return left_idx, right_idx, marker_start, marker_end if marker_end < length else length - 1
+
+def analyze_recording(path):
+    """
+    Analyze a recorded wave as cmd.analyze.
+
+    Returns
+    ----------
+    A dict of metrics of the analysis, with the verdict as exit 'status', 0 if passed,
+    and 'messages' to report it
+    """
+    reader = WaveReader(path)
     if cmd.analyze == 'smart_amp':
-        analyze_wav_smart_amp(wave, fs_wav)
+        return analyze_wav_smart_amp(reader)
     if cmd.analyze == 'wov':
-        analyze_wav_wov(wave, fs_wav)
+        return analyze_wav_wov(reader)
+    return analyze_wav_latency(reader, WaveReader(cmd.reference) if cmd.reference else reader)
 
-# remove digital zeros in two sides
+def do_wave_analysis():
+    if cmd.batch or cmd.manifest:
+        try:
+            paths = batch_recordings()
+        except (WaveError, OSError) as e:
+            # no recorded wave to analyze, exit 1 with the message
+            sys.exit(str(e))
+        do_batch_analysis(paths)
+        return
+    result = analyze_recording(cmd.recorded_wave)
+    print('\n'.join(result['messages']))
+    if result['status'] != 0:
+        sys.exit(result['status'])
+
+def batch_recordings():
+    """
+    Returns
+    ----------
+    Paths of recorded waves matching cmd.batch patterns, then the ones listed in the
+    cmd.manifest file, one per line, relative to the manifest directory
+    """
+    paths = []
+    for pattern in cmd.batch or []:
+        # a path is reported as an error if it does not exist, not skipped
+        if not glob.has_magic(pattern):
+            paths.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise WaveError('No recorded wave matches %s' % pattern)
+        paths += matches
+    if cmd.manifest:
+        manifest_dir = os.path.dirname(cmd.manifest)
+        with open(cmd.manifest, encoding='utf-8') as fd:
+            for line in fd:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    paths.append(os.path.join(manifest_dir, line))
+    return paths
+
+def init_batch_worker(args):
+    # pylint: disable=W0603
+    global cmd
+    cmd = args
+    # recordings are analyzed in parallel, channel pairs of each one are not
+    cmd.jobs = 1
+
+# analyze a recorded wave in a worker process, errors are reported like failed verdicts
+def analyze_batch_recording(path):
+    try:
+        result = analyze_recording(path)
+    except (ValueError, OSError) as e:
+        result = {'status': 1, 'error': str(e), 'messages': ['%s: %s' % (type(e).__name__, e)]}
+    result['file'] = path
+    return result
+
+def do_batch_analysis(paths):
+    """
+    Analyze recorded waves of paths in cmd.jobs processes, print the verdict and messages
+    of each one, and save all metrics to cmd.report as JSON.
+    Exit with the status of the first failed verdict, or 1 if only errors happened.
+    """
+    with ProcessPoolExecutor(max_workers=cmd.jobs or None, initializer=init_batch_worker,
+                             initargs=(cmd,)) as executor:
+        results = list(executor.map(analyze_batch_recording, paths))
+    for result in results:
+        verdict = 'ERROR' if 'error' in result else 'FAILED' if result['status'] != 0 else 'PASSED'
+        print('%s: %s' % (result['file'], verdict))
+        for message in result['messages']:
+            print('    %s' % message)
+    errors = [result for result in results if 'error' in result]
+    failed = [result for result in results if result['status'] != 0 and 'error' not in result]
+    print('%d recorded waves analyzed: %d passed, %d failed, %d errors' %
+          (len(results), len(results) - len(failed) - len(errors), len(failed), len(errors)))
+    if cmd.report:
+        with open(cmd.report, 'w', encoding='utf-8') as fd:
+            json.dump({'analyze': cmd.analyze, 'results': results}, fd, indent=2)
+    if failed:
+        sys.exit(failed[0]['status'])
+    if errors:
+        sys.exit(1)
+
+# remove digital zeros in two sides, the whole wave reference of ``ZeroScanner``
 def trim_wave(wave):
     # once waves go through DAC/ADC, zero will become small value close to zero,
     # here we set the digital zero threshold to 100, and cut samples below 100
     # of two sides, this has no negative impact to processing.
     zero_threshold_level = np.power(10, cmd.zero_threshold / 20.) * np.iinfo(wave.dtype).max
-    wave_mono = wave[:,0]
-    left_idx = 0
-    right_idx = wave_mono.shape[0] - 1
-    while True:
-        if abs(wave_mono[left_idx]) > zero_threshold_level:
-            break
-        left_idx = left_idx + 1
-        # the left index goes to the rightmost, then we may only have 0 in the recorded wave
-        if left_idx == wave.shape[0] - 1:
-            raise Exception("Recorded wave: volume too low or only contains zero")
-    while True:
-        if abs(wave_mono[right_idx]) > zero_threshold_level:
-            break
-        right_idx = right_idx - 1
+    above_threshold = np.abs(wave[:,0]) > zero_threshold_level
+    # the last sample is not searched from the left, if only it is above the threshold,
+    # we may only have 0 in the recorded wave
+    if not above_threshold[:-1].any():
+        raise WaveError("Recorded wave: volume too low or only contains zero")
+    left_idx = int(np.argmax(above_threshold))
+    right_idx = wave.shape[0] - 1 - int(np.argmax(above_threshold[::-1]))
     return wave[left_idx:right_idx,:], left_idx
 
 # float point binary comparison is not supported, and will not be supported
 # check recorded wave through smart amplifier component
-def analyze_wav_smart_amp(wave, fs):
-    trimed_ch_0_1, delay1 = trim_wave(wave[:,0:2])
-    trimed_ch_2_3, delay2 = trim_wave(wave[:,2:4])
-    samples_compare = min(trimed_ch_0_1.shape[0], trimed_ch_2_3.shape[0])
-    is_bin_same = np.array_equal(trimed_ch_0_1[0:samples_compare,:], trimed_ch_2_3[0:samples_compare,:])
-    smart_amp_delay = ((delay2 - delay1) / fs * 1000)
-
-    print('Delay of smart amplifier is %0.3fms' % smart_amp_delay)
+# the wave is read from reader, a ``WaveReader``, trimmed and compared block by block,
+# return the result as ``analyze_recording``
+def analyze_wav_smart_amp(reader):
+    if reader.channels < 4:
+        raise WaveError('%s: smart amplifier needs 4 channels, got %d' % (reader.path, reader.channels))
+    # channel 0/1 are trimmed as channel 0, channel 2/3 as channel 2
+    trim_scanners = [ZeroScanner(reader.dtype, marker=False) for _ in range(2)]
+    for block in reader.blocks():
+        trim_scanners[0].feed(block[:,0])
+        trim_scanners[1].feed(block[:,2])
+    delay1, right_idx1 = trim_scanners[0].trim_points()
+    delay2, right_idx2 = trim_scanners[1].trim_points()
+    samples_compare = min(right_idx1 - delay1, right_idx2 - delay2)
+    # compare samples as they are in the file, without decoding them
+    is_bin_same = True
+    for start in range(0, samples_compare, BLOCK_FRAMES):
+        stop = min(start + BLOCK_FRAMES, samples_compare)
+        if not np.array_equal(reader.raw[delay1 + start:delay1 + stop, 0:2],
+                              reader.raw[delay2 + start:delay2 + stop, 2:4]):
+            is_bin_same = False
+            break
+    smart_amp_delay = ((delay2 - delay1) / reader.fs * 1000)
+
+    result = {'trim': [delay1, delay2], 'delay': smart_amp_delay, 'bin_same': is_bin_same}
+    result['messages'] = ['Delay of smart amplifier is %0.3fms' % smart_amp_delay]
     if is_bin_same and smart_amp_delay < SMART_AMP_DELAY_THRESHOLD:
-        print('Data of channel 0/1 is binary same as data of channel 2/3')
-        print('Wave comparison result: PASSED')
+        result['messages'] += ['Data of channel 0/1 is binary same as data of channel 2/3',
+                               'Wave comparison result: PASSED']
+        result['status'] = 0
     else:
-        print('Data of channel 0/1 is not binary same as data of channel 2/3')
-        print('Wave comparison result: FAILED')
-        sys.exit(1001)
+        result['messages'] += ['Data of channel 0/1 is not binary same as data of channel 2/3',
+                               'Wave comparison result: FAILED']
+        result['status'] = SMART_AMP_FAILED
+    return result
+
+def measure_delay(reference, processed, max_lag, interpolate=False):
+    """
+    Measure delay of processed samples from reference samples by FFT cross-correlation.
+
+    Parameters
+    ----------
+    reference: Reference samples
+    processed: Processed samples, from max_lag samples before the first reference sample
+        to max_lag samples after the last one
+    max_lag: The longest delay to search, unit: sample
+    interpolate: Interpolate the correlation peak with a parabola for sub-sample delay
+
+    Returns
+    ----------
+    Delay, unit: sample, negative if processed samples are ahead, and the normalized
+    correlation at the delay, from -1.0 to 1.0
+    """
+    reference = reference.astype(np.float64)
+    processed = processed.astype(np.float64)
+    corr = signal.correlate(processed, reference, mode='valid', method='fft')
+    peak = int(np.argmax(np.abs(corr)))
+    delay = float(peak - max_lag)
+    if interpolate and 0 < peak < len(corr) - 1:
+        before, at, after = np.abs(corr[peak - 1:peak + 2])
+        curvature = before - 2 * at + after
+        if curvature != 0:
+            delay += 0.5 * (before - after) / curvature
+    energy = np.sum(np.power(reference, 2)) * np.sum(np.power(processed[peak:peak + len(reference)], 2))
+    return delay, corr[peak] / np.sqrt(energy) if energy > 0 else 0.
+
+def analyze_wav_latency(reader, ref_reader):
+    """
+    Measure delay of channel pairs in cmd.pairs, from the reference channel in ref_reader
+    to the processed channel in reader, both ``WaveReader``. Reference channels are
+    correlated from the first to the last sample above the zero threshold, or for
+    cmd.window seconds, so a sine wave has to start and stop in the window, or its delay
+    is only known up to a period. Pairs are measured in parallel.
+
+    Returns
+    ----------
+    The result as ``analyze_recording``, the verdict is always passed
+    """
+    fs = reader.fs
+    if ref_reader.fs != fs:
+        raise WaveError('Sample rate of reference wave %d is not %d' % (ref_reader.fs, fs))
+    for ref, out in cmd.pairs:
+        if ref >= ref_reader.channels or out >= reader.channels:
+            raise WaveError('%s: channel pair %d:%d out of %d reference and %d processed channels' %
+                            (reader.path, ref, out, ref_reader.channels, reader.channels))
+    max_lag = int(cmd.max_delay / 1000 * fs)
+    trim_scanners = {ref: ZeroScanner(ref_reader.dtype, marker=False) for ref, _ in cmd.pairs}
+    for block in ref_reader.blocks():
+        for ref, scanner in trim_scanners.items():
+            scanner.feed(block[:,ref])
+    trim_points = {ref: scanner.trim_points() for ref, scanner in trim_scanners.items()}
+
+    def measure_pair(pair):
+        ref, out = pair
+        start, stop = trim_points[ref]
+        if cmd.window is not None:
+            stop = min(stop, start + int(cmd.window * fs))
+        return measure_delay(ref_reader.channel(ref, start, stop),
+                             reader.channel(out, start - max_lag, stop + max_lag), max_lag, cmd.interpolate)
+
+    with ThreadPoolExecutor(max_workers=cmd.jobs or len(cmd.pairs)) as executor:
+        delays = list(executor.map(measure_pair, cmd.pairs))
+    result = {'latency': [], 'messages': [], 'status': 0}
+    for (ref, out), (delay, corr) in zip(cmd.pairs, delays):
+        result['latency'].append({'ref': ref, 'out': out, 'delay': delay / fs * 1000, 'correlation': float(corr)})
+        result['messages'].append('Delay of channel %d to channel %d is %0.3fms, correlation %0.3f' %
+                                  (ref, out, delay / fs * 1000, corr))
+    return result
 
 def find_zero_marker(wave, start, backward=False):
-    # use a window of size 100 to find a rough zero marker index
-    step = 100
-    if backward:
-        step = -step
+    """
+    Find the zero marker, a span of samples below the zero threshold, from start.
+
+    Windows of 100 samples at start, start + 200, start + 400 (or start - 200, start - 400
+    with backward), ... are checked, a jump of 200 samples will not jump over zero marker.
+    The zero marker is the span of samples below the threshold around the first window
+    with only such samples. This is the whole wave reference of ``ZeroScanner``.
+
+    Returns
+    ----------
+    The index of the last sample above the threshold before the zero marker (0 if none),
+    and the index of the first one after it (the last index of the wave if none)
+    """
+    win = 100
     zero_threshold_level = np.power(10, cmd.zero_threshold / 20.) * np.iinfo(wave.dtype).max
-    win = zero_threshold_level * np.ones(abs(step), dtype=wave.dtype)
-    while not np.all(np.abs(wave[start:start + abs(step)]) < win):
-        start = start + 2 * step # a jump of 200 samples will not jump over zero marker
-        if (not backward and start > wave.shape[0] - 2 * abs(step)) or (backward and start < 2 * abs(step)):
-            raise Exception('Zero marker not found')
-    end = start
-    while np.all(np.abs(wave[start:start + abs(step)]) < win) and start > 0:
-        start = start - 1
-    while np.all(np.abs(wave[end:end + abs(step)]) < win) and end + abs(step) < wave.shape[0]:
-        end = end + 1
-    return start, end + abs(step) - 1
-
-def stdnotch(wave, fn, fs):
+    below_threshold = np.abs(wave) < zero_threshold_level
+    # spans of samples below the threshold: [span_start, span_end), only spans
+    # which fit a window can have the zero marker
+    edges = np.flatnonzero(np.diff(below_threshold, prepend=False, append=False))
+    span_start, span_end = edges[0::2], edges[1::2]
+    long_spans = span_end - span_start >= win
+    span_start, span_end = span_start[long_spans], span_end[long_spans]
+    # the first window of each span to be checked, and whether it fits the span, a
+    # window is only checked if it is the start one, or not closer than 200 samples to
+    # the wave boundary in the search direction
+    if not backward:
+        first = np.maximum(span_start, start)
+        window = start + (first - start + 2 * win - 1) // (2 * win) * 2 * win
+        found = (window <= span_end - win) & ((window == start) | (window <= wave.shape[0] - 2 * win))
+        span_idx = np.flatnonzero(found)[:1]
+    else:
+        last = np.minimum(span_end - win, start)
+        window = start - (start - last + 2 * win - 1) // (2 * win) * 2 * win
+        found = (window >= span_start) & ((window == start) | (window >= 2 * win))
+        span_idx = np.flatnonzero(found)[-1:]
+    if len(span_idx) == 0:
+        raise WaveError('Zero marker not found')
+    marker_start, marker_end = span_start[span_idx[0]], span_end[span_idx[0]]
+    return max(int(marker_start) - 1, 0), int(marker_end) if marker_end < wave.shape[0] else wave.shape[0] - 1
+
+def notch_filter(fn, fs):
     target_q = 2.1
-    b, a = signal.iirnotch(fn, target_q, fs)
-    return signal.lfilter(b, a, wave, axis=0)
+    return signal.iirnotch(fn, target_q, fs)
 
 def normalize(data):
     max_val = np.iinfo(data.dtype).max
     return data / max_val
 
-def analyze_wav_wov(wave, fs):
+def analyze_wav_wov(reader):
     """
     Specially designed wave are used in WoV test, see documentation of ``generate_wov``.
     We will filter out target freq and calculate THD+N value of low volume and high volume
     sine wave.
+
+    The wave is read twice block by block from reader, a ``WaveReader``, first to find
+    the trim points and the zero marker, then to calculate THD+N of the sine waves.
+
+    Returns
+    ----------
+    The result as ``analyze_recording``
     """
-    trimmed_wave, _ = trim_wave(wave)
-    marker_start, marker_end = find_zero_marker(trimmed_wave[:,0], 0)
+    fs = reader.fs
+    scanner = ZeroScanner(reader.dtype)
+    for block in reader.blocks():
+        scanner.feed(block[:,0])
+    left_idx, right_idx, marker_start, marker_end = scanner.result()
+    result = {'trim': [left_idx, right_idx], 'marker': [marker_start, marker_end]}
     if marker_end / fs > cmd.hb_time: # zero marker has to be in history buffer
-        print('Zero marker not in history buffer')
-        sys.exit(1002)
-    x = normalize(trimmed_wave)
-    low_vol_sine = x[0:marker_start,:]
-    high_vol_sine = x[marker_end:,:]
+        result.update(status=WOV_FAILED, messages=['Zero marker not in history buffer'])
+        return result
     notch_freq = [cmd.freq[0], cmd.freq[0]] if len(cmd.freq) == 1 else cmd.freq
-    low_vol_thdn = calc_thdn(low_vol_sine, fs, notch_freq[0])
-    high_vol_thdn = calc_thdn(high_vol_sine, fs, notch_freq[1])
-    print('THD+N of low volume sine wave: %s dB' % low_vol_thdn)
-    print('THD+N of high volume sine wave: %s dB' % high_vol_thdn)
+    low_vol_meter = ThdnMeter(fs, notch_freq[0], reader.channels)
+    for block in reader.blocks(left_idx, left_idx + marker_start):
+        low_vol_meter.feed(normalize(block))
+    high_vol_meter = ThdnMeter(fs, notch_freq[1], reader.channels)
+    for block in reader.blocks(left_idx + marker_end, right_idx):
+        high_vol_meter.feed(normalize(block))
+    low_vol_thdn = low_vol_meter.thdn()
+    high_vol_thdn = high_vol_meter.thdn()
+    result['thdn'] = {'low_volume': low_vol_thdn.tolist(), 'high_volume': high_vol_thdn.tolist()}
+    result['messages'] = ['THD+N of low volume sine wave: %s dB' % low_vol_thdn,
+                          'THD+N of high volume sine wave: %s dB' % high_vol_thdn]
     thdn_pass = np.all(low_vol_thdn < cmd.threshold) and np.all(high_vol_thdn < cmd.threshold)
     if not thdn_pass:
-        print('THD+N too high, wave analysis result: FAILED')
-        sys.exit(1002)
-    print('wave analysis result: PASSED')
+        result['messages'].append('THD+N too high, wave analysis result: FAILED')
+        result['status'] = WOV_FAILED
+    else:
+        result['messages'].append('wave analysis result: PASSED')
+        result['status'] = 0
+    return result
 
-def calc_thdn(wave, fs, freq):
+class ThdnMeter:
     """
-    This function calculates Total Harmonic Distortion plus Noise (THD+N) of a wave.
-
-    Parameters
-    ----------
-    wave: Wave data from which THD+N will be calculated.
-    fs: Sample rate of wave data
-    freq: Frequency that will be removed before calculating THD+N
-
-    Returns
-    ----------
-    A list of THD+N values for each channel
+    Calculate Total Harmonic Distortion plus Noise (THD+N) of a wave fed block by block,
+    after removing freq with a notch filter. The state of the notch filter is carried
+    from one block to the next.
     """
-    # skip 20ms to avoid the pulse due to filtering
-    time_skip = 0.02
-    samples_skip = int(time_skip * fs)
-    filtered = stdnotch(wave, freq, fs)
-    filtered_cut = filtered[samples_skip:,:]
-    return 10 * np.log10(np.mean(np.power(filtered_cut, 2), axis=0))
+    def __init__(self, fs, freq, channels):
+        self.b, self.a = notch_filter(freq, fs)
+        self.zi = np.zeros((max(len(self.a), len(self.b)) - 1, channels))
+        # skip 20ms to avoid the pulse due to filtering
+        time_skip = 0.02
+        self.samples_skip = int(time_skip * fs)
+        self.power = np.zeros(channels)
+        self.samples = 0
+
+    def feed(self, wave):
+        filtered, self.zi = signal.lfilter(self.b, self.a, wave, axis=0, zi=self.zi)
+        skip = min(self.samples_skip, filtered.shape[0])
+        self.samples_skip -= skip
+        filtered_cut = filtered[skip:,:]
+        self.power += np.sum(np.power(filtered_cut, 2), axis=0)
+        self.samples += filtered_cut.shape[0]
+
+    def thdn(self):
+        """
+        Returns
+        ----------
+        A list of THD+N values for each channel
+        """
+        return 10 * np.log10(self.power / self.samples)
+
+def channel_pair(pair):
+    ref, sep, out = pair.partition(':')
+    if not sep or not ref.isdigit() or not out.isdigit():
+        raise argparse.ArgumentTypeError("invalid channel pair '%s', expect REF:OUT" % pair)
+    return int(ref), int(out)
 
 def parse_cmdline():
     parser = argparse.ArgumentParser(add_help=True, formatter_class=argparse.RawTextHelpFormatter,
@@ -242,12 +677,37 @@ def parse_cmdline():
     help='sample bits of generated wave')
     parser.add_argument('-o', '--output', type=str, help='path to store generated files', default='.')
     # wave comparison arguments
-    parser.add_argument('-a', '--analyze', type=str, choices=['smart_amp', 'wov'], help='analyze recorded wave to give case verdict')
+    parser.add_argument('-a', '--analyze', type=str, choices=['smart_amp', 'wov', 'latency'],
+    help='analyze recorded wave to give case verdict, or measure latency')
     parser.add_argument('-R', '--recorded_wave', type=str, help='path of recorded wave')
+    parser.add_argument('--batch', type=str, nargs='+', metavar='PATTERN',
+    help='analyze all recorded waves matching the glob patterns')
+    parser.add_argument('--manifest', type=str, help='analyze all recorded waves listed in the file, one per line')
+    parser.add_argument('--report', type=str, help='save metrics of all analyzed waves of a batch to the file as JSON')
     parser.add_argument('-Z', '--zero_threshold', type=float, default=-50.3, help='zero threshold in dBFS')
     parser.add_argument('-H', '--hb_time', type=float, default=2.1, help='history buffer size')
     parser.add_argument('-T', '--threshold', type=float, default=-65.0, help='expected threshold')
-    return parser.parse_args()
+    # latency measurement arguments
+    parser.add_argument('--pairs', type=channel_pair, nargs='+', default=[(0, 2), (1, 3)],
+    help='REF:OUT channel pairs to measure latency from REF to OUT,\n'
+    'default is 0:2 1:3, smart amplifier output and feedback')
+    parser.add_argument('--reference', type=str,
+    help='wave with the reference channels, e.g. the played wave of a loopback,\n'
+    'default is the recorded wave, e.g. for echo reference channels')
+    parser.add_argument('--max_delay', type=float, default=100.0, help='longest latency to search, unit: ms')
+    parser.add_argument('--window', type=float, help='seconds of reference to correlate, default is all of it')
+    parser.add_argument('--interpolate', action='store_true', help='measure sub-sample latency')
+    parser.add_argument('-j', '--jobs', type=int, default=0,
+    help='recorded waves of a batch to analyze in parallel, 0 for one per CPU,\n'
+    'or channel pairs to measure in parallel, 0 for all')
+    args = parser.parse_args()
+    if args.analyze is not None:
+        batch = args.batch or args.manifest
+        if batch and args.recorded_wave:
+            parser.error('-R is not allowed with --batch or --manifest')
+        if not batch and not args.recorded_wave:
+            parser.error('-R, --batch or --manifest is required to analyze')
+    return args
 
 def main():
     # Pylint discourage this usage, but we have to update global cmd in main()